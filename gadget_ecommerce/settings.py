@@ -23,6 +23,7 @@ INSTALLED_APPS = [
 
 MIDDLEWARE = [
     'django.middleware.security.SecurityMiddleware',
+    'shop.middleware.SessionWriteMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
     'django.middleware.csrf.CsrfViewMiddleware',
@@ -51,6 +52,24 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'gadget_ecommerce.wsgi.application'
 
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'gadget-shop',
+        'OPTIONS': {'MAX_ENTRIES': 20000},
+    }
+}
+CATALOG_CARD_CACHE_TIMEOUT = 60 * 60 * 24
+
+# Flash messages travel in a signed cookie so showing one never writes the
+# session row. Set MESSAGE_STORAGE to the fallback backend to let messages
+# over the 4 KB cookie limit spill into the session instead.
+MESSAGE_STORAGE = os.environ.get('MESSAGE_STORAGE', 'django.contrib.messages.storage.cookie.CookieStorage')
+
+# 'razorpay', or 'fake' for an in-process gateway used in offline load tests.
+PAYMENT_GATEWAY = os.environ.get('PAYMENT_GATEWAY', 'razorpay')
+PAYMENT_GATEWAY_TIMEOUT = (3.05, 10)  # connect, read (seconds)
+
 DATABASES = {
     'default': {
         'ENGINE': 'django.db.backends.sqlite3',
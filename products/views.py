@@ -1,20 +1,23 @@
-from django.shortcuts import render, get_object_or_404
+from django.http import Http404
+from django.shortcuts import render
 from shop.models import Product
+from shop.pagination import paginate_request
+from shop.caching import get_product_detail, render_product_detail
+from shop.recommendations import cached_recommendations
 
 def product_list(request):
-    products = Product.objects.filter(available=True).order_by('name')
-    return render(request, 'products/product_list.html', {'products': products})
+    products = Product.objects.filter(available=True)
+    page = paginate_request(request, products)
+    return render(request, 'products/product_list.html', {'products': page.object_list, 'page': page})
 
 def product_detail(request, pk):
-    product = get_object_or_404(Product, pk=pk, available=True)
-    return render(request, 'products/product_detail.html', {'product': product})
-
-from django.shortcuts import render, get_object_or_404
-from shop.models import Product
-
-def product_detail(request, pk):
-    product = get_object_or_404(Product, pk=pk)
+    cached = get_product_detail(pk)
+    if cached is None:
+        raise Http404("No Product matches the given query.")
+    product, body = cached
 
     return render(request, "products/product_detail.html", {
         "product": product,
+        "detail_body": render_product_detail(body, request),
+        "recommendations": cached_recommendations(product.pk),
     })
@@ -10,6 +10,7 @@ from django.utils import timezone
 from datetime import datetime, timedelta
 from rangefilter.filters import NumericRangeFilter
 from .models import Category, Product, Order, OrderItem
+from . import images, search
 
 
 # -----------------------------
@@ -23,12 +24,14 @@ class CategoryAdmin(admin.ModelAdmin):
     list_per_page = 25
 
     def product_count(self, obj):
-        count = obj.products.count()
+        # Read the denormalized counters; no per-row COUNT query.
         return format_html(
-            '<span style="background: #e3f2fd; padding: 4px 8px; border-radius: 12px; font-weight: 600; color: #1976d2;">{}</span>',
-            count
+            '<span style="background: #e3f2fd; padding: 4px 8px; border-radius: 12px; font-weight: 600; color: #1976d2;">{} / {}</span>',
+            obj.products_available,
+            obj.products_total
         )
-    product_count.short_description = "Products"
+    product_count.short_description = "Products (available / total)"
+    product_count.admin_order_field = "products_total"
 
 
 # -----------------------------
@@ -96,14 +99,15 @@ class ProductAdmin(admin.ModelAdmin):
     def product_image_preview(self, obj):
         if obj.image:
             return format_html(
-                '<img src="{}" style="width: 60px; height: 60px; object-fit: cover; border-radius: 8px; border: 2px solid #e0e0e0;" />',
-                obj.image.url
+                '<img src="{}" srcset="{}" style="width: 60px; height: 60px; object-fit: cover; border-radius: 8px; border: 2px solid #e0e0e0;" />',
+                images.derivative_url(obj, 60),
+                images.srcset(obj, 60)
             )
         return format_html('<div style="width: 60px; height: 60px; background: #f5f5f5; border-radius: 8px; display: flex; align-items: center; justify-content: center; font-size: 12px; color: #999;">No Image</div>')
     product_image_preview.short_description = "Image"
 
     def discounted_price_display(self, obj):
-        discounted = obj.get_discounted_price()
+        discounted = obj.effective_price
         if discounted < obj.price:
             savings = obj.price - discounted
             return format_html(
@@ -130,6 +134,12 @@ class ProductAdmin(admin.ModelAdmin):
         return format_html('<span style="background: #f44336; color: white; padding: 4px 8px; border-radius: 12px; font-size: 11px; font-weight: 600;">✗ INACTIVE</span>')
     availability_badge.short_description = "Status"
 
+    def get_search_results(self, request, queryset, search_term):
+        # Use the full-text index instead of icontains scans over five columns.
+        if search_term.strip() and search.is_supported():
+            return search.search_products(queryset, search_term), False
+        return super().get_search_results(request, queryset, search_term)
+
 
 # -----------------------------
 # Enhanced Order Item Inline
@@ -143,8 +153,9 @@ class OrderItemInline(admin.TabularInline):
     def product_image(self, obj):
         if obj.product and obj.product.image:
             return format_html(
-                '<img src="{}" style="width: 50px; height: 50px; object-fit: cover; border-radius: 6px; border: 1px solid #ddd;" />',
-                obj.product.image.url
+                '<img src="{}" srcset="{}" style="width: 50px; height: 50px; object-fit: cover; border-radius: 6px; border: 1px solid #ddd;" />',
+                images.derivative_url(obj.product, 60),
+                images.srcset(obj.product, 60)
             )
         return format_html('<div style="width: 50px; height: 50px; background: #f5f5f5; border-radius: 6px; display: flex; align-items: center; justify-content: center; font-size: 10px; color: #999;">No Image</div>')
     product_image.short_description = "Image"
@@ -289,7 +300,9 @@ class OrderAdmin(admin.ModelAdmin):
         payment_status_colors = {
             'Pending': '#ff9800',
             'Paid': '#4caf50',
-            'Failed': '#f44336'
+            'Failed': '#f44336',
+            'Refund Pending': '#9c27b0',
+            'Refunded': '#757575',
         }
         
         status_color = payment_status_colors.get(obj.payment_status, '#666')
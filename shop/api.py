@@ -0,0 +1,172 @@
+"""
+Read-only JSON catalog API.
+
+Rows are read with ``.values()`` (no model instances, no templates) and
+written out one object at a time through a StreamingHttpResponse. Every
+response carries a strong ETag built from the (id, updated) pairs it covers,
+so a client sending ``If-None-Match`` gets a 304 before anything is encoded.
+
+    GET /shop/api/products/?fields=id,name,price&sort=price_asc&category=phones&after=<cursor>
+    GET /shop/api/products/<id>/?fields=id,name,stock
+    GET /shop/api/categories/
+"""
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http import HttpResponseNotModified, JsonResponse, StreamingHttpResponse
+from django.utils.http import parse_etags
+from django.views.decorators.http import require_safe
+
+from .categories import category_nav, get_category
+from .models import Product
+from .pagination import paginate_request, request_sort, sort_field
+
+# Public field name -> ORM column
+PRODUCT_FIELDS = {
+    "id": "id",
+    "name": "name",
+    "slug": "slug",
+    "brand": "brand",
+    "model": "model",
+    "model_number": "model_number",
+    "description": "description",
+    "price": "price",
+    "discount": "discount",
+    "effective_price": "effective_price",
+    "stock": "stock",
+    "available": "available",
+    "category": "category_id",
+    "category_slug": "category__slug",
+    "image": "image",
+    "created": "created",
+    "updated": "updated",
+}
+DEFAULT_PRODUCT_FIELDS = ("id", "name", "slug", "brand", "price", "effective_price", "stock", "category")
+
+_encoder = DjangoJSONEncoder(separators=(",", ":"))
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+def parse_fields(request):
+    """Requested public field names from ?fields=a,b,c"""
+    raw = request.GET.get("fields")
+    if not raw:
+        return list(DEFAULT_PRODUCT_FIELDS)
+    fields = list(dict.fromkeys(f.strip() for f in raw.split(",") if f.strip()))
+    unknown = [f for f in fields if f not in PRODUCT_FIELDS]
+    if unknown or not fields:
+        raise InvalidFields(", ".join(unknown))
+    return fields
+
+
+def _columns(fields, *extra):
+    """ORM columns to select: the requested ones plus whatever the server needs"""
+    columns = [PRODUCT_FIELDS[f] for f in fields]
+    return list(dict.fromkeys([*columns, "id", "updated", *extra]))
+
+
+def _shape(row, fields):
+    obj = {f: row[PRODUCT_FIELDS[f]] for f in fields}
+    if obj.get("image"):
+        obj["image"] = settings.MEDIA_URL + obj["image"]
+    return obj
+
+
+def make_etag(*parts):
+    digest = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        digest.update(str(part).encode())
+        digest.update(b"\x00")
+    return f'"{digest.hexdigest()}"'
+
+
+def _versions(rows):
+    return ",".join(f"{row['id']}:{row['updated'].timestamp()}" for row in rows)
+
+
+def not_modified(request, etag):
+    """A 304 response if the client already holds ``etag``, else None"""
+    client = parse_etags(request.headers.get("If-None-Match", ""))
+    if etag in client or "*" in client:
+        response = HttpResponseNotModified()
+        response["ETag"] = etag
+        return response
+    return None
+
+
+def _finish(response, etag):
+    response["ETag"] = etag
+    response["Cache-Control"] = "public, max-age=0, must-revalidate"
+    return response
+
+
+def _bad_fields(error):
+    return JsonResponse({"error": f"Unknown or empty fields: {error}"}, status=400)
+
+
+# -------------------------
+# Products
+# -------------------------
+@require_safe
+def product_list(request):
+    try:
+        fields = parse_fields(request)
+    except InvalidFields as error:
+        return _bad_fields(error)
+
+    products = Product.objects.filter(available=True)
+    if request.GET.get("category"):
+        category = get_category(request.GET["category"])
+        products = products.filter(category_id=category.id) if category else products.none()
+    if request.GET.get("brand"):
+        products = products.filter(brand=request.GET["brand"])
+
+    sort = request_sort(request)
+    page = paginate_request(request, products.values(*_columns(fields, sort_field(sort))))
+    etag = make_etag("products", fields, page.sort, page.next_cursor, page.prev_cursor, _versions(page))
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+
+    def stream():
+        yield '{"results":['
+        for i, row in enumerate(page):
+            yield ("," if i else "") + _encoder.encode(_shape(row, fields))
+        yield "],"
+        yield _encoder.encode({"next": page.next_url, "previous": page.prev_url})[1:]
+
+    return _finish(StreamingHttpResponse(stream(), content_type="application/json"), etag)
+
+
+@require_safe
+def product_detail(request, id):
+    try:
+        fields = parse_fields(request)
+    except InvalidFields as error:
+        return _bad_fields(error)
+
+    row = Product.objects.filter(pk=id, available=True).values(*_columns(fields)).first()
+    if row is None:
+        return JsonResponse({"error": "Not found"}, status=404)
+    etag = make_etag("product", fields, _versions([row]))
+    return not_modified(request, etag) or _finish(
+        JsonResponse(_shape(row, fields), json_dumps_params={"separators": (",", ":")}), etag
+    )
+
+
+# -------------------------
+# Categories
+# -------------------------
+@require_safe
+def category_list(request):
+    rows = [
+        {"id": c.id, "name": c.name, "slug": c.slug, "products": c.products_available}
+        for c in category_nav()
+    ]
+    etag = make_etag("categories", json.dumps(rows))
+    return not_modified(request, etag) or _finish(JsonResponse({"results": rows}), etag)
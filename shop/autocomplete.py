@@ -0,0 +1,305 @@
+"""
+In-process prefix index for the header search box.
+
+Every product contributes a few lowercase keys (full name, each name word,
+brand, model number) to one sorted list of ``(key, product_id)`` pairs. A
+prefix lookup is a ``bisect`` into that list, and everything needed to render
+a suggestion is kept alongside, so answering a keystroke never touches the
+database.
+
+Suggestions are ranked by units sold (OrderItem quantities). A prefix whose
+range holds up to ``MAX_SCAN`` entries is ranked by scanning it; a wider one
+(a single letter, say) keeps a memoized top ``TOP_K`` that is ranked once
+over the whole range and then kept current as products sell and change, so
+the best sellers show up whatever their position in the alphabet.
+
+The index follows Product saves/deletes and sales in place. Each change is
+also appended to a ``ChangeLog`` in the cache, and other processes replay
+those entries (reloading only the products named) instead of rebuilding;
+only ``invalidate()`` or a gap in the log forces a full rebuild.
+"""
+import heapq
+import re
+import threading
+from bisect import bisect_left, insort
+
+from django.db.models import Sum
+
+from .caching import ChangeLog
+
+changes = ChangeLog("autocomplete")
+MAX_SCAN = 2000
+# The view caps ``limit`` at 20.
+TOP_K = 20
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+_END = chr(0x10FFFF)
+
+
+def normalize(text):
+    return " ".join(_WORD_RE.findall((text or "").lower()))
+
+
+def product_keys(name, brand, model_number):
+    keys = {normalize(name)}
+    keys.update(_WORD_RE.findall((name or "").lower()))
+    if brand:
+        keys.add(normalize(brand))
+    if model_number:
+        keys.add(normalize(model_number))
+    keys.discard("")
+    return keys
+
+
+class PrefixIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.entries = []       # sorted [(key, product_id)]
+        self.products = {}      # product_id -> suggestion payload
+        self.keys = {}          # product_id -> keys it was indexed under
+        self.brands = []        # sorted [(normalized brand, display brand)]
+        self.brand_counts = {}  # display brand -> number of products
+        self.popularity = {}
+        self.top = {}           # wide prefix -> best TOP_K product ids
+        self.generation = None
+
+    def build(self):
+        from .models import OrderItem, Product
+
+        # Read the generation first: anything logged after it is replayed.
+        generation = changes.current()
+        popularity = dict(
+            OrderItem.objects.values("product_id").annotate(units=Sum("quantity")).values_list("product_id", "units")
+        )
+        rows = Product.objects.filter(available=True).values_list(
+            "id", "name", "brand", "model_number", "effective_price"
+        )
+        entries, products, keys, brand_counts = [], {}, {}, {}
+        for pid, name, brand, model_number, price in rows.iterator(chunk_size=5000):
+            products[pid] = self._payload(pid, name, brand, price)
+            keys[pid] = product_keys(name, brand, model_number)
+            entries.extend((key, pid) for key in keys[pid])
+            if brand:
+                brand_counts[brand] = brand_counts.get(brand, 0) + 1
+        entries.sort()
+        with self._lock:
+            self.entries, self.products, self.keys = entries, products, keys
+            self.brand_counts = brand_counts
+            self.brands = sorted((normalize(b), b) for b in brand_counts)
+            self.popularity = popularity
+            self.top = {}
+            self.generation = generation
+
+    @staticmethod
+    def _payload(pid, name, brand, price):
+        from django.urls import reverse
+
+        return {
+            "id": pid,
+            "name": name,
+            "brand": brand or "",
+            "price": str(price),
+            "url": reverse("products:product_detail", args=[pid]),
+        }
+
+    def _rank(self, pid):
+        return (-self.popularity.get(pid, 0), self.products[pid]["name"])
+
+    def _wide_prefixes(self, pid):
+        """Memoized prefixes that cover one of ``pid``'s keys"""
+        return {
+            key[:n] for key in self.keys.get(pid, ()) for n in range(1, len(key) + 1) if key[:n] in self.top
+        }
+
+    # Incremental maintenance ------------------------------------------
+    def _unindex(self, pid):
+        for key in self.keys.pop(pid, ()):
+            i = bisect_left(self.entries, (key, pid))
+            if i < len(self.entries) and self.entries[i] == (key, pid):
+                del self.entries[i]
+        old = self.products.pop(pid, None)
+        if old and old["brand"]:
+            brand = old["brand"]
+            self.brand_counts[brand] -= 1
+            if not self.brand_counts[brand]:
+                del self.brand_counts[brand]
+                i = bisect_left(self.brands, (normalize(brand), brand))
+                if i < len(self.brands) and self.brands[i] == (normalize(brand), brand):
+                    del self.brands[i]
+
+    def _remove(self, pid):
+        # A top list that loses a member has to be re-ranked from its range.
+        for prefix in self._wide_prefixes(pid):
+            if pid in self.top[prefix]:
+                del self.top[prefix]
+        self._unindex(pid)
+
+    def _promote(self, prefix, pid):
+        """Place ``pid`` in a memoized top list if it now ranks there"""
+        top = self.top[prefix]
+        if pid not in top:
+            if len(top) >= TOP_K and self._rank(pid) >= self._rank(top[-1]):
+                return
+            top.append(pid)
+        top.sort(key=self._rank)
+        del top[TOP_K:]
+
+    def _put(self, pid, name, brand, model_number, price):
+        """(Re-)index one product; False when nothing shown in suggestions changed"""
+        payload = self._payload(pid, name, brand, price)
+        keys = product_keys(name, brand, model_number)
+        old = self.products.get(pid)
+        if old == payload and self.keys.get(pid) == keys:
+            return False
+        listed = {prefix for prefix in self._wide_prefixes(pid) if pid in self.top[prefix]}
+        self._unindex(pid)
+        self.products[pid], self.keys[pid] = payload, keys
+        for key in keys:
+            insort(self.entries, (key, pid))
+        if brand:
+            if brand not in self.brand_counts:
+                insort(self.brands, (normalize(brand), brand))
+            self.brand_counts[brand] = self.brand_counts.get(brand, 0) + 1
+        covering = self._wide_prefixes(pid)
+        renamed = old is not None and old["name"] != name
+        for prefix in listed:
+            # Dropped from a range, or possibly ranked lower (ties break on name): re-rank later.
+            if prefix not in covering or renamed:
+                del self.top[prefix]
+        for prefix in covering & self.top.keys():
+            self._promote(prefix, pid)
+        return True
+
+    def _sold(self, pid, quantity):
+        self.popularity[pid] = self.popularity.get(pid, 0) + quantity
+        # Popularity only grows, so the product can only move up a top list.
+        for prefix in self._wide_prefixes(pid):
+            self._promote(prefix, pid)
+
+    def _replay(self, logged):
+        from .models import Product
+
+        reload = {change[1] for change in logged if change[0] == "product"}
+        current = {}
+        if reload:
+            rows = Product.objects.filter(pk__in=reload, available=True).values_list(
+                "id", "name", "brand", "model_number", "effective_price"
+            )
+            current = {row[0]: row for row in rows}
+        for pid in reload - current.keys():
+            self._remove(pid)
+        for row in current.values():
+            self._put(*row)
+        for change in logged:
+            if change[0] == "sold":
+                self._sold(change[1], change[2])
+
+    def _record(self, change):
+        """Log a change already applied here, replaying any we missed from other processes"""
+        new = changes.append(change)
+        missed = changes.since(self.generation, new - 1)
+        if missed is None:
+            self.generation = None
+            return
+        self._replay(missed)
+        self.generation = new
+
+    def update(self, product):
+        with self._lock:
+            if not product.available:
+                changed = product.pk in self.products
+                self._remove(product.pk)
+            else:
+                changed = self._put(
+                    product.pk, product.name, product.brand, product.model_number, product.effective_price
+                )
+            # An index not built here can't tell what changed: log it for the others regardless.
+            if changed or self.generation is None:
+                self._record(("product", product.pk))
+
+    def remove(self, pid):
+        with self._lock:
+            changed = pid in self.products
+            self._remove(pid)
+            if changed or self.generation is None:
+                self._record(("product", pid))
+
+    def sold(self, pid, quantity):
+        with self._lock:
+            self._sold(pid, quantity)
+            self._record(("sold", pid, quantity))
+
+    def sync(self):
+        """Catch up with the change log, rebuilding only when it cannot be replayed"""
+        current = changes.current()
+        if self.generation == current:
+            return
+        with self._lock:
+            logged = changes.since(self.generation, current)
+            if logged is not None:
+                self._replay(logged)
+                self.generation = current
+                return
+        self.build()
+
+    # Lookup ---------------------------------------------------------------
+    def _ranked(self, prefix, limit):
+        lo = bisect_left(self.entries, (prefix,))
+        hi = bisect_left(self.entries, (prefix + _END,), lo)
+        if hi - lo <= MAX_SCAN:
+            return sorted({pid for _, pid in self.entries[lo:hi]}, key=self._rank)[:limit]
+        top = self.top.get(prefix)
+        if top is None:
+            top = heapq.nsmallest(TOP_K, {pid for _, pid in self.entries[lo:hi]}, key=self._rank)
+            self.top[prefix] = top
+        return top[:limit]
+
+    def suggest(self, prefix, limit=8):
+        prefix = normalize(prefix)
+        if not prefix:
+            return {"products": [], "brands": []}
+
+        with self._lock:
+            ranked = self._ranked(prefix, limit)
+            products = [self.products[pid] for pid in ranked]
+
+        brands = []
+        j = bisect_left(self.brands, (prefix,))
+        while j < len(self.brands) and self.brands[j][0].startswith(prefix) and len(brands) < limit:
+            brand = self.brands[j][1]
+            brands.append({"name": brand, "count": self.brand_counts.get(brand, 0)})
+            j += 1
+
+        return {"products": products, "brands": brands}
+
+
+_index = PrefixIndex()
+
+
+def product_saved(product):
+    _index.update(product)
+
+
+def product_deleted(pid):
+    _index.remove(pid)
+
+
+def item_sold(product_id, quantity):
+    _index.sold(product_id, quantity)
+
+
+def invalidate():
+    """Force a rebuild everywhere, e.g. after popularity has been recomputed"""
+    _index.generation = None
+    changes.reset()
+
+
+def get_index():
+    if _index.generation is None:
+        _index.build()
+    else:
+        _index.sync()
+    return _index
+
+
+def suggest(prefix, limit=8):
+    return get_index().suggest(prefix, limit)
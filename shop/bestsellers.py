@@ -0,0 +1,186 @@
+"""
+Bestseller rankings.
+
+``update_bestsellers`` (run it from cron every few minutes) folds OrderItems
+newer than a watermark into per-product daily buckets, then re-ranks the
+last 7/30/90 days from those buckets into the ``Bestseller`` table and
+refreshes ``Product.units_sold`` for the "bestselling" sort. Order history
+is read only once; the storefront reads precomputed ids and never runs an
+aggregate at request time.
+"""
+from collections import defaultdict
+from datetime import timedelta
+from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from .caching import bump
+from .models import Bestseller, OrderItem, Product, ProductSalesDay, Watermark
+
+WATERMARK = "bestsellers"
+WINDOWS = Bestseller.WINDOWS
+SORT_WINDOW = 30
+CATALOG_LIMIT = 100
+CATEGORY_LIMIT = 20
+# Items younger than this (and every item after them) are left for the next
+# run so that an order still committing with a lower id can't slip behind
+# the watermark.
+SETTLE_DELAY = timedelta(seconds=60)
+
+GENERATION_KEY = "bestsellers:generation"
+CACHE_TIMEOUT = 60 * 15
+
+
+# -------------------------
+# Incremental aggregation
+# -------------------------
+def consume_new_items(batch_size=5000, now=None):
+    """Fold unseen OrderItems into ProductSalesDay; returns the number consumed"""
+    now = now or timezone.now()
+    watermark, _ = Watermark.objects.get_or_create(name=WATERMARK)
+    oldest_day = timezone.localdate(now) - timedelta(days=max(WINDOWS) - 1)
+    consumed = 0
+    while True:
+        rows = list(
+            OrderItem.objects.filter(id__gt=watermark.position)
+            .order_by("id")
+            .values_list("id", "product_id", "quantity", "price", "order__created_at")[:batch_size]
+        )
+        # The watermark may only pass a contiguous run of settled items: stop
+        # at the first young one so nothing with a lower id is left behind it.
+        settled = next((i for i, row in enumerate(rows) if row[4] >= now - SETTLE_DELAY), len(rows))
+        rows = rows[:settled]
+        if not rows:
+            return consumed
+
+        buckets = defaultdict(lambda: [0, Decimal("0")])
+        for _, product_id, quantity, price, created_at in rows:
+            day = timezone.localdate(created_at)
+            if day >= oldest_day:
+                bucket = buckets[product_id, day]
+                bucket[0] += quantity
+                bucket[1] += price * quantity
+
+        with transaction.atomic():
+            _apply_buckets(buckets)
+            watermark.position = rows[-1][0]
+            watermark.save(update_fields=["position", "updated"])
+        consumed += len(rows)
+        if settled < batch_size:
+            return consumed
+
+
+def _apply_buckets(buckets):
+    if not buckets:
+        return
+    product_ids = {pid for pid, _ in buckets}
+    days = {day for _, day in buckets}
+    existing = {
+        (row.product_id, row.day): row
+        for row in ProductSalesDay.objects.filter(product_id__in=product_ids, day__in=days)
+    }
+    created, changed = [], []
+    for (product_id, day), (units, revenue) in buckets.items():
+        row = existing.get((product_id, day))
+        if row is None:
+            created.append(ProductSalesDay(product_id=product_id, day=day, units=units, revenue=revenue))
+        else:
+            row.units += units
+            row.revenue += revenue
+            changed.append(row)
+    ProductSalesDay.objects.bulk_create(created)
+    ProductSalesDay.objects.bulk_update(changed, ["units", "revenue"])
+
+
+# -------------------------
+# Rankings
+# -------------------------
+def _window_totals(today, window):
+    start = today - timedelta(days=window - 1)
+    return (
+        ProductSalesDay.objects.filter(day__gte=start, product__available=True)
+        .values_list("product_id", "product__category_id")
+        .annotate(units=Sum("units"), revenue=Sum("revenue"))
+        .order_by("-units", "-revenue", "product_id")
+    )
+
+
+def rebuild_rankings(today=None):
+    """Recompute every window's rankings from the daily buckets"""
+    today = today or timezone.localdate()
+    ProductSalesDay.objects.filter(day__lt=today - timedelta(days=max(WINDOWS) - 1)).delete()
+
+    ranking, sort_units = [], {}
+    for window in WINDOWS:
+        per_category = defaultdict(int)
+        catalog_rank = 0
+        for product_id, category_id, units, revenue in _window_totals(today, window):
+            if window == SORT_WINDOW:
+                sort_units[product_id] = units
+            if catalog_rank < CATALOG_LIMIT:
+                catalog_rank += 1
+                ranking.append(Bestseller(
+                    window=window, product_id=product_id, rank=catalog_rank, units=units, revenue=revenue
+                ))
+            if per_category[category_id] < CATEGORY_LIMIT:
+                per_category[category_id] += 1
+                ranking.append(Bestseller(
+                    window=window, category_id=category_id, product_id=product_id,
+                    rank=per_category[category_id], units=units, revenue=revenue,
+                ))
+
+    with transaction.atomic():
+        Bestseller.objects.all().delete()
+        Bestseller.objects.bulk_create(ranking, batch_size=1000)
+        _refresh_units_sold(sort_units)
+    invalidate()
+    return len(ranking)
+
+
+def _refresh_units_sold(sort_units):
+    """Write Product.units_sold only where it changed"""
+    current = dict(Product.objects.filter(units_sold__gt=0).values_list("id", "units_sold"))
+    changed = [
+        Product(pk=pid, units_sold=sort_units.get(pid, 0))
+        for pid in current.keys() | sort_units.keys()
+        if current.get(pid, 0) != sort_units.get(pid, 0)
+    ]
+    Product.objects.bulk_update(changed, ["units_sold"], batch_size=1000)
+
+
+def update(batch_size=5000):
+    consumed = consume_new_items(batch_size)
+    return consumed, rebuild_rankings()
+
+
+# -------------------------
+# Storefront reads
+# -------------------------
+def invalidate():
+    bump(GENERATION_KEY)
+
+
+def _ranked_ids(window, category_id):
+    generation = cache.get_or_set(GENERATION_KEY, 0, None)
+    key = f"bestsellers:{generation}:{window}:{category_id or 'all'}"
+    ids = cache.get(key)
+    if ids is None:
+        ids = list(
+            Bestseller.objects.filter(window=window, category_id=category_id)
+            .order_by("rank")
+            .values_list("product_id", flat=True)
+        )
+        cache.set(key, ids, CACHE_TIMEOUT)
+    return ids
+
+
+def top_products(window=SORT_WINDOW, category=None, limit=10):
+    """Ranked available products for the catalog or one category"""
+    ids = _ranked_ids(window, category.id if category else None)[: limit * 2]
+    if not ids:
+        return []
+    found = Product.objects.filter(available=True).in_bulk(ids)
+    return [found[pid] for pid in ids if pid in found][:limit]
@@ -0,0 +1,231 @@
+"""
+Quick order and bulk order processing.
+
+Both forms take ``product id, quantity`` lines: quick order as ``id:qty``
+text, bulk order as an uploaded CSV read line by line. Lines are checked
+``CHUNK`` at a time against one ``id__in`` query (existence, availability
+and stock), every line gets a result, and each chunk's accepted quantities
+go to the cart with a single ``set_many``. When a product appears on several
+lines the last one wins, as it always has.
+
+Uploads larger than ``BACKGROUND_BYTES`` become a ``BulkOrderJob``. A
+background thread starts on it once the request commits, and the
+``run_bulk_orders`` command claims any job still PENDING, or RUNNING without
+progress for ``STALE_AFTER`` (its worker died in a restart), so no job is
+stranded. Rerunning a job from the start is safe: cart lines are set, not
+added to. The upload is deleted when the job finishes. The page polls the
+job for progress. Both views require login, so jobs write to the user's
+saved cart.
+"""
+import codecs
+import csv
+import itertools
+import threading
+from dataclasses import dataclass, field, replace
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .cart import UserCart
+from .models import BulkOrderJob, Product
+
+CHUNK = 500
+REPORT_LIMIT = 1000
+BACKGROUND_BYTES = getattr(settings, "BULK_ORDER_BACKGROUND_BYTES", 64 * 1024)
+STALE_AFTER = timedelta(seconds=getattr(settings, "BULK_ORDER_STALE_SECONDS", 5 * 60))
+
+
+@dataclass(frozen=True)
+class LineResult:
+    line: int
+    text: str
+    product_id: int = None
+    quantity: int = 0
+    name: str = ""
+    error: str = ""
+
+    @property
+    def ok(self):
+        return not self.error
+
+
+@dataclass
+class OrderReport:
+    lines: int = 0
+    # Distinct products put in the cart
+    added: int = 0
+    rejected: int = 0
+    # Rejected LineResults, capped at REPORT_LIMIT
+    problems: list = field(default_factory=list)
+
+
+# -------------------------
+# Parsing
+# -------------------------
+def quick_order_rows(text):
+    """(line number, text, fields) for each non-blank ``id:qty`` line"""
+    for number, raw in enumerate(text.splitlines(), start=1):
+        raw = raw.strip()
+        if raw:
+            yield number, raw, raw.split(":")
+
+
+def csv_rows(fh):
+    """(line number, text, fields) for each non-blank row of a binary CSV stream"""
+    reader = csv.reader(codecs.iterdecode(fh, "utf-8-sig"))
+    for row in reader:
+        if not any(cell.strip() for cell in row):
+            continue
+        # An optional header row ("Product ID,Quantity,...")
+        if reader.line_num == 1 and not row[0].strip().isdigit():
+            continue
+        yield reader.line_num, ",".join(row), row
+
+
+def parse_line(number, text, fields):
+    if len(fields) < 2:
+        return LineResult(number, text, error="expected a product id and a quantity")
+    try:
+        product_id, quantity = int(fields[0].strip()), int(fields[1].strip())
+    except ValueError:
+        return LineResult(number, text, error="product id and quantity must be whole numbers")
+    if quantity < 1:
+        return LineResult(number, text, product_id, quantity, error="quantity must be at least 1")
+    return LineResult(number, text, product_id, quantity)
+
+
+# -------------------------
+# Checking
+# -------------------------
+def _check_chunk(chunk):
+    ids = {result.product_id for result in chunk if result.ok}
+    # Units held by checkouts in progress are not for sale.
+    rows = (
+        Product.objects.filter(id__in=ids, available=True).order_by()
+        .values_list("id", "name", F("stock") - F("reserved"))
+    )
+    products = {pid: (name, stock) for pid, name, stock in rows}
+    checked = []
+    for result in chunk:
+        if result.ok:
+            name, stock = products.get(result.product_id, ("", None))
+            if stock is None:
+                result = replace(result, error="no such product, or it is unavailable")
+            elif stock < result.quantity:
+                result = replace(result, name=name, error=f"only {stock} in stock")
+            else:
+                result = replace(result, name=name)
+        checked.append(result)
+    return checked
+
+
+def check_lines(rows, chunk_size=CHUNK):
+    """Yield lists of checked LineResults, one query per ``chunk_size`` lines"""
+    parsed = (parse_line(*row) for row in rows)
+    while chunk := list(itertools.islice(parsed, chunk_size)):
+        yield _check_chunk(chunk)
+
+
+def add_to_cart(chunks, cart, progress=None):
+    """Put every accepted line into ``cart``; ``progress(report)`` runs after each chunk"""
+    report = OrderReport()
+    products = set()
+    for chunk in chunks:
+        accepted = {}
+        for result in chunk:
+            if result.ok:
+                accepted[result.product_id] = result.quantity
+            else:
+                report.rejected += 1
+                if len(report.problems) < REPORT_LIMIT:
+                    report.problems.append(result)
+        if accepted:
+            cart.set_many(accepted)
+            # A product on several lines is one cart line (the last one wins).
+            products.update(accepted)
+            report.added = len(products)
+        report.lines += len(chunk)
+        if progress:
+            progress(report)
+    return report
+
+
+# -------------------------
+# Background jobs
+# -------------------------
+def start_job(user, upload):
+    """Store the upload and process it in a background thread after commit"""
+    job = BulkOrderJob.objects.create(user=user, upload=upload)
+    transaction.on_commit(lambda: threading.Thread(target=_run_in_thread, args=(job.pk,), daemon=True).start())
+    return job
+
+
+def _run_in_thread(job_id):
+    try:
+        run_job(job_id)
+    finally:
+        connection.close()
+
+
+def _claim(job_id, now):
+    """Take a pending or stalled job; False if another worker has it"""
+    claimable = Q(status="PENDING") | Q(status="RUNNING", updated__lt=now - STALE_AFTER)
+    return bool(
+        BulkOrderJob.objects.filter(claimable, pk=job_id).update(
+            status="RUNNING", updated=now, processed_lines=0, added=0, rejected=0
+        )
+    )
+
+
+def _finish(job, **fields):
+    job.upload.delete(save=False)
+    now = timezone.now()
+    BulkOrderJob.objects.filter(pk=job.pk).update(upload="", updated=now, finished=now, **fields)
+
+
+def run_job(job_id):
+    """Process one job if it can be claimed; returns whether it ran"""
+    if not _claim(job_id, timezone.now()):
+        return False
+    job = BulkOrderJob.objects.select_related("user").get(pk=job_id)
+
+    def progress(report):
+        BulkOrderJob.objects.filter(pk=job.pk).update(
+            processed_lines=report.lines, added=report.added, rejected=report.rejected, updated=timezone.now()
+        )
+
+    try:
+        with job.upload.open("rb") as fh:
+            total = sum(chunk.count(b"\n") for chunk in fh.chunks())
+        BulkOrderJob.objects.filter(pk=job.pk).update(total_lines=total, updated=timezone.now())
+        with job.upload.open("rb") as fh:
+            report = add_to_cart(check_lines(csv_rows(fh)), UserCart(job.user), progress)
+    except Exception as exc:
+        _finish(job, status="FAILED", error=str(exc))
+        raise
+    _finish(
+        job,
+        status="DONE",
+        total_lines=report.lines,
+        processed_lines=report.lines,
+        added=report.added,
+        rejected=report.rejected,
+        report=[[r.line, r.text, r.error] for r in report.problems],
+    )
+    return True
+
+
+def run_due(now=None):
+    """Run every pending or stalled job in turn; returns (done, failed)"""
+    now = now or timezone.now()
+    due = BulkOrderJob.objects.filter(Q(status="PENDING") | Q(status="RUNNING", updated__lt=now - STALE_AFTER))
+    done = failed = 0
+    for job_id in due.order_by("created").values_list("pk", flat=True):
+        try:
+            done += run_job(job_id)
+        except Exception:
+            failed += 1
+    return done, failed
@@ -0,0 +1,236 @@
+"""
+Caching helpers for rendered catalog fragments and product detail pages.
+
+Catalog card keys embed ``product.updated`` so any save produces a new key and
+the old entry simply ages out. Product detail entries carry a version number
+that the Product signals bump, and are served through a single-flight,
+stale-while-revalidate read path so a hot SKU is recomputed by one request at
+a time.
+"""
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.middleware.csrf import get_token
+from django.template.loader import render_to_string
+from django.utils.html import format_html
+from django.utils.safestring import mark_safe
+
+CARD_TEMPLATE = "products/_product_card.html"
+CARD_TIMEOUT = getattr(settings, "CATALOG_CARD_CACHE_TIMEOUT", 60 * 60 * 24)
+CSRF_MARKER = "<!--csrf-token-->"
+
+DETAIL_TEMPLATE = "products/_product_detail_body.html"
+DETAIL_TTL = getattr(settings, "PRODUCT_DETAIL_CACHE_TTL", 300)
+DETAIL_STALE_TTL = getattr(settings, "PRODUCT_DETAIL_STALE_TTL", 60 * 60)
+LOCK_TIMEOUT = 10
+
+
+# -------------------------
+# Hit / miss counters
+# -------------------------
+class CacheStats:
+    """Per-process hit/miss counters for one cache"""
+
+    registry = {}
+
+    def __init__(self, name):
+        self.name = name
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        CacheStats.registry[name] = self
+
+    def record(self, hits=0, misses=0):
+        with self._lock:
+            self.hits += hits
+            self.misses += misses
+
+    def as_dict(self):
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_ratio": round(self.hits / total, 4) if total else None,
+        }
+
+    @classmethod
+    def snapshot(cls):
+        return {name: stats.as_dict() for name, stats in cls.registry.items()}
+
+
+card_stats = CacheStats("catalog_cards")
+detail_stats = CacheStats("product_detail")
+
+
+def bump(key):
+    """Atomically increment a counter key that never expires, creating it if needed"""
+    try:
+        return cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+        return 1
+
+
+class ChangeLog:
+    """
+    A generation counter plus the change recorded at each generation.
+
+    In-process indexes (autocomplete, facets) append a small change for every
+    edit and catch up on other processes' edits by replaying the entries
+    after their own generation, instead of rebuilding from the database.
+    ``since`` returns None when replay is impossible (an entry expired or was
+    never written, or the gap is too long); the caller rebuilds then.
+    ``reset`` bumps the counter without an entry, which forces that rebuild
+    everywhere.
+    """
+
+    def __init__(self, name, max_replay=1000, timeout=60 * 60):
+        self.name = name
+        self.key = f"{name}:generation"
+        self.max_replay = max_replay
+        self.timeout = timeout
+
+    def current(self):
+        return cache.get_or_set(self.key, 0, None)
+
+    def append(self, change):
+        generation = bump(self.key)
+        cache.set(f"{self.name}:change:{generation}", change, self.timeout)
+        return generation
+
+    def reset(self):
+        return bump(self.key)
+
+    def since(self, generation, until):
+        """The changes after ``generation`` up to ``until``, oldest first, or None"""
+        if generation is None or not 0 <= until - generation <= self.max_replay:
+            return None
+        keys = [f"{self.name}:change:{g}" for g in range(generation + 1, until + 1)]
+        found = cache.get_many(keys)
+        if len(found) != len(keys):
+            return None
+        return [found[key] for key in keys]
+
+
+def csrf_input(request):
+    return format_html('<input type="hidden" name="csrfmiddlewaretoken" value="{}">', get_token(request))
+
+
+# -------------------------
+# Single-flight read-through
+# -------------------------
+def get_or_recompute(key, compute, version=0, ttl=DETAIL_TTL, stale_ttl=DETAIL_STALE_TTL, stats=None):
+    """
+    Read-through cache with stampede protection.
+
+    Entries are stored as ``(version, fresh_until, value)`` and kept for
+    ``ttl + stale_ttl`` seconds. A fresh entry with the current version is a
+    hit. Otherwise exactly one caller wins the ``cache.add`` lock and
+    recomputes, while the others keep serving the stale value (if there is
+    one) or wait briefly for the winner before computing themselves.
+    """
+    entry = cache.get(key)
+    if entry is not None and entry[0] == version and entry[1] > time.time():
+        if stats:
+            stats.record(hits=1)
+        return entry[2]
+
+    lock_key = f"{key}:lock"
+    if cache.add(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            value = compute()
+            cache.set(key, (version, time.time() + ttl, value), ttl + stale_ttl)
+        finally:
+            cache.delete(lock_key)
+        if stats:
+            stats.record(misses=1)
+        return value
+
+    if entry is not None:
+        # Someone else is revalidating: serve the stale copy meanwhile.
+        if stats:
+            stats.record(hits=1)
+        return entry[2]
+
+    deadline = time.time() + 1
+    while time.time() < deadline:
+        time.sleep(0.02)
+        entry = cache.get(key)
+        if entry is not None and entry[0] == version:
+            if stats:
+                stats.record(hits=1)
+            return entry[2]
+    if stats:
+        stats.record(misses=1)
+    return compute()
+
+
+# -------------------------
+# Catalog cards
+# -------------------------
+def card_cache_key(product):
+    return f"card:{product.pk}:{int(product.updated.timestamp() * 1_000_000)}"
+
+
+def render_product_cards(products, request):
+    """
+    Render catalog cards, reusing cached HTML for unchanged products.
+
+    One ``get_many`` fetches every card on the page and one ``set_many``
+    stores the misses. The cached HTML carries a CSRF placeholder that is
+    replaced with this request's token on the way out.
+    """
+    products = list(products)
+    keys = [card_cache_key(p) for p in products]
+    cached = cache.get_many(keys)
+
+    rendered, missing = [], {}
+    for key, product in zip(keys, products):
+        html = cached.get(key)
+        if html is None:
+            html = render_to_string(CARD_TEMPLATE, {"product": product, "csrf_input": mark_safe(CSRF_MARKER)})
+            missing[key] = html
+        rendered.append(html)
+    if missing:
+        cache.set_many(missing, CARD_TIMEOUT)
+    card_stats.record(hits=len(products) - len(missing), misses=len(missing))
+    return mark_safe("".join(rendered).replace(CSRF_MARKER, csrf_input(request)))
+
+
+# -------------------------
+# Product detail
+# -------------------------
+def _detail_version_key(pk):
+    return f"product-detail:{pk}:version"
+
+
+def invalidate_product_detail(*pks):
+    """Bump the version of one or more products so their detail entries go stale"""
+    for pk in pks:
+        bump(_detail_version_key(pk))
+
+
+def get_product_detail(pk):
+    """
+    Return ``(product, body_html)`` for a product, or None if it doesn't exist.
+
+    The body is rendered with a CSRF placeholder; use ``render_product_detail``
+    to get request-ready HTML.
+    """
+    from .models import Product
+
+    def compute():
+        product = Product.objects.select_related("category").filter(pk=pk).first()
+        if product is None:
+            return None
+        body = render_to_string(DETAIL_TEMPLATE, {"product": product, "csrf_input": mark_safe(CSRF_MARKER)})
+        return product, body
+
+    version = cache.get(_detail_version_key(pk), 0)
+    return get_or_recompute(f"product-detail:{pk}", compute, version=version, stats=detail_stats)
+
+
+def render_product_detail(body, request):
+    return mark_safe(body.replace(CSRF_MARKER, csrf_input(request)))
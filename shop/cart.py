@@ -1,58 +1,130 @@
-from decimal import Decimal
+"""
+Cart storage.
+
+Anonymous shoppers keep their cart in ``request.session["cart"]``; logged-in
+users get one ``CartItem`` row per product, so a cart change is a single-row
+upsert or delete instead of a rewrite of the whole session, and the cart
+follows the user across devices. ``get_cart(request)`` picks the right
+backend; both expose the same ``{product_id: {"quantity": n}}`` view that
+``shop.pricing.price_cart`` consumes. At login the session cart is merged
+into the saved one (see ``shop.signals``).
+"""
 from django.conf import settings
-from .models import Product
+from django.db.models import Sum
+from django.utils import timezone
+
+from . import counters
+from .models import CartItem, Product
 
 CART_SESSION_ID = getattr(settings, 'CART_SESSION_ID', 'cart')
 
-class Cart:
+
+class SessionCart:
     def __init__(self, request):
         self.session = request.session
-        cart = self.session.get(CART_SESSION_ID)
-        if not cart:
-            cart = self.session[CART_SESSION_ID] = {}
-        self.cart = cart
-
-    def add(self, product, quantity=1, override_quantity=False):
-        product_id = str(product.id)
-        if product_id not in self.cart:
-            self.cart[product_id] = {'quantity': 0, 'price': str(product.price)}
-        
-        if override_quantity:
-            self.cart[product_id]['quantity'] = quantity
-        else:
-            self.cart[product_id]['quantity'] += quantity
-
-        self.save()
-
-    def save(self):
-        self.session.modified = True
-
-    def remove(self, product):
-        product_id = str(product.id)
-        if product_id in self.cart:
-            del self.cart[product_id]
-            self.save()
-
-    def __iter__(self):
-        product_ids = self.cart.keys()
-        products = Product.objects.filter(id__in=product_ids)
-
-        for product in products:
-            pid = str(product.id)
-            if pid in self.cart:
-                self.cart[pid]['product'] = product
-
-        for item in self.cart.values():
-            item['price'] = Decimal(item['price'])
-            item['total_price'] = item['price'] * item['quantity']
-            yield item
-
-    def __len__(self):
-        return sum(item['quantity'] for item in self.cart.values())
-
-    def get_total_price(self):
-        return sum(Decimal(item['price']) * item['quantity'] for item in self.cart.values())
+
+    def lines(self):
+        return self.session.get(CART_SESSION_ID, {})
+
+    def quantity(self, product_id):
+        item = self.lines().get(str(product_id))
+        return int(item.get("quantity", 0)) if isinstance(item, dict) else 0
+
+    def count(self):
+        return sum(int(item.get("quantity", 0)) for item in self.lines().values() if isinstance(item, dict))
+
+    def set_many(self, quantities):
+        cart = self.lines()
+        changed = {str(pid): {"quantity": q} for pid, q in quantities.items() if self.quantity(pid) != q}
+        if not changed:
+            return
+        cart.update(changed)
+        self.session[CART_SESSION_ID] = cart
+        counters.invalidate_session(self.session)
+
+    def set(self, product_id, quantity):
+        self.set_many({product_id: quantity})
+
+    def remove(self, *product_ids):
+        cart = self.lines()
+        keys = [str(pid) for pid in product_ids if str(pid) in cart]
+        for key in keys:
+            del cart[key]
+        if keys:
+            self.session[CART_SESSION_ID] = cart
+            counters.invalidate_session(self.session)
+        return bool(keys)
 
     def clear(self):
-        self.session[CART_SESSION_ID] = {}
-        self.save()
+        if self.lines():
+            self.session[CART_SESSION_ID] = {}
+            counters.invalidate_session(self.session)
+
+
+class UserCart:
+    def __init__(self, user):
+        self.user = user
+        self.items = CartItem.objects.filter(user=user)
+
+    def lines(self):
+        return {str(pid): {"quantity": qty} for pid, qty in self.items.values_list("product_id", "quantity")}
+
+    def quantity(self, product_id):
+        return self.items.filter(product_id=product_id).values_list("quantity", flat=True).first() or 0
+
+    def count(self):
+        return self.items.aggregate(n=Sum("quantity"))["n"] or 0
+
+    def set_many(self, quantities):
+        """Upsert every (product_id, quantity) in one statement"""
+        now = timezone.now()
+        CartItem.objects.bulk_create(
+            [
+                CartItem(user=self.user, product_id=int(pid), quantity=quantity, updated=now)
+                for pid, quantity in quantities.items()
+            ],
+            update_conflicts=True,
+            unique_fields=["user", "product"],
+            update_fields=["quantity", "updated"],
+        )
+        counters.invalidate_user(self.user.pk)
+
+    def set(self, product_id, quantity):
+        self.set_many({product_id: quantity})
+
+    def remove(self, *product_ids):
+        deleted, _ = self.items.filter(product_id__in=[int(pid) for pid in product_ids if str(pid).isdigit()]).delete()
+        if deleted:
+            counters.invalidate_user(self.user.pk)
+        return bool(deleted)
+
+    def clear(self):
+        if self.items.delete()[0]:
+            counters.invalidate_user(self.user.pk)
+
+
+def get_cart(request):
+    if request.user.is_authenticated:
+        return UserCart(request.user)
+    return SessionCart(request)
+
+
+def merge_session_cart(request, user):
+    """Fold the anonymous session cart into the user's saved cart at login"""
+    session_lines = SessionCart(request).lines()
+    if not session_lines:
+        return
+    wanted = {}
+    for key, item in session_lines.items():
+        if str(key).isdigit() and isinstance(item, dict):
+            try:
+                wanted[int(key)] = int(item.get("quantity", 0))
+            except (TypeError, ValueError):
+                continue
+    live = set(Product.objects.filter(id__in=wanted, available=True).values_list("id", flat=True))
+    cart = UserCart(user)
+    saved = dict(cart.items.filter(product_id__in=live).values_list("product_id", "quantity"))
+    merged = {pid: saved.get(pid, 0) + qty for pid, qty in wanted.items() if pid in live and qty > 0}
+    if merged:
+        cart.set_many(merged)
+    del request.session[CART_SESSION_ID]
@@ -0,0 +1,207 @@
+"""
+Streaming catalog import for vendor feeds.
+
+Rows are read lazily from CSV or JSON Lines and written in fixed-size
+batches, so memory stays flat regardless of file size. Categories (a small
+table) are resolved from an in-memory slug map and upserted with
+``bulk_create(update_conflicts=True)``. Products are matched on slug with
+one query per batch and written with a single INSERT ... ON CONFLICT (id)
+DO UPDATE, which avoids the per-row CASE expressions of ``bulk_update``.
+
+Bulk writes skip model signals, so ``finish()`` rebuilds the derived
+structures (search index, category counts, in-memory indexes) once at the end.
+"""
+import csv
+import json
+from dataclasses import dataclass, field
+from decimal import Decimal, InvalidOperation
+
+from django.utils import timezone
+from django.utils.text import slugify
+
+from . import autocomplete, categories, facets, search
+from .caching import invalidate_product_detail
+from .models import Category, Product
+
+UPDATE_FIELDS = [
+    "category", "name", "description", "price", "discount", "stock", "available",
+    "brand", "model", "model_number", "updated",
+]
+_TRUE = {"1", "true", "yes", "y", "on"}
+
+
+class RowError(ValueError):
+    pass
+
+
+def read_rows(fh, fmt):
+    """Yield one dict per record of a CSV or JSONL stream"""
+    if fmt == "csv":
+        yield from csv.DictReader(fh)
+        return
+    for line in fh:
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            row = json.loads(line)
+        except json.JSONDecodeError as exc:
+            row = {"__error__": f"invalid JSON: {exc.msg}"}
+        yield row if isinstance(row, dict) else {"__error__": "expected a JSON object"}
+
+
+def _decimal(row, name, default=None):
+    value = row.get(name)
+    if value in (None, ""):
+        if default is None:
+            raise RowError(f"{name} is required")
+        return default
+    try:
+        value = Decimal(str(value))
+    except InvalidOperation:
+        raise RowError(f"{name} is not a number: {value!r}")
+    if value < 0:
+        raise RowError(f"{name} is negative")
+    return value
+
+
+def _text(row, name, limit=None):
+    value = str(row.get(name) or "").strip()
+    if limit and len(value) > limit:
+        raise RowError(f"{name} is longer than {limit} characters")
+    return value
+
+
+def parse_row(row):
+    """Validate one raw record into Product field values (category by name)"""
+    if "__error__" in row:
+        raise RowError(row["__error__"])
+    name = _text(row, "name", 200)
+    category = _text(row, "category", 200)
+    if not name:
+        raise RowError("name is required")
+    if not category:
+        raise RowError("category is required")
+    discount = _decimal(row, "discount", Decimal("0"))
+    if discount > 100:
+        raise RowError("discount is over 100%")
+    try:
+        stock = int(row.get("stock") or 0)
+    except (TypeError, ValueError):
+        raise RowError(f"stock is not an integer: {row.get('stock')!r}")
+    if stock < 0:
+        raise RowError("stock is negative")
+    available = row.get("available")
+    return {
+        "slug": slugify(row.get("slug") or name)[:200] or None,
+        "name": name,
+        "category": category,
+        "price": _decimal(row, "price"),
+        "discount": discount,
+        "stock": stock,
+        "available": True if available in (None, "") else str(available).strip().lower() in _TRUE,
+        "description": _text(row, "description"),
+        "brand": _text(row, "brand", 100) or None,
+        "model": _text(row, "model", 100),
+        "model_number": _text(row, "model_number", 100) or None,
+    }
+
+
+@dataclass
+class ImportStats:
+    read: int = 0
+    created: int = 0
+    updated: int = 0
+    rejected: int = 0
+    rejects: list = field(default_factory=list)
+
+
+class CatalogImporter:
+    def __init__(self, batch_size=2000, reject_writer=None, dry_run=False):
+        self.batch_size = batch_size
+        self.reject_writer = reject_writer
+        self.dry_run = dry_run
+        self.stats = ImportStats()
+        self.category_ids = dict(Category.objects.values_list("slug", "id"))
+        self._pending = {}
+
+    def reject(self, row_number, reason):
+        self.stats.rejected += 1
+        if self.reject_writer is not None:
+            self.reject_writer.writerow([row_number, reason])
+        elif len(self.stats.rejects) < 100:
+            self.stats.rejects.append((row_number, reason))
+
+    def feed(self, rows, progress=None):
+        """Import an iterable of raw rows; ``progress(stats)`` runs after each batch"""
+        for row_number, row in enumerate(rows, start=1):
+            self.stats.read += 1
+            try:
+                values = parse_row(row)
+            except RowError as exc:
+                self.reject(row_number, str(exc))
+                continue
+            if not values["slug"]:
+                self.reject(row_number, "name does not produce a usable slug")
+                continue
+            if not slugify(values["category"]):
+                # An empty category slug would break every category link.
+                self.reject(row_number, "category does not produce a usable slug")
+                continue
+            # A slug repeated inside one batch: the later row wins.
+            self._pending[values["slug"]] = values
+            if len(self._pending) >= self.batch_size:
+                self.flush()
+                if progress:
+                    progress(self.stats)
+        self.flush()
+
+    def _resolve_categories(self, batch):
+        missing = {}
+        for values in batch:
+            slug = slugify(values["category"])[:200]
+            if slug not in self.category_ids:
+                missing[slug] = values["category"]
+        if missing and not self.dry_run:
+            Category.objects.bulk_create(
+                [Category(slug=slug, name=name) for slug, name in missing.items()],
+                update_conflicts=True, unique_fields=["slug"], update_fields=["name"],
+            )
+            self.category_ids.update(
+                Category.objects.filter(slug__in=missing).values_list("slug", "id")
+            )
+        for values in batch:
+            values["category_id"] = self.category_ids.get(slugify(values.pop("category"))[:200])
+
+    def flush(self):
+        batch, self._pending = list(self._pending.values()), {}
+        if not batch:
+            return
+        self._resolve_categories(batch)
+        existing = dict(
+            Product.objects.filter(slug__in=[v["slug"] for v in batch])
+            .order_by("-id")
+            .values_list("slug", "id")
+        )
+        now = timezone.now()
+        created, changed = [], []
+        for values in batch:
+            product = Product(pk=existing.get(values["slug"]), updated=now, **values)
+            (changed if product.pk else created).append(product)
+        self.stats.created += len(created)
+        self.stats.updated += len(changed)
+        if self.dry_run:
+            return
+        Product.objects.bulk_create(
+            created + changed, update_conflicts=True, unique_fields=["id"], update_fields=UPDATE_FIELDS
+        )
+        invalidate_product_detail(*[p.pk for p in changed])
+
+    def finish(self):
+        """Rebuild everything the skipped post_save signals would have maintained"""
+        if self.dry_run or not (self.stats.created or self.stats.updated):
+            return
+        search.rebuild_index()
+        categories.rebuild_counts()
+        facets.invalidate()
+        autocomplete.invalidate()
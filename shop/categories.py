@@ -0,0 +1,87 @@
+"""
+Category summary service.
+
+Category.products_total / products_available are maintained with atomic
+F() increments from the Product signals, so neither the storefront nor the
+admin ever counts products per category at request time. The navigation list
+itself is cached and dropped whenever a count or a category changes.
+"""
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Count, F, Q
+
+from .models import Category, Product
+
+NAV_CACHE_KEY = "category-nav"
+NAV_TIMEOUT = 60 * 60
+
+
+def category_nav():
+    """All categories with their counts, served from the cache"""
+    categories = cache.get(NAV_CACHE_KEY)
+    if categories is None:
+        categories = list(Category.objects.all())
+        cache.set(NAV_CACHE_KEY, categories, NAV_TIMEOUT)
+    return categories
+
+
+def get_category(slug):
+    for category in category_nav():
+        if category.slug == slug:
+            return category
+    return None
+
+
+def invalidate_nav():
+    cache.delete(NAV_CACHE_KEY)
+
+
+def _apply(category_id, total=0, available=0):
+    if category_id is None or not (total or available):
+        return
+    Category.objects.filter(pk=category_id).update(
+        products_total=F("products_total") + total,
+        products_available=F("products_available") + available,
+    )
+
+
+def loaded_state(product):
+    """(category_id, available) as last read from / written to the database"""
+    state = getattr(product, "_loaded_state", (None, None))
+    if product.pk and None in state:
+        row = Product.objects.filter(pk=product.pk).values_list("category_id", "available").first()
+        state = row or (None, None)
+    return state
+
+
+def product_saved(product, created, previous):
+    """Apply the count delta of a product insert/update"""
+    if created:
+        _apply(product.category_id, total=1, available=int(product.available))
+    else:
+        old_category, old_available = previous
+        if old_category == product.category_id:
+            _apply(product.category_id, available=int(product.available) - int(bool(old_available)))
+        else:
+            _apply(old_category, total=-1, available=-int(bool(old_available)))
+            _apply(product.category_id, total=1, available=int(product.available))
+    product._loaded_state = (product.category_id, product.available)
+    transaction.on_commit(invalidate_nav)
+
+
+def product_deleted(product):
+    category_id, available = loaded_state(product)
+    _apply(category_id, total=-1, available=-int(bool(available)))
+    transaction.on_commit(invalidate_nav)
+
+
+def rebuild_counts():
+    """Recompute every category's counts from scratch"""
+    rows = Category.objects.annotate(
+        total=Count("products"),
+        live=Count("products", filter=Q(products__available=True)),
+    ).values_list("id", "total", "live")
+    categories = [Category(id=pk, products_total=total, products_available=live) for pk, total, live in rows]
+    Category.objects.bulk_update(categories, ["products_total", "products_available"], batch_size=500)
+    invalidate_nav()
+    return len(categories)
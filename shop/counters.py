@@ -0,0 +1,72 @@
+"""
+Header counters (cart, wishlist, compare) served from the cache.
+
+The counts for a session are stored under its session key, so the common
+request is answered from the cache without loading the session or the user.
+A guest entry is dropped whenever the session's cart, wishlist or compare
+list changes. Logged-in carts live in ``CartItem`` rows and may change from
+another device, so those entries also record the user's counter generation,
+which every ``UserCart`` write bumps.
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+
+from .caching import bump
+
+COUNTERS_TIMEOUT = getattr(settings, "HEADER_COUNTERS_TIMEOUT", 60 * 10)
+
+
+def _session_key(session_key):
+    return f"counters:session:{session_key}"
+
+
+def _user_key(user_id):
+    return f"counters:user:{user_id}"
+
+
+def invalidate_session(session):
+    if session.session_key:
+        cache.delete(_session_key(session.session_key))
+
+
+def invalidate_user(user_id):
+    bump(_user_key(user_id))
+
+
+def compute(request):
+    """Count everything from the session and database"""
+    from .cart import get_cart
+
+    return {
+        "cart": get_cart(request).count(),
+        "wishlist": len(request.session.get("wishlist", [])),
+        "compare": len(request.session.get("compare", [])),
+    }
+
+
+def _fill(request):
+    session_key = request.session.session_key
+    user_id = request.user.pk if request.user.is_authenticated else None
+    # Read the generation first: a write racing with compute() bumps it past this entry.
+    generation = cache.get_or_set(_user_key(user_id), 0, None) if user_id else 0
+    counts = compute(request)
+    if session_key:
+        cache.set(
+            _session_key(session_key),
+            {"user": user_id, "generation": generation, "counts": counts},
+            COUNTERS_TIMEOUT,
+        )
+    return counts
+
+
+async def aget_counts(request):
+    """The session's counters, from the cache when the entry is still current"""
+    session_key = request.session.session_key
+    if session_key:
+        entry = await cache.aget(_session_key(session_key))
+        if entry is not None and (
+            entry["user"] is None or await cache.aget(_user_key(entry["user"])) == entry["generation"]
+        ):
+            return entry["counts"]
+    return await sync_to_async(_fill)(request)
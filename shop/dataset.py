@@ -0,0 +1,240 @@
+"""
+Deterministic synthetic data for load and capacity testing.
+
+Everything is drawn from one ``random.Random(seed)``, so the same options
+produce the same users, catalog and order history (timestamps are relative
+to midnight of the day the generator runs). Rows are written with
+``bulk_create`` in batches; nothing is saved one object at a time.
+
+Distributions are skewed the way real shops are: category sizes, product
+popularity and customer order frequency follow a Zipf-like curve, prices are
+log-normal and most orders hold one or two lines.
+"""
+import bisect
+import itertools
+import math
+import random
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import timedelta
+from decimal import Decimal
+
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+from django.utils import timezone
+
+from . import autocomplete, categories, facets, search
+from .models import Category, Order, OrderItem, Product
+
+CITIES = [
+    ("Mumbai", "Maharashtra", "400001"), ("Delhi", "Delhi", "110001"),
+    ("Bengaluru", "Karnataka", "560001"), ("Hyderabad", "Telangana", "500001"),
+    ("Chennai", "Tamil Nadu", "600001"), ("Kolkata", "West Bengal", "700001"),
+    ("Pune", "Maharashtra", "411001"), ("Ahmedabad", "Gujarat", "380001"),
+    ("Jaipur", "Rajasthan", "302001"), ("Lucknow", "Uttar Pradesh", "226001"),
+]
+BRANDS = [
+    "Samsung", "Apple", "OnePlus", "Xiaomi", "Realme", "Sony", "boAt", "JBL",
+    "Lenovo", "HP", "Dell", "Asus", "Noise", "Oppo", "Vivo", "Anker", "Logitech",
+]
+NOUNS = [
+    "Phone", "Earbuds", "Headphones", "Smartwatch", "Laptop", "Tablet", "Charger",
+    "Power Bank", "Speaker", "Cable", "Keyboard", "Mouse", "Monitor", "Camera",
+]
+ADJECTIVES = ["Pro", "Max", "Lite", "Plus", "Ultra", "Neo", "Air", "Mini", "Prime", "Edge"]
+DISCOUNTS = [0] * 14 + [5, 10, 10, 15, 20, 25, 30, 40, 50]
+# Share of orders in each status by age: recent orders are still in flight.
+RECENT_STATUSES = (["PLACED", "PACKED", "SHIPPED", "OUT_FOR_DELIVERY"], [4, 3, 3, 1])
+SETTLED_STATUSES = (["DELIVERED", "CANCELLED", "RETURNED", "PAYMENT_FAILED"], [88, 6, 4, 2])
+
+
+@dataclass
+class DatasetSpec:
+    users: int = 1000
+    categories: int = 20
+    products: int = 5000
+    orders: int = 10000
+    max_items: int = 6
+    days: int = 365
+    seed: int = 42
+    batch_size: int = 5000
+
+
+def zipf_cumulative(n, s=1.1):
+    """Cumulative weights for ``random.choices`` where rank 1 is most likely"""
+    return list(itertools.accumulate(1 / (rank ** s) for rank in range(1, n + 1)))
+
+
+def _batched(iterable, size):
+    iterator = iter(iterable)
+    while batch := list(itertools.islice(iterator, size)):
+        yield batch
+
+
+@contextmanager
+def manual_timestamps(model, *names):
+    """Let generated rows keep their own auto_now/auto_now_add values"""
+    fields = [model._meta.get_field(name) for name in names]
+    saved = [(f.auto_now, f.auto_now_add) for f in fields]
+    for f in fields:
+        f.auto_now = f.auto_now_add = False
+    try:
+        yield
+    finally:
+        for f, (auto_now, auto_now_add) in zip(fields, saved):
+            f.auto_now, f.auto_now_add = auto_now, auto_now_add
+
+
+class DatasetGenerator:
+    def __init__(self, spec, log=None):
+        self.spec = spec
+        self.rng = random.Random(spec.seed)
+        self.log = log or (lambda message: None)
+        self.prefix = f"load{spec.seed}"
+        self.anchor = timezone.now().replace(hour=0, minute=0, second=0, microsecond=0)
+
+    def _pick(self, population, cum_weights):
+        # random.choices(k=1) with a precomputed cum_weights list, minus the list allocation
+        x = self.rng.random() * cum_weights[-1]
+        return population[bisect.bisect(cum_weights, x, 0, len(population) - 1)]
+
+    # Users ------------------------------------------------------------
+    def users(self):
+        from users.models import Address
+
+        User = get_user_model()
+        password = make_password(f"{self.prefix}-password")
+        user_ids, addresses = [], {}
+        for batch in _batched(range(self.spec.users), self.spec.batch_size):
+            rows = []
+            for n in batch:
+                city = self.rng.choice(CITIES)
+                rows.append((
+                    User(
+                        username=f"{self.prefix}_user{n}", email=f"{self.prefix}_user{n}@example.com",
+                        first_name=f"User{n}", password=password,
+                        date_joined=self.anchor - timedelta(days=self.rng.randrange(self.spec.days * 2)),
+                    ),
+                    city,
+                ))
+            with transaction.atomic():
+                created = User.objects.bulk_create([user for user, _ in rows])
+                address_rows = [
+                    Address(
+                        user=user, full_name=user.first_name, phone_number=f"9{self.rng.randrange(10**9):09d}",
+                        address_line1=f"{self.rng.randrange(1, 999)} Main Road", city=city,
+                        state=state, postal_code=pin, country="India", is_default=True,
+                    )
+                    for user, (_, (city, state, pin)) in zip(created, rows)
+                ]
+                Address.objects.bulk_create(address_rows)
+            for user, address in zip(created, address_rows):
+                user_ids.append(user.pk)
+                addresses[user.pk] = (user.first_name, user.email, address)
+        self.log(f"{len(user_ids)} users")
+        return user_ids, addresses
+
+    # Catalog ----------------------------------------------------------
+    def catalog(self):
+        category_rows = []
+        for i in range(self.spec.categories):
+            noun, n = NOUNS[i % len(NOUNS)], i // len(NOUNS)
+            category_rows.append(Category(
+                name=f"{noun}s {n}" if n else f"{noun}s",
+                slug=f"{self.prefix}-{noun.lower().replace(' ', '-')}-{n}",
+            ))
+        category_ids = [c.pk for c in Category.objects.bulk_create(category_rows)]
+        category_weights = zipf_cumulative(len(category_ids), s=0.8)
+
+        product_ids, prices = [], []
+        for batch in _batched(range(self.spec.products), self.spec.batch_size):
+            rows = []
+            for n in batch:
+                brand = self.rng.choice(BRANDS)
+                name = f"{brand} {self.rng.choice(NOUNS)} {self.rng.choice(ADJECTIVES)} {n}"
+                price = Decimal(min(250000, max(99, round(math.exp(self.rng.gauss(8.3, 1.1))))))
+                rows.append(Product(
+                    category_id=self._pick(category_ids, category_weights),
+                    name=name, slug=f"{self.prefix}-product-{n}", brand=brand,
+                    model_number=f"{brand[:3].upper()}-{n:07d}",
+                    description=f"{name} for load testing.",
+                    price=price, discount=Decimal(self.rng.choice(DISCOUNTS)),
+                    stock=0 if self.rng.random() < 0.08 else self.rng.randrange(1, 500),
+                    available=self.rng.random() > 0.03,
+                ))
+            created = Product.objects.bulk_create(rows)
+            product_ids.extend(p.pk for p in created)
+            prices.extend(p.effective_price for p in created)
+        self.log(f"{len(category_ids)} categories, {len(product_ids)} products")
+        return product_ids, prices
+
+    # Orders -----------------------------------------------------------
+    def _order_time(self):
+        # Skewed towards recent days, as a growing shop's history would be.
+        days_ago = self.spec.days * (self.rng.random() ** 1.6)
+        return self.anchor - timedelta(days=days_ago)
+
+    def _basket(self, product_index, product_weights):
+        lines = 1
+        while lines < self.spec.max_items and self.rng.random() < 0.45:
+            lines += 1
+        basket = {}
+        for _ in range(lines):
+            index = self._pick(product_index, product_weights)
+            basket[index] = self.rng.choices((1, 2, 3, 4), weights=(85, 10, 4, 1))[0]
+        return basket
+
+    def orders(self, user_ids, addresses, product_ids, prices):
+        if not user_ids or not product_ids:
+            return 0, 0
+        # Popularity is independent of insertion order.
+        product_index = list(range(len(product_ids)))
+        self.rng.shuffle(product_index)
+        product_weights = zipf_cumulative(len(product_ids))
+        user_weights = zipf_cumulative(len(user_ids), s=0.7)
+
+        total_orders = total_items = 0
+        with manual_timestamps(Order, "created_at", "updated_at"):
+            for batch in _batched(range(self.spec.orders), self.spec.batch_size):
+                orders, baskets = [], []
+                for _ in batch:
+                    user_id = self._pick(user_ids, user_weights)
+                    name, email, address = addresses[user_id]
+                    basket = self._basket(product_index, product_weights)
+                    created = self._order_time()
+                    statuses = RECENT_STATUSES if self.anchor - created < timedelta(days=7) else SETTLED_STATUSES
+                    status = self.rng.choices(*statuses)[0]
+                    orders.append(Order(
+                        user_id=user_id, customer_name=name, customer_email=email,
+                        phone_number=address.phone_number, address=address.address_line1,
+                        city=address.city, state=address.state, postal_code=address.postal_code,
+                        status=status, paid=status != "PAYMENT_FAILED",
+                        payment_status="Failed" if status == "PAYMENT_FAILED" else "Paid",
+                        total_amount=sum(prices[i] * q for i, q in basket.items()),
+                        created_at=created, updated_at=created,
+                    ))
+                    baskets.append(basket)
+                with transaction.atomic():
+                    Order.objects.bulk_create(orders)
+                    items = [
+                        OrderItem(order_id=order.pk, product_id=product_ids[i], price=prices[i], quantity=q)
+                        for order, basket in zip(orders, baskets)
+                        for i, q in basket.items()
+                    ]
+                    OrderItem.objects.bulk_create(items)
+                total_orders += len(orders)
+                total_items += len(items)
+                self.log(f"{total_orders} orders, {total_items} items")
+        return total_orders, total_items
+
+    def run(self):
+        user_ids, addresses = self.users()
+        product_ids, prices = self.catalog()
+        totals = self.orders(user_ids, addresses, product_ids, prices)
+        # bulk_create skips the signals that keep these in step.
+        search.rebuild_index()
+        categories.rebuild_counts()
+        facets.invalidate()
+        autocomplete.invalidate()
+        return totals
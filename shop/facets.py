@@ -0,0 +1,298 @@
+"""
+In-memory facet index for the catalog.
+
+Every facet value (a brand, a price band, a category, in-stock) owns a bitmap
+stored as a Python int where bit N is set when product N carries that value.
+Filtering is a handful of AND/OR operations over those ints and a count is
+``int.bit_count()``, so facet counts never touch the database.
+
+The index is built lazily from one narrow ``values_list`` query and then kept
+current in place: the Product signals in ``shop.signals`` and
+``products_changed`` (after an order takes stock) re-set one product's bits.
+Only a change to a product's facet values is appended to the ``ChangeLog``;
+other worker processes replay those entries by reloading just the products
+named, and rebuild only after ``invalidate()`` or a gap in the log.
+"""
+import threading
+from decimal import Decimal
+
+from django.db.models import Q
+
+from .caching import ChangeLog
+
+FACETS = ("category", "brand", "price", "in_stock")
+
+# (key, label, lower bound inclusive, upper bound exclusive)
+PRICE_BANDS = [
+    ("0-1000", "Under ₹1,000", Decimal("0"), Decimal("1000")),
+    ("1000-5000", "₹1,000 - ₹5,000", Decimal("1000"), Decimal("5000")),
+    ("5000-10000", "₹5,000 - ₹10,000", Decimal("5000"), Decimal("10000")),
+    ("10000-25000", "₹10,000 - ₹25,000", Decimal("10000"), Decimal("25000")),
+    ("25000-50000", "₹25,000 - ₹50,000", Decimal("25000"), Decimal("50000")),
+    ("50000+", "Over ₹50,000", Decimal("50000"), None),
+]
+PRICE_BAND_KEYS = {key for key, _, _, _ in PRICE_BANDS}
+
+changes = ChangeLog("facets")
+FIELDS = ("id", "category_id", "brand", "effective_price", "stock")
+
+
+def price_band(amount):
+    for key, _, low, high in PRICE_BANDS:
+        if amount >= low and (high is None or amount < high):
+            return key
+    return PRICE_BANDS[0][0]
+
+
+def product_facets(category_id, brand, effective_price, stock):
+    """Facet (name, value) pairs for a single product row"""
+    pairs = [
+        ("category", category_id),
+        ("price", price_band(effective_price)),
+        ("in_stock", stock > 0),
+    ]
+    if brand:
+        pairs.append(("brand", brand))
+    return tuple(pairs)
+
+
+# -------------------------
+# Facet Index
+# -------------------------
+class FacetIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.bitmaps = {}
+        self.members = {}
+        self.all = 0
+        self.generation = None
+
+    def _add(self, pid, pairs):
+        bit = 1 << pid
+        for pair in pairs:
+            self.bitmaps[pair] = self.bitmaps.get(pair, 0) | bit
+        self.members[pid] = pairs
+        self.all |= bit
+
+    def _remove(self, pid):
+        bit = 1 << pid
+        self.all &= ~bit
+        for pair in self.members.pop(pid, ()):
+            remaining = self.bitmaps[pair] & ~bit
+            if remaining:
+                self.bitmaps[pair] = remaining
+            else:
+                del self.bitmaps[pair]
+
+    def build(self):
+        from .models import Product
+
+        # Read the generation first: anything logged after it is replayed.
+        generation = changes.current()
+        rows = Product.objects.filter(available=True).values_list(*FIELDS)
+        # Build off to the side so readers only wait for the swap.
+        fresh = FacetIndex()
+        for pid, *fields in rows.iterator(chunk_size=5000):
+            fresh._add(pid, product_facets(*fields))
+        with self._lock:
+            self.bitmaps, self.members, self.all = fresh.bitmaps, fresh.members, fresh.all
+            self.generation = generation
+
+    def _set(self, pid, pairs):
+        """Give ``pid`` these facet pairs (None: drop it); False when nothing changed"""
+        if self.members.get(pid) == pairs:
+            return False
+        self._remove(pid)
+        if pairs is not None:
+            self._add(pid, pairs)
+        return True
+
+    def _reload(self, pids):
+        """Re-read ``pids`` from the database; returns the ids whose facets changed"""
+        from .models import Product
+
+        rows = Product.objects.filter(pk__in=pids, available=True).order_by().values_list(*FIELDS)
+        current = {pid: product_facets(*fields) for pid, *fields in rows}
+        return [pid for pid in pids if self._set(pid, current.get(pid))]
+
+    def _record(self, pids):
+        """Log changes already applied here, replaying any we missed from other processes"""
+        new = changes.append(tuple(pids))
+        missed = changes.since(self.generation, new - 1)
+        if missed is None:
+            self.generation = None
+            return
+        self._reload({pid for logged in missed for pid in logged})
+        self.generation = new
+
+    def update(self, product):
+        """Re-index one product after it was saved"""
+        pairs = None
+        if product.available:
+            pairs = product_facets(product.category_id, product.brand, product.effective_price, product.stock)
+        with self._lock:
+            # An index not built here can't tell what changed: log it for the others regardless.
+            if self._set(product.pk, pairs) or self.generation is None:
+                self._record([product.pk])
+
+    def remove(self, pid):
+        with self._lock:
+            if self._set(pid, None) or self.generation is None:
+                self._record([pid])
+
+    def refresh(self, pids):
+        """Re-read products changed by queryset updates (which send no signals)"""
+        with self._lock:
+            changed = self._reload(set(pids)) if self.generation is not None else list(pids)
+            if changed:
+                self._record(changed)
+
+    def sync(self):
+        """Catch up with the change log, rebuilding only when it cannot be replayed"""
+        current = changes.current()
+        if self.generation == current:
+            return
+        with self._lock:
+            logged = changes.since(self.generation, current)
+            if logged is not None:
+                self._reload({pid for pids in logged for pid in pids})
+                self.generation = current
+                return
+        self.build()
+
+    # Queries ---------------------------------------------------------
+    def _facet_mask(self, facet, values):
+        mask = 0
+        for value in values:
+            mask |= self.bitmaps.get((facet, value), 0)
+        return mask
+
+    def match(self, selected, exclude=None):
+        """Bitmap of products matching every selected facet (except ``exclude``); call under the lock"""
+        result = None
+        for facet, values in selected.items():
+            if facet == exclude or not values:
+                continue
+            mask = self._facet_mask(facet, values)
+            result = mask if result is None else result & mask
+        return self.all if result is None else result
+
+    def ids(self, selected):
+        """Sorted product ids matching ``selected``"""
+        with self._lock:
+            bits = bin(self.match(selected))[:1:-1]
+        return [pid for pid, bit in enumerate(bits) if bit == "1"]
+
+    def counts(self, selected):
+        """
+        Per-value counts for every facet.
+
+        Each facet is counted against the other facets' selections only, so
+        picking one brand still shows how many products the other brands have.
+        Runs under the lock so a concurrent update can't change the bitmaps
+        mid-count.
+        """
+        counts = {}
+        with self._lock:
+            for facet in FACETS:
+                base = self.match(selected, exclude=facet)
+                counts[facet] = {
+                    value: (bitmap & base).bit_count()
+                    for (name, value), bitmap in self.bitmaps.items()
+                    if name == facet and bitmap & base
+                }
+        return counts
+
+
+_index = FacetIndex()
+
+
+def product_saved(product):
+    _index.update(product)
+
+
+def product_deleted(pid):
+    _index.remove(pid)
+
+
+def products_changed(pids):
+    """Pick up stock or price changes written with ``QuerySet.update``"""
+    _index.refresh(pids)
+
+
+def invalidate():
+    """Force every process to rebuild its index (e.g. after a bulk update)"""
+    _index.generation = None
+    changes.reset()
+
+
+def get_index():
+    """Return the process-wide index, catching up with other processes' changes"""
+    if _index.generation is None:
+        _index.build()
+    else:
+        _index.sync()
+    return _index
+
+
+# -------------------------
+# Request helpers
+# -------------------------
+def selected_from_request(request, categories=()):
+    """Parse ?category=&brand=&price=&in_stock= into a selection dict"""
+    slugs = {c.slug: c.id for c in categories}
+    selected = {
+        "category": [slugs[s] for s in request.GET.getlist("category") if s in slugs],
+        "brand": [b for b in request.GET.getlist("brand") if b],
+        "price": [p for p in request.GET.getlist("price") if p in PRICE_BAND_KEYS],
+        "in_stock": [True] if request.GET.get("in_stock") in ("1", "true", "on") else [],
+    }
+    return {facet: values for facet, values in selected.items() if values}
+
+
+def filter_queryset(queryset, selected):
+    """Apply the same selection as SQL so the listing can keyset-paginate it"""
+    if "category" in selected:
+        # A plain equality lets the (category, sort key, id) indexes serve the ordering
+        if len(selected["category"]) == 1:
+            queryset = queryset.filter(category_id=selected["category"][0])
+        else:
+            queryset = queryset.filter(category_id__in=selected["category"])
+    if "brand" in selected:
+        queryset = queryset.filter(brand__in=selected["brand"])
+    if "in_stock" in selected:
+        queryset = queryset.filter(stock__gt=0)
+    if "price" in selected:
+        condition = Q()
+        for key, _, low, high in PRICE_BANDS:
+            if key in selected["price"]:
+                band = Q(effective_price__gte=low)
+                if high is not None:
+                    band &= Q(effective_price__lt=high)
+                condition |= band
+        queryset = queryset.filter(condition)
+    return queryset
+
+
+def facet_options(counts, categories, selected):
+    """Shape counts into template-friendly option lists"""
+    names = {c.id: c for c in categories}
+    return {
+        "category": [
+            {"value": names[cid].slug, "label": names[cid].name, "count": n,
+             "selected": cid in selected.get("category", ())}
+            for cid, n in counts["category"].items()
+            if cid in names
+        ],
+        "brand": [
+            {"value": brand, "label": brand, "count": n, "selected": brand in selected.get("brand", ())}
+            for brand, n in sorted(counts["brand"].items())
+        ],
+        "price": [
+            {"value": key, "label": label, "count": counts["price"].get(key, 0),
+             "selected": key in selected.get("price", ())}
+            for key, label, _, _ in PRICE_BANDS
+            if counts["price"].get(key)
+        ],
+        "in_stock": counts["in_stock"].get(True, 0),
+    }
@@ -0,0 +1,296 @@
+"""
+Payment gateway clients.
+
+Checkout and the payment callback reach the gateway through ``get_gateway()``,
+one process-wide client chosen by ``PAYMENT_GATEWAY``:
+
+* ``"razorpay"`` (default): the Razorpay SDK on a shared requests.Session
+  with a pooled adapter, so connections are reused across requests, and a
+  connect/read timeout on every call.
+* ``"fake"``: an in-process stand-in that creates orders and signs payments
+  locally, so the checkout-to-payment flow can be load-tested offline. It
+  only runs with ``DEBUG`` on, and without ``RAZORPAY_KEY_SECRET`` it signs
+  with a random per-process secret, so its signatures can't be forged.
+
+Every remote call goes through a circuit breaker. After ``FAILURE_THRESHOLD``
+consecutive failures the gateway is not called for ``RESET_SECONDS``, and
+callers get ``GatewayUnavailable`` at once instead of holding a worker on a
+sick upstream. Per-operation latency and error counts are shown on
+``/shop/cache/stats/``.
+"""
+import abc
+import hashlib
+import hmac
+import itertools
+import secrets
+import threading
+import time
+from collections import deque
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+
+try:
+    import razorpay
+except ImportError:  # pragma: no cover - only the fake gateway is usable
+    razorpay = None
+
+TIMEOUT = getattr(settings, "PAYMENT_GATEWAY_TIMEOUT", (3.05, 10))
+POOL_SIZE = getattr(settings, "PAYMENT_GATEWAY_POOL_SIZE", 20)
+FAILURE_THRESHOLD = getattr(settings, "PAYMENT_GATEWAY_FAILURE_THRESHOLD", 5)
+RESET_SECONDS = getattr(settings, "PAYMENT_GATEWAY_RESET_SECONDS", 30)
+
+
+class GatewayError(Exception):
+    pass
+
+
+class GatewayUnavailable(GatewayError):
+    pass
+
+
+class GatewayRejected(GatewayError):
+    """The gateway answered, but refused the request"""
+
+
+# -------------------------
+# Latency metrics
+# -------------------------
+class LatencyStats:
+    """Per-process call counts and recent latency percentiles for one operation"""
+
+    registry = {}
+
+    def __init__(self, name, window=1000):
+        self.name = name
+        self.calls = 0
+        self.errors = 0
+        self.rejected = 0
+        self.samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+        LatencyStats.registry[name] = self
+
+    def record(self, seconds, error=False):
+        with self._lock:
+            self.calls += 1
+            self.errors += error
+            self.samples.append(seconds * 1000)
+
+    def reject(self):
+        with self._lock:
+            self.rejected += 1
+
+    def as_dict(self):
+        with self._lock:
+            samples = sorted(self.samples)
+
+        def pick(q):
+            return round(samples[min(len(samples) - 1, int(q * len(samples)))], 2) if samples else None
+
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "rejected": self.rejected,
+            "p50_ms": pick(0.5),
+            "p95_ms": pick(0.95),
+            "max_ms": round(samples[-1], 2) if samples else None,
+        }
+
+    @classmethod
+    def snapshot(cls):
+        return {name: stats.as_dict() for name, stats in cls.registry.items()}
+
+
+# -------------------------
+# Circuit breaker
+# -------------------------
+class CircuitBreaker:
+    def __init__(self, threshold=FAILURE_THRESHOLD, reset_seconds=RESET_SECONDS, clock=time.monotonic):
+        self.threshold = threshold
+        self.reset_seconds = reset_seconds
+        self.clock = clock
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def state(self):
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if self.clock() - self.opened_at >= self.reset_seconds else "open"
+
+    def allow(self):
+        """False while open; once the reset time passes, one trial call is let through"""
+        with self._lock:
+            if self.opened_at is None:
+                return True
+            if self.clock() - self.opened_at < self.reset_seconds:
+                return False
+            # Half-open: re-arm the timer so concurrent callers wait for this trial.
+            self.opened_at = self.clock()
+            return True
+
+    def success(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.failures >= self.threshold:
+                self.opened_at = self.clock()
+
+
+# -------------------------
+# Gateways
+# -------------------------
+class Gateway(abc.ABC):
+    name = "gateway"
+    # Exceptions that mean the request was rejected, not that the gateway is unhealthy
+    client_errors = ()
+
+    def __init__(self, key_id, key_secret):
+        self.key_id = key_id
+        self.key_secret = key_secret
+        self.breaker = CircuitBreaker()
+
+    def stats(self, operation):
+        name = f"{self.name}.{operation}"
+        return LatencyStats.registry.get(name) or LatencyStats(name)
+
+    def call(self, operation, fn, *args, **kwargs):
+        stats = self.stats(operation)
+        if not self.breaker.allow():
+            stats.reject()
+            raise GatewayUnavailable(f"{self.name} is unavailable; try again shortly.")
+        started = time.perf_counter()
+        try:
+            result = fn(*args, **kwargs)
+        except self.client_errors as exc:
+            stats.record(time.perf_counter() - started, error=True)
+            self.breaker.success()
+            raise GatewayRejected(str(exc)) from exc
+        except Exception as exc:
+            stats.record(time.perf_counter() - started, error=True)
+            self.breaker.failure()
+            raise GatewayError(str(exc) or type(exc).__name__) from exc
+        stats.record(time.perf_counter() - started)
+        self.breaker.success()
+        return result
+
+    def create_order(self, amount_paise, receipt="", currency="INR"):
+        return self.call("create_order", self._create_order, amount_paise, receipt, currency)
+
+    @abc.abstractmethod
+    def _create_order(self, amount_paise, receipt, currency):
+        """Create the gateway order; returns its dict (with ``id``)"""
+
+    def verify_signature(self, order_id, payment_id, signature):
+        """Check the checkout callback signature locally (no network call)"""
+        if not (self.key_secret and order_id and payment_id and signature):
+            return False
+        expected = hmac.new(
+            self.key_secret.encode(), f"{order_id}|{payment_id}".encode(), hashlib.sha256
+        ).hexdigest()
+        return hmac.compare_digest(expected, signature)
+
+
+class TimeoutSession(requests.Session):
+    """A requests.Session that applies a default timeout to every request"""
+
+    def __init__(self, timeout=TIMEOUT, pool_size=POOL_SIZE):
+        super().__init__()
+        self.timeout = timeout
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.mount("https://", adapter)
+        self.mount("http://", adapter)
+
+    def request(self, *args, **kwargs):
+        kwargs.setdefault("timeout", self.timeout)
+        return super().request(*args, **kwargs)
+
+
+class RazorpayGateway(Gateway):
+    name = "razorpay"
+
+    def __init__(self, key_id, key_secret, session=None):
+        super().__init__(key_id, key_secret)
+        if razorpay is None:
+            raise GatewayError("The razorpay package is not installed.")
+        self.client_errors = (razorpay.errors.BadRequestError,)
+        self.client = razorpay.Client(session=session or TimeoutSession(), auth=(key_id, key_secret))
+
+    def _create_order(self, amount_paise, receipt, currency):
+        return self.client.order.create({
+            "amount": amount_paise,
+            "currency": currency,
+            "payment_capture": "1",
+            "receipt": receipt[:40],
+        })
+
+
+class FakeGateway(Gateway):
+    """Creates orders in memory and signs payments with the configured (or a random) secret"""
+
+    name = "fake"
+
+    def __init__(self, key_id="rzp_test_fake", key_secret=None, latency=0.0):
+        super().__init__(key_id, key_secret or secrets.token_hex(32))
+        self.latency = latency
+        self.orders = {}
+        self._ids = itertools.count(1)
+        self._lock = threading.Lock()
+
+    def _create_order(self, amount_paise, receipt, currency):
+        if self.latency:
+            time.sleep(self.latency)
+        with self._lock:
+            order = {
+                "id": f"order_fake{next(self._ids):010d}",
+                "amount": amount_paise,
+                "currency": currency,
+                "receipt": receipt,
+                "status": "created",
+            }
+            self.orders[order["id"]] = order
+        return order
+
+    def pay(self, order_id):
+        """Simulate the customer paying: (payment id, signature) for the callback"""
+        payment_id = f"pay_{order_id.removeprefix('order_')}"
+        signature = hmac.new(
+            self.key_secret.encode(), f"{order_id}|{payment_id}".encode(), hashlib.sha256
+        ).hexdigest()
+        return payment_id, signature
+
+
+_gateways = {}
+_gateways_lock = threading.Lock()
+
+
+def get_gateway():
+    """The shared client for the configured gateway and credentials"""
+    kind = getattr(settings, "PAYMENT_GATEWAY", "razorpay")
+    key_id = getattr(settings, "RAZORPAY_KEY_ID", "")
+    key_secret = getattr(settings, "RAZORPAY_KEY_SECRET", "")
+    if kind == "fake" and not settings.DEBUG:
+        raise GatewayError("PAYMENT_GATEWAY 'fake' is only allowed with DEBUG on")
+    config = (kind, key_id, key_secret)
+    gateway = _gateways.get(config)
+    if gateway is None:
+        with _gateways_lock:
+            gateway = _gateways.get(config)
+            if gateway is None:
+                if kind == "fake":
+                    gateway = FakeGateway(
+                        key_id or "rzp_test_fake", key_secret,
+                        latency=getattr(settings, "FAKE_GATEWAY_LATENCY", 0.0),
+                    )
+                elif kind == "razorpay":
+                    gateway = RazorpayGateway(key_id, key_secret)
+                else:
+                    raise GatewayError(f"Unknown PAYMENT_GATEWAY {kind!r}")
+                _gateways[config] = gateway
+    return gateway
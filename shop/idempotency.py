@@ -0,0 +1,46 @@
+"""
+Idempotent request handling.
+
+The first response to a keyed request is stored in ``IdempotencyKey`` in the
+same transaction as its side effects, so a retry is answered by one unique
+index lookup and ``replay`` instead of running the work again. Two copies
+racing past the lookup collide on that unique key (or on the work's own
+unique constraints); the loser rolls back and replays the winner's response.
+"""
+from django.db import IntegrityError, transaction
+from django.http import JsonResponse
+
+from .models import IdempotencyKey
+
+
+def replay(key):
+    """The stored JsonResponse for ``key``, or None on first sight"""
+    stored = IdempotencyKey.objects.filter(key=key).values_list("status_code", "response").first()
+    if stored is None:
+        return None
+    status_code, body = stored
+    response = JsonResponse(body, status=status_code)
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def record(key, body, status_code=200):
+    """Store the response for ``key``; call inside the transaction doing the work"""
+    IdempotencyKey.objects.create(key=key, status_code=status_code, response=body)
+    return JsonResponse(body, status=status_code)
+
+
+def run_once(key, work):
+    """Run ``work()`` -> (body, status) once per key and return its JsonResponse"""
+    response = replay(key)
+    if response is not None:
+        return response
+    try:
+        with transaction.atomic():
+            body, status_code = work()
+            return record(key, body, status_code)
+    except IntegrityError:
+        response = replay(key)
+        if response is None:
+            raise
+        return response
@@ -0,0 +1,111 @@
+"""
+Image derivatives for Product.image.
+
+Each upload is hashed and resized into fixed-width JPEG/PNG and WebP
+variants stored under ``MEDIA_ROOT/derivatives/<hh>/<hash>_<width>.<ext>``.
+Because the file name is the content hash, identical uploads share files and
+a changed image never collides with a cached URL.
+
+``build_derivatives`` is a plain function over file paths (no ORM access) so
+the backfill command can run it in a process pool.
+"""
+import hashlib
+import os
+
+from django.conf import settings
+from PIL import Image, ImageOps
+
+WIDTHS = getattr(settings, "PRODUCT_IMAGE_WIDTHS", (60, 120, 200, 400, 800))
+DERIVATIVE_DIR = "derivatives"
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+
+
+def content_hash(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as fh:
+        for chunk in iter(lambda: fh.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()[:20]
+
+
+def _relative_name(image_hash, width, ext):
+    return f"{DERIVATIVE_DIR}/{image_hash[:2]}/{image_hash}_{width}.{ext}"
+
+
+def build_derivatives(source_path, media_root=None, widths=WIDTHS):
+    """
+    Write every missing derivative of ``source_path``.
+
+    Returns ``(hash, fallback_ext)``; ``fallback_ext`` is "png" for images
+    with transparency and "jpg" otherwise.
+    """
+    media_root = str(media_root or settings.MEDIA_ROOT)
+    image_hash = content_hash(source_path)
+    with Image.open(source_path) as original:
+        original = ImageOps.exif_transpose(original)
+        has_alpha = original.mode in ("RGBA", "LA") or "transparency" in original.info
+        ext = "png" if has_alpha else "jpg"
+        base = original.convert("RGBA" if has_alpha else "RGB")
+        for width in widths:
+            targets = [(ext, _relative_name(image_hash, width, ext)), ("webp", _relative_name(image_hash, width, "webp"))]
+            targets = [(fmt, os.path.join(media_root, name)) for fmt, name in targets]
+            if all(os.path.exists(path) for _, path in targets):
+                continue
+            resized = base.copy()
+            resized.thumbnail((width, width), Image.LANCZOS)
+            for fmt, path in targets:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp = f"{path}.tmp"
+                if fmt == "webp":
+                    resized.save(tmp, "WEBP", quality=WEBP_QUALITY, method=4)
+                elif fmt == "png":
+                    resized.save(tmp, "PNG", optimize=True)
+                else:
+                    resized.save(tmp, "JPEG", quality=JPEG_QUALITY, optimize=True, progressive=True)
+                os.replace(tmp, path)
+    return image_hash, ext
+
+
+# -------------------------
+# Product helpers
+# -------------------------
+def image_key(image_hash, ext):
+    """Value stored in Product.image_hash: '<hash>.<fallback ext>'"""
+    return f"{image_hash}.{ext}"
+
+
+def ensure_product_derivatives(product):
+    """Generate derivatives for ``product.image`` and persist its image key"""
+    from .models import Product
+
+    if not product.image:
+        return ""
+    try:
+        key = image_key(*build_derivatives(product.image.path))
+    except (OSError, ValueError):
+        return ""
+    if key != product.image_hash:
+        Product.objects.filter(pk=product.pk).update(image_hash=key)
+        product.image_hash = key
+    return key
+
+
+def derivative_url(product, width, fmt=None):
+    """URL of the ``width`` px variant (``fmt='webp'`` for WebP)"""
+    if not product.image_hash:
+        if not product.image:
+            return ""
+        if not ensure_product_derivatives(product):
+            return product.image.url
+    image_hash, ext = product.image_hash.split(".")
+    width = min((w for w in WIDTHS if w >= width), default=WIDTHS[-1])
+    return settings.MEDIA_URL + _relative_name(image_hash, width, fmt or ext)
+
+
+def srcset(product, width, fmt=None):
+    """'url 1x, url 2x' for a slot ``width`` px wide"""
+    if not product.image or (fmt and not product.image_hash):
+        return ""
+    one, two = derivative_url(product, width, fmt), derivative_url(product, width * 2, fmt)
+    return f"{one} 1x, {two} 2x" if one != two else f"{one} 1x"
@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Max
+from shop.models import Product
+
+class Command(BaseCommand):
+    help = 'Recompute Product.effective_price for the whole catalog in id-range batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=10000)
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        max_id = Product.objects.aggregate(m=Max('id'))['m'] or 0
+        updated = 0
+        # One UPDATE per id range keeps each write transaction short; only stale
+        # rows are written, and their cached pages and facets follow.
+        for start in range(0, max_id + 1, batch_size):
+            updated += Product.objects.filter(id__gte=start, id__lt=start + batch_size).refresh_effective_price()
+        self.stdout.write(self.style.SUCCESS(f'Recomputed effective price for {updated} products.'))
@@ -0,0 +1,92 @@
+import threading
+import time
+import uuid
+from collections import Counter
+
+from django.core.management.base import BaseCommand
+from django.db import OperationalError, connection
+from django.db.models import Sum
+from shop.models import Category, Order, OrderItem, Product
+from shop.orders import OutOfStock, place_order
+from shop.pricing import price_cart
+
+# SQLite answers a contended write lock with "database is locked"; a real
+# client would retry the callback, so the benchmark does too.
+MAX_RETRIES = 50
+
+
+class Command(BaseCommand):
+    help = 'Race concurrent buyers for one product through order finalization; report oversell and throughput'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=16)
+        parser.add_argument('--buyers', type=int, default=500)
+        parser.add_argument('--stock', type=int, default=100)
+        parser.add_argument('--quantity', type=int, default=1, help='Units each buyer orders')
+        parser.add_argument('--keep', action='store_true', help='Keep the benchmark product and orders')
+
+    def buy(self, product_id, quantity):
+        retries = 0
+        while True:
+            try:
+                cart = price_cart({str(product_id): {"quantity": quantity}})
+                place_order(cart, customer_name='Checkout benchmark', customer_email='', paid=True)
+                return 'placed', retries
+            except OutOfStock:
+                return 'sold_out', retries
+            except OperationalError:
+                retries += 1
+                if retries > MAX_RETRIES:
+                    return 'gave_up', retries
+                time.sleep(0.002 * retries)
+
+    def handle(self, *args, **options):
+        tag = uuid.uuid4().hex[:8]
+        category = Category.objects.create(name=f'Checkout benchmark {tag}', slug=f'checkout-benchmark-{tag}')
+        product = Product.objects.create(
+            category=category, name=f'Benchmark item {tag}', slug=f'benchmark-item-{tag}',
+            price=100, stock=options['stock'],
+        )
+        buyers = iter(range(options['buyers']))
+        outcomes, lock = Counter(), threading.Lock()
+
+        def worker():
+            try:
+                while True:
+                    with lock:
+                        if next(buyers, None) is None:
+                            return
+                    outcome, retries = self.buy(product.pk, options['quantity'])
+                    with lock:
+                        outcomes[outcome] += 1
+                        outcomes['retries'] += retries
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=worker) for _ in range(options['threads'])]
+        started = time.monotonic()
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        elapsed = time.monotonic() - started
+
+        product.refresh_from_db()
+        sold = OrderItem.objects.filter(product=product).aggregate(units=Sum('quantity'))['units'] or 0
+        oversold = max(0, sold - options['stock'])
+        attempts = outcomes['placed'] + outcomes['sold_out'] + outcomes['gave_up']
+        self.stdout.write(
+            f"placed: {outcomes['placed']}  sold_out: {outcomes['sold_out']}  gave_up: {outcomes['gave_up']}  "
+            f"lock retries: {outcomes['retries']}"
+        )
+        self.stdout.write(f'sold: {sold}  stock left: {product.stock}  oversold: {oversold}')
+        style = self.style.SUCCESS if not oversold and sold + product.stock == options['stock'] else self.style.ERROR
+        self.stdout.write(style(
+            f"{attempts / elapsed:.0f} checkouts/s, {outcomes['placed'] / elapsed:.0f} orders/s "
+            f"over {options['threads']} threads in {elapsed:.2f}s"
+        ))
+
+        if not options['keep']:
+            Order.objects.filter(items__product=product).delete()
+            product.delete()
+            category.delete()
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from shop import recommendations
+
+class Command(BaseCommand):
+    help = 'Count co-purchases in new orders and refresh "frequently bought together" recommendations'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--rebuild', action='store_true', help='Drop all counts and rescan every order')
+
+    def handle(self, *args, **options):
+        orders, products = recommendations.build(options['batch_size'], rebuild=options['rebuild'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Processed {orders} orders; refreshed recommendations for {products} products.'
+        ))
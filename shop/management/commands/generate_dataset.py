@@ -0,0 +1,35 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from shop.dataset import DatasetGenerator, DatasetSpec
+
+
+class Command(BaseCommand):
+    help = 'Generate a deterministic synthetic dataset (users, catalog, orders) for load testing'
+
+    def add_arguments(self, parser):
+        defaults = DatasetSpec()
+        parser.add_argument('--users', type=int, default=defaults.users)
+        parser.add_argument('--categories', type=int, default=defaults.categories)
+        parser.add_argument('--products', type=int, default=defaults.products)
+        parser.add_argument('--orders', type=int, default=defaults.orders)
+        parser.add_argument('--max-items', type=int, default=defaults.max_items, help='Most lines per order')
+        parser.add_argument('--days', type=int, default=defaults.days, help='Length of the order history')
+        parser.add_argument('--seed', type=int, default=defaults.seed)
+        parser.add_argument('--batch-size', type=int, default=defaults.batch_size)
+
+    def handle(self, *args, **options):
+        spec = DatasetSpec(**{name: options[name] for name in DatasetSpec.__dataclass_fields__})
+        if spec.categories < 1 and spec.products:
+            raise CommandError('--categories must be at least 1 when generating products')
+        generator = DatasetGenerator(spec, log=lambda message: self.stdout.write(f'  {message}'))
+        if get_user_model().objects.filter(username__startswith=f'{generator.prefix}_').exists():
+            raise CommandError(f'A dataset with seed {spec.seed} already exists; use another --seed')
+
+        started = time.monotonic()
+        orders, items = generator.run()
+        self.stdout.write(self.style.SUCCESS(
+            f'Generated {spec.users} users, {spec.products} products, {orders} orders and {items} items '
+            f'in {time.monotonic() - started:.1f}s (seed {spec.seed}).'
+        ))
@@ -0,0 +1,53 @@
+import csv
+import os
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from shop.catalog_import import CatalogImporter, read_rows
+
+
+class Command(BaseCommand):
+    help = 'Stream a CSV or JSONL vendor catalog into Product, upserting on slug in batches'
+
+    def add_arguments(self, parser):
+        parser.add_argument('path', help='CSV or JSON Lines file (columns: name, category, price, ...)')
+        parser.add_argument('--format', choices=['csv', 'jsonl'], help='Defaults to the file extension')
+        parser.add_argument('--batch-size', type=int, default=2000)
+        parser.add_argument('--rejects', help='Write rejected rows (row number, reason) to this CSV file')
+        parser.add_argument('--dry-run', action='store_true', help='Validate and count without writing')
+
+    def handle(self, *args, **options):
+        path = options['path']
+        fmt = options['format'] or ('csv' if path.lower().endswith('.csv') else 'jsonl')
+        if not os.path.exists(path):
+            raise CommandError(f'{path} does not exist')
+
+        rejects_file = open(options['rejects'], 'w', newline='') if options['rejects'] else None
+        importer = CatalogImporter(
+            batch_size=options['batch_size'],
+            reject_writer=csv.writer(rejects_file) if rejects_file else None,
+            dry_run=options['dry_run'],
+        )
+        started = time.monotonic()
+
+        def progress(stats):
+            rate = stats.read / max(time.monotonic() - started, 1e-6)
+            self.stdout.write(f'{stats.read} rows read ({rate:,.0f} rows/s), {stats.rejected} rejected')
+
+        try:
+            with open(path, newline='', encoding='utf-8-sig') as fh:
+                importer.feed(read_rows(fh, fmt), progress=progress)
+            importer.finish()
+        finally:
+            if rejects_file:
+                rejects_file.close()
+
+        stats = importer.stats
+        elapsed = time.monotonic() - started
+        for row_number, reason in stats.rejects[:20]:
+            self.stderr.write(f'Row {row_number}: {reason}')
+        self.stdout.write(self.style.SUCCESS(
+            f'{"Checked" if options["dry_run"] else "Imported"} {stats.read} rows in {elapsed:.1f}s '
+            f'({stats.read / max(elapsed, 1e-6):,.0f} rows/s): {stats.created} created, '
+            f'{stats.updated} updated, {stats.rejected} rejected.'
+        ))
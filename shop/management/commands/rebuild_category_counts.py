@@ -0,0 +1,9 @@
+from django.core.management.base import BaseCommand
+from shop.categories import rebuild_counts
+
+class Command(BaseCommand):
+    help = 'Recompute the denormalized per-category product counts'
+
+    def handle(self, *args, **options):
+        count = rebuild_counts()
+        self.stdout.write(self.style.SUCCESS(f'Rebuilt product counts for {count} categories.'))
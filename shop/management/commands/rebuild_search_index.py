@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from shop import search
+
+class Command(BaseCommand):
+    help = 'Rebuild the full-text product search index from the product table'
+
+    def handle(self, *args, **options):
+        if not search.is_supported():
+            self.stdout.write(self.style.WARNING('Full-text search is not supported on this database backend.'))
+            return
+        search.create_index(connection)
+        search.rebuild_index()
+        self.stdout.write(self.style.SUCCESS('Search index rebuilt.'))
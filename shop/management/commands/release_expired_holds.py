@@ -0,0 +1,19 @@
+import time
+
+from django.core.management.base import BaseCommand
+from shop import reservations
+
+class Command(BaseCommand):
+    help = 'Release checkout stock holds that have passed their expiry'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', type=int, default=0, metavar='SECONDS',
+                            help='Keep sweeping every SECONDS instead of running once')
+
+    def handle(self, *args, **options):
+        while True:
+            freed = reservations.release_expired()
+            self.stdout.write(self.style.SUCCESS(f'Released {freed} held units.'))
+            if not options['loop']:
+                return
+            time.sleep(options['loop'])
@@ -0,0 +1,20 @@
+import time
+
+from django.core.management.base import BaseCommand
+from shop import bulk_orders
+
+class Command(BaseCommand):
+    help = 'Run bulk order jobs that are pending or whose worker stopped (e.g. in a restart)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', type=int, default=0, metavar='SECONDS',
+                            help='Keep polling every SECONDS instead of running once')
+
+    def handle(self, *args, **options):
+        while True:
+            done, failed = bulk_orders.run_due()
+            if done or failed or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f'Ran {done} bulk order jobs; {failed} failed.'))
+            if not options['loop']:
+                return
+            time.sleep(options['loop'])
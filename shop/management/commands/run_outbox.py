@@ -0,0 +1,27 @@
+import time
+
+from django.core.management.base import BaseCommand
+from shop import outbox
+
+class Command(BaseCommand):
+    help = 'Send due emails from the outbox in batches over one reused connection'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=100)
+        parser.add_argument('--loop', type=int, default=0, metavar='SECONDS',
+                            help='Keep polling every SECONDS instead of draining once and exiting')
+
+    def handle(self, *args, **options):
+        while True:
+            total_sent = total_failed = 0
+            while True:
+                sent, failed = outbox.send_due(options['batch_size'])
+                total_sent, total_failed = total_sent + sent, total_failed + failed
+                # A batch with failures is not retried until its backoff passes.
+                if sent + failed < options['batch_size']:
+                    break
+            if total_sent or total_failed or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f'Sent {total_sent} emails; {total_failed} failed.'))
+            if not options['loop']:
+                return
+            time.sleep(options['loop'])
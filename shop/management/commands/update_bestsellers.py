@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+from shop import bestsellers
+
+class Command(BaseCommand):
+    help = 'Fold new order items into the daily sales buckets and rebuild the bestseller rankings'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000)
+
+    def handle(self, *args, **options):
+        consumed, ranked = bestsellers.update(options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(
+            f'Consumed {consumed} new order items; wrote {ranked} ranking rows.'
+        ))
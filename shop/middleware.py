@@ -0,0 +1,71 @@
+"""
+Session write accounting.
+
+``SessionWriteMiddleware`` sits outside ``SessionMiddleware`` and, once the
+response is on its way out, applies the same rule Django uses to decide
+whether the session row was saved. The per-process totals are shown with the
+cache counters at ``/shop/cache/stats/``. On SQLite every save takes the
+database write lock, so ``saves_per_request`` should stay well below 1.
+
+The middleware is both sync and async capable, so under ASGI it does not
+force async views (``header_counters``) back onto a thread.
+"""
+import threading
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+
+
+class SessionWriteStats:
+    def __init__(self):
+        self.requests = 0
+        self.saves = 0
+        self._lock = threading.Lock()
+
+    def record(self, saved):
+        with self._lock:
+            self.requests += 1
+            self.saves += saved
+
+    def as_dict(self):
+        return {
+            "requests": self.requests,
+            "saves": self.saves,
+            "saves_per_request": round(self.saves / self.requests, 4) if self.requests else None,
+        }
+
+
+session_write_stats = SessionWriteStats()
+
+
+def session_saved(request, response):
+    """Whether SessionMiddleware wrote the session for this response"""
+    session = getattr(request, "session", None)
+    if session is None or not session.accessed or response.status_code == 500:
+        return False
+    if not (session.modified or settings.SESSION_SAVE_EVERY_REQUEST):
+        return False
+    return not session.is_empty()
+
+
+class SessionWriteMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.async_mode = iscoroutinefunction(get_response)
+        if self.async_mode:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.async_mode:
+            return self.__acall__(request)
+        response = self.get_response(request)
+        session_write_stats.record(session_saved(request, response))
+        return response
+
+    async def __acall__(self, request):
+        response = await self.get_response(request)
+        session_write_stats.record(session_saved(request, response))
+        return response
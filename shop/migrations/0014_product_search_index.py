@@ -0,0 +1,53 @@
+from django.db import migrations
+
+# The search schema as of this migration. It is spelled out here rather than
+# imported from shop.search so later changes there cannot rewrite history.
+SQLITE_CREATE = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS shop_product_fts USING fts5("
+    "name, brand, model, model_number, description, "
+    "tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    "INSERT INTO shop_product_fts(rowid, name, brand, model, model_number, description) "
+    "SELECT id, coalesce(name, ''), coalesce(brand, ''), coalesce(model, ''), "
+    "coalesce(model_number, ''), coalesce(description, '') FROM shop_product",
+]
+SQLITE_DROP = ["DROP TABLE IF EXISTS shop_product_fts"]
+
+POSTGRES_CREATE = [
+    "CREATE TABLE IF NOT EXISTS shop_product_search ("
+    "product_id bigint PRIMARY KEY REFERENCES shop_product(id) ON DELETE CASCADE "
+    "DEFERRABLE INITIALLY DEFERRED, document tsvector NOT NULL)",
+    "CREATE INDEX IF NOT EXISTS shop_product_search_document_gin ON shop_product_search USING gin(document)",
+    "INSERT INTO shop_product_search(product_id, document) SELECT id, "
+    "setweight(to_tsvector('simple', coalesce(name, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(brand, '')), 'A') || "
+    "setweight(to_tsvector('simple', coalesce(model, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(model_number, '')), 'B') || "
+    "setweight(to_tsvector('simple', coalesce(description, '')), 'D') "
+    "FROM shop_product",
+]
+POSTGRES_DROP = ["DROP TABLE IF EXISTS shop_product_search"]
+
+
+def _run(schema_editor, statements):
+    with schema_editor.connection.cursor() as cursor:
+        for sql in statements.get(schema_editor.connection.vendor, []):
+            cursor.execute(sql)
+
+
+def create_search_index(apps, schema_editor):
+    _run(schema_editor, {"sqlite": SQLITE_CREATE, "postgresql": POSTGRES_CREATE})
+
+
+def drop_search_index(apps, schema_editor):
+    _run(schema_editor, {"sqlite": SQLITE_DROP, "postgresql": POSTGRES_DROP})
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0013_order_payment_id_order_payment_order_id_and_more'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_index, drop_search_index),
+    ]
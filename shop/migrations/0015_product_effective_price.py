@@ -0,0 +1,31 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:35
+
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Round
+
+
+def backfill_effective_price(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    Product.objects.update(
+        effective_price=Round(
+            F('price') - F('price') * F('discount') / 100, 2,
+            output_field=models.DecimalField(max_digits=10, decimal_places=2),
+        )
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0014_product_search_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='effective_price',
+            field=models.DecimalField(db_index=True, decimal_places=2, default=0, editable=False, help_text='Price after discount, maintained on save for sorting and filtering', max_digits=10),
+        ),
+        migrations.RunPython(backfill_effective_price, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,36 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:38
+
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+def backfill_counts(apps, schema_editor):
+    Category = apps.get_model('shop', 'Category')
+    for category in Category.objects.annotate(
+        total=Count('products'),
+        live=Count('products', filter=Q(products__available=True)),
+    ):
+        Category.objects.filter(pk=category.pk).update(
+            products_total=category.total, products_available=category.live
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0015_product_effective_price'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='category',
+            name='products_available',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.AddField(
+            model_name='category',
+            name='products_total',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_counts, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0016_category_product_counts'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='image_hash',
+            field=models.CharField(blank=True, editable=False, help_text='Content hash and fallback extension of the generated image derivatives', max_length=32),
+        ),
+    ]
@@ -0,0 +1,72 @@
+# Generated by Django 5.2.18 on 2026-10-17 20:43
+
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery, Sum
+
+
+def backfill_units_sold(apps, schema_editor):
+    Product = apps.get_model('shop', 'Product')
+    OrderItem = apps.get_model('shop', 'OrderItem')
+    sold = (
+        OrderItem.objects.filter(product=OuterRef('pk'))
+        .values('product')
+        .annotate(units=Sum('quantity'))
+        .values('units')
+    )
+    Product.objects.filter(pk__in=OrderItem.objects.values('product')).update(units_sold=Subquery(sold))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0017_product_image_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='product',
+            name='units_sold',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Units ordered, denormalized for the bestselling sort'),
+        ),
+        migrations.RunPython(backfill_units_sold, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['name', 'id'], name='product_avail_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['category', 'name', 'id'], name='product_cat_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['effective_price', 'id'], name='product_avail_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['category', 'effective_price', 'id'], name='product_cat_price_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['created_at', 'id'], name='product_avail_new_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['category', 'created_at', 'id'], name='product_cat_new_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['discount', 'id'], name='product_avail_disc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['category', 'discount', 'id'], name='product_cat_disc_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['units_sold', 'id'], name='product_avail_sold_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='product',
+            index=models.Index(condition=models.Q(('available', True)), fields=['category', 'units_sold', 'id'], name='product_cat_sold_idx'),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:15
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Count, Min
+
+
+def clear_duplicate_payment_ids(apps, schema_editor):
+    """Keep the earliest order per gateway order / payment id; clear and annotate the rest"""
+    Order = apps.get_model('shop', 'Order')
+    for field in ('payment_order_id', 'payment_id'):
+        duplicated = (
+            Order.objects.filter(**{f'{field}__gt': ''})
+            .values(field)
+            .annotate(orders=Count('id'), first=Min('id'))
+            .filter(orders__gt=1)
+        )
+        for row in duplicated:
+            for order in Order.objects.filter(**{field: row[field]}).exclude(pk=row['first']):
+                order.notes = f"{order.notes}\nDuplicate of order #{row['first']} ({field} {row[field]})".strip()
+                setattr(order, field, None)
+                order.save(update_fields=[field, 'notes'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0023_stock_reservations'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='IdempotencyKey',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('key', models.CharField(max_length=255, unique=True)),
+                ('status_code', models.PositiveSmallIntegerField()),
+                ('response', models.JSONField()),
+                ('created', models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+        # Retried callbacks already created duplicate orders; the constraints need them gone.
+        migrations.RunPython(clear_duplicate_payment_ids, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('payment_order_id__gt', '')), fields=('payment_order_id',), name='unique_order_payment_order_id'),
+        ),
+        migrations.AddConstraint(
+            model_name='order',
+            constraint=models.UniqueConstraint(condition=models.Q(('payment_id__gt', '')), fields=('payment_id',), name='unique_order_payment_id'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:27
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0025_outboxemail'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='order',
+            name='payment_status',
+            field=models.CharField(choices=[('Pending', 'Pending'), ('Paid', 'Paid'), ('Failed', 'Failed'), ('Refund Pending', 'Refund Pending'), ('Refunded', 'Refunded')], default='Pending', max_length=20),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:30
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0026_order_refund_pending'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='bulkorderjob',
+            name='updated',
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddIndex(
+            model_name='bulkorderjob',
+            index=models.Index(fields=['status', 'updated'], name='shop_bulkor_status_19b314_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.18 on 2026-10-17 21:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('shop', '0027_bulkorderjob_updated'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='outboxemail',
+            name='claimed_by',
+            field=models.CharField(blank=True, editable=False, max_length=32),
+        ),
+    ]
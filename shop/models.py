@@ -1,9 +1,33 @@
-from django.db import models
+from decimal import Decimal, ROUND_HALF_UP
+from django.db import models, transaction
+from django.db.models import F, Value
+from django.db.models.functions import Round
 from django.urls import reverse
+from django.utils import timezone
 from django.contrib.auth import get_user_model
 
 User = get_user_model()
 
+
+def effective_price_for(price, discount):
+    """Final price a customer pays, rounded to paise"""
+    price = Decimal(price)
+    discount = Decimal(discount or 0)
+    if discount > 0:
+        price = price - (price * (discount / 100))
+    return price.quantize(Decimal("0.01"), rounding=ROUND_HALF_UP)
+
+
+def effective_price_expression(price=None, discount=None):
+    """SQL expression for effective_price, optionally using new price/discount values"""
+    price = F("price") if price is None else price
+    discount = F("discount") if discount is None else discount
+    if not hasattr(price, "resolve_expression"):
+        price = Value(Decimal(price))
+    if not hasattr(discount, "resolve_expression"):
+        discount = Value(Decimal(discount))
+    return Round(price - price * discount / 100, 2, output_field=models.DecimalField(max_digits=10, decimal_places=2))
+
 # -------------------------
 # Category Model
 # -------------------------
@@ -11,6 +35,10 @@ class Category(models.Model):
     name = models.CharField(max_length=200, db_index=True)
     slug = models.SlugField(max_length=200, unique=True)
 
+    # Denormalized counts, maintained incrementally by shop.categories
+    products_total = models.PositiveIntegerField(default=0, editable=False)
+    products_available = models.PositiveIntegerField(default=0, editable=False)
+
     class Meta:
         ordering = ["name"]
         verbose_name = "category"
@@ -26,6 +54,79 @@ class Category(models.Model):
 # -------------------------
 # Product Model
 # -------------------------
+class ProductQuerySet(models.QuerySet):
+    """Keeps the denormalized effective_price column in step with bulk writes"""
+
+    def update(self, **kwargs):
+        # auto_now is skipped by update(); bump it so cached fragments keyed
+        # on ``updated`` are invalidated by bulk writes as well.
+        kwargs.setdefault("updated", timezone.now())
+        if ("price" in kwargs or "discount" in kwargs) and "effective_price" not in kwargs:
+            kwargs["effective_price"] = effective_price_expression(kwargs.get("price"), kwargs.get("discount"))
+        return super().update(**kwargs)
+
+    def bulk_create(self, objs, *args, **kwargs):
+        objs = list(objs)
+        for obj in objs:
+            obj.effective_price = effective_price_for(obj.price, obj.discount)
+        update_fields = kwargs.get("update_fields")
+        if update_fields and ("price" in update_fields or "discount" in update_fields):
+            kwargs["update_fields"] = [*update_fields, "effective_price"]
+        return super().bulk_create(objs, *args, **kwargs)
+
+    def bulk_update(self, objs, fields, *args, **kwargs):
+        objs = list(objs)
+        if ("price" in fields or "discount" in fields) and "effective_price" not in fields:
+            for obj in objs:
+                obj.effective_price = effective_price_for(obj.price, obj.discount)
+            fields = [*fields, "effective_price"]
+        return super().bulk_update(objs, fields, *args, **kwargs)
+
+    def refresh_effective_price(self):
+        """
+        Recompute effective_price in SQL for the rows where it is stale.
+
+        Those rows get a new ``updated`` too, and after commit their detail
+        pages and facet entries are refreshed. Returns the number changed.
+        """
+        from . import facets
+        from .caching import invalidate_product_detail
+
+        stale = list(self.exclude(effective_price=effective_price_expression()).values_list("pk", flat=True))
+        if not stale:
+            return 0
+        changed = self.filter(pk__in=stale).update(effective_price=effective_price_expression())
+        transaction.on_commit(lambda: (invalidate_product_detail(*stale), facets.products_changed(stale)))
+        return changed
+
+
+# (sort column, short name used in index names)
+SORT_INDEX_FIELDS = [
+    ("name", "name"),
+    ("effective_price", "price"),
+    ("created_at", "new"),
+    ("discount", "disc"),
+    ("units_sold", "sold"),
+]
+
+
+def sort_indexes():
+    """
+    Partial indexes behind each catalog sort mode (see shop.pagination).
+
+    Listings always filter on available and order by (key, id), optionally
+    within one category, so each key gets a global and a per-category index.
+    """
+    indexes = []
+    for key, short in SORT_INDEX_FIELDS:
+        available = models.Q(available=True)
+        indexes.append(models.Index(fields=[key, "id"], condition=available, name=f"product_avail_{short}_idx"))
+        indexes.append(
+            models.Index(fields=["category", key, "id"], condition=available, name=f"product_cat_{short}_idx")
+        )
+    return indexes
+
+
 class Product(models.Model):
     category = models.ForeignKey(Category, related_name="products", on_delete=models.CASCADE)
     name = models.CharField(max_length=200, db_index=True)
@@ -38,8 +139,16 @@ class Product(models.Model):
     discount_percentage = models.DecimalField(max_digits=5, decimal_places=2, default=0, help_text="Discount percentage (0-100)")
     available = models.BooleanField(default=True)
     stock = models.PositiveIntegerField(default=0)
+    reserved = models.PositiveIntegerField(
+        default=0, editable=False,
+        help_text="Units held by active checkout reservations, changed only by conditional UPDATEs",
+    )
     created = models.DateTimeField(auto_now_add=True)
     discount = models.DecimalField(max_digits=5, decimal_places=2, default=0)
+    effective_price = models.DecimalField(
+        max_digits=10, decimal_places=2, default=0, db_index=True, editable=False,
+        help_text="Price after discount, maintained on save for sorting and filtering",
+    )
     updated = models.DateTimeField(auto_now=True)
 
     # Extra details (like Amazon page)
@@ -52,23 +161,45 @@ class Product(models.Model):
 
     # Image
     image = models.ImageField(upload_to="products/", blank=True, null=True)
+    image_hash = models.CharField(
+        max_length=32, blank=True, editable=False,
+        help_text="Content hash and fallback extension of the generated image derivatives",
+    )
 
     created_at = models.DateTimeField(auto_now_add=True)
+    units_sold = models.PositiveIntegerField(
+        default=0, editable=False,
+        help_text="Units sold over the bestseller sort window, refreshed by update_bestsellers",
+    )
+
+    objects = ProductQuerySet.as_manager()
+
     class Meta:
         ordering = ["name"]
-        indexes = [models.Index(fields=["id", "slug"])]
+        indexes = [
+            models.Index(fields=["id", "slug"]),
+            *sort_indexes(),
+        ]
 
     def __str__(self):
         return self.name
 
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember what the row looked like so signal handlers can compute
+        # count deltas without re-reading it (deferred fields are skipped).
+        loaded = dict(zip(field_names, values))
+        instance._loaded_state = (loaded.get("category_id"), loaded.get("available"))
+        instance._loaded_image = loaded.get("image")
+        return instance
+
     def get_absolute_url(self):
         return reverse("products:product_detail", args=[self.id])
     
     def get_discounted_price(self):
         """Calculate discounted price based on discount percentage"""
-        if self.discount > 0:
-            return self.price - (self.price * (self.discount / 100))
-        return self.price
+        return effective_price_for(self.price, self.discount)
     
     def get_savings_amount(self):
         """Calculate savings amount"""
@@ -92,6 +223,17 @@ class Product(models.Model):
         # Auto-calculate discount percentage when discount amount is set
         if self.discount_amount > 0:
             self.calculate_discount_percentage()
+        self.effective_price = effective_price_for(self.price, self.discount)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and ("price" in update_fields or "discount" in update_fields):
+            kwargs["update_fields"] = {*update_fields, "effective_price"}
+        elif update_fields is None and not self._state.adding and not kwargs.get("force_insert"):
+            # A full save must not write back a stale ``reserved``; checkouts change it concurrently.
+            deferred = self.get_deferred_fields()
+            kwargs["update_fields"] = [
+                f.name for f in self._meta.concrete_fields
+                if not f.primary_key and f.name != "reserved" and f.attname not in deferred
+            ]
         super().save(*args, **kwargs)
 
 def has_discount(self):
@@ -154,7 +296,11 @@ class Order(models.Model):
     payment_id = models.CharField(max_length=255, blank=True, null=True)
     payment_status = models.CharField(
         max_length=20,
-        choices=[("Pending", "Pending"), ("Paid", "Paid"), ("Failed", "Failed")],
+        choices=[
+            ("Pending", "Pending"), ("Paid", "Paid"), ("Failed", "Failed"),
+            # Paid, but the order could not be filled; the payment is owed back
+            ("Refund Pending", "Refund Pending"), ("Refunded", "Refunded"),
+        ],
         default="Pending"
     )
     payment_signature = models.CharField(max_length=255, blank=True, null=True)
@@ -166,6 +312,17 @@ class Order(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        constraints = [
+            # One order per gateway order / payment, however often the callback is retried
+            models.UniqueConstraint(
+                fields=["payment_order_id"], name="unique_order_payment_order_id",
+                condition=models.Q(payment_order_id__gt=""),
+            ),
+            models.UniqueConstraint(
+                fields=["payment_id"], name="unique_order_payment_id",
+                condition=models.Q(payment_id__gt=""),
+            ),
+        ]
 
     def __str__(self):
         return f"Order #{self.id} - {self.customer_name}"
@@ -201,6 +358,110 @@ class OrderItem(models.Model):
     def get_cost(self):
         return self.price * self.quantity
 
+# -------------------------
+# Persistent Cart
+# -------------------------
+class CartItem(models.Model):
+    """A line of a logged-in user's cart (anonymous carts stay in the session)"""
+    user = models.ForeignKey(User, related_name="cart_items", on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name="+", on_delete=models.CASCADE)
+    quantity = models.PositiveIntegerField(default=1)
+    updated = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["user", "product"], name="unique_cart_item")]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} for {self.user_id}"
+
+
+class StockReservation(models.Model):
+    """Units of a product held for a checkout until payment or expiry"""
+    product = models.ForeignKey(Product, related_name="reservations", on_delete=models.CASCADE)
+    user = models.ForeignKey(User, related_name="stock_reservations", on_delete=models.CASCADE)
+    # Hold token at first, then the gateway order id once it exists
+    reference = models.CharField(max_length=100, db_index=True)
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["product", "expires_at"], name="reservation_active_idx"),
+            models.Index(fields=["expires_at"], name="reservation_expiry_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x {self.product_id} held for {self.reference}"
+
+
+class IdempotencyKey(models.Model):
+    """The first response to a retried request, replayed for every duplicate"""
+    key = models.CharField(max_length=255, unique=True)
+    status_code = models.PositiveSmallIntegerField()
+    response = models.JSONField()
+    created = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.key} -> {self.status_code}"
+
+
+class OutboxEmail(models.Model):
+    """An email written with the transaction that caused it, sent later by run_outbox"""
+    STATUS = [
+        ("PENDING", "Pending"),
+        ("SENT", "Sent"),
+        ("FAILED", "Failed"),
+    ]
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255, blank=True)
+    to = models.JSONField(default=list)
+    status = models.CharField(max_length=10, choices=STATUS, default="PENDING")
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    claimed_by = models.CharField(max_length=32, blank=True, editable=False)
+    last_error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "next_attempt_at"], name="outbox_due_idx")]
+
+    def __str__(self):
+        return f"{self.subject} -> {', '.join(self.to)} ({self.status})"
+
+
+class BulkOrderJob(models.Model):
+    """A large bulk-order upload processed in the background into the user's cart"""
+    STATUS = [
+        ("PENDING", "Pending"),
+        ("RUNNING", "Running"),
+        ("DONE", "Done"),
+        ("FAILED", "Failed"),
+    ]
+    user = models.ForeignKey(User, related_name="bulk_order_jobs", on_delete=models.CASCADE)
+    upload = models.FileField(upload_to="bulk_orders/%Y/%m/%d")
+    status = models.CharField(max_length=10, choices=STATUS, default="PENDING")
+    total_lines = models.PositiveIntegerField(default=0)
+    processed_lines = models.PositiveIntegerField(default=0)
+    added = models.PositiveIntegerField(default=0)
+    rejected = models.PositiveIntegerField(default=0)
+    # Rejected lines as [line, text, reason], capped at bulk_orders.REPORT_LIMIT
+    report = models.JSONField(default=list, blank=True)
+    error = models.TextField(blank=True)
+    created = models.DateTimeField(auto_now_add=True)
+    # Touched on every progress write; a RUNNING job that stops touching it has lost its worker
+    updated = models.DateTimeField(default=timezone.now)
+    finished = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [models.Index(fields=["status", "updated"])]
+
+    def __str__(self):
+        return f"Bulk order job {self.pk} ({self.status})"
+
+
 PAYMENT_METHODS = (
     ('RZP', 'Razorpay'),
 )
@@ -214,3 +475,78 @@ class Wishlist(models.Model):
 
     def __str__(self):
         return f"{self.user.username} - {self.product.name}"
+
+
+# -------------------------
+# Sales Aggregates
+# -------------------------
+class Watermark(models.Model):
+    """Position of the last source row an incremental job has consumed"""
+    name = models.CharField(max_length=50, unique=True)
+    position = models.BigIntegerField(default=0)
+    updated = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.name} @ {self.position}"
+
+
+class ProductSalesDay(models.Model):
+    """Units and revenue per product per day, folded in from new OrderItems"""
+    product = models.ForeignKey(Product, related_name="sales_days", on_delete=models.CASCADE)
+    day = models.DateField()
+    units = models.PositiveIntegerField(default=0)
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["product", "day"], name="unique_product_sales_day")]
+        indexes = [models.Index(fields=["day"])]
+
+
+class Bestseller(models.Model):
+    """Precomputed ranking; category is null for the catalog-wide list"""
+    WINDOWS = (7, 30, 90)
+
+    window = models.PositiveSmallIntegerField(choices=[(w, f"{w} days") for w in WINDOWS])
+    category = models.ForeignKey(Category, null=True, blank=True, related_name="+", on_delete=models.CASCADE)
+    product = models.ForeignKey(Product, related_name="+", on_delete=models.CASCADE)
+    rank = models.PositiveIntegerField()
+    units = models.PositiveIntegerField()
+    revenue = models.DecimalField(max_digits=12, decimal_places=2)
+
+    class Meta:
+        ordering = ["window", "category", "rank"]
+        indexes = [models.Index(fields=["window", "category", "rank"])]
+
+    def __str__(self):
+        return f"#{self.rank} {self.product_id} ({self.window}d)"
+
+
+# -------------------------
+# Recommendations
+# -------------------------
+class ProductPairCount(models.Model):
+    """
+    Number of orders containing both products, stored in both directions.
+
+    The diagonal row (product == other) holds the product's own order count.
+    """
+    product = models.ForeignKey(Product, related_name="+", on_delete=models.CASCADE)
+    other = models.ForeignKey(Product, related_name="+", on_delete=models.CASCADE)
+    orders = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["product", "other"], name="unique_product_pair")]
+
+
+class ProductRecommendation(models.Model):
+    """Top-K "frequently bought together" neighbours of a product"""
+    product = models.ForeignKey(Product, related_name="recommendations", on_delete=models.CASCADE)
+    recommended = models.ForeignKey(Product, related_name="+", on_delete=models.CASCADE)
+    score = models.FloatField()
+
+    class Meta:
+        ordering = ["product", "-score"]
+        indexes = [models.Index(fields=["product", "-score"], name="recommendation_lookup_idx")]
+
+    def __str__(self):
+        return f"{self.product_id} -> {self.recommended_id} ({self.score:.3f})"
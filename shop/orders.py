@@ -0,0 +1,69 @@
+"""
+Order finalization.
+
+``place_order`` turns a priced cart into an ``Order`` inside one
+transaction: the checkout's stock holds are released, every line takes its
+units with one conditional ``UPDATE ... SET stock = stock - n WHERE stock >=
+reserved + n`` (in product id order, so concurrent orders lock rows in the
+same order), which leaves the units other checkouts still hold untouched.
+The items are written with one ``bulk_create``. If any line is short the
+whole transaction rolls back and ``OutOfStock`` names the product. Caches and
+in-process indexes hear about the sale only after commit.
+
+A payment the gateway has already captured can still lose the race for the
+last units. ``record_unfilled`` then keeps it as a cancelled order marked
+"Refund Pending", so the money is never left without a record.
+"""
+from django.db import transaction
+from django.db.models import F
+
+from . import autocomplete, facets, reservations
+from .caching import invalidate_product_detail
+from .models import Order, OrderItem, Product
+
+
+class OutOfStock(Exception):
+    def __init__(self, product):
+        self.product = product
+        super().__init__(f"Sorry, {product.name} sold out before your order could be placed.")
+
+
+def _after_commit(lines):
+    invalidate_product_detail(*[line.product.pk for line in lines])
+    facets.products_changed([line.product.pk for line in lines])
+    # bulk_create skips the OrderItem post_save signal that feeds autocomplete popularity.
+    for line in lines:
+        autocomplete.item_sold(line.product.pk, line.quantity)
+
+
+def place_order(cart, hold_reference=None, **fields):
+    """Create the order for a ``PricedCart`` atomically; raises OutOfStock"""
+    lines = sorted(cart, key=lambda line: line.product.pk)
+    with transaction.atomic():
+        if hold_reference:
+            reservations.release(hold_reference)
+        for line in lines:
+            taken = Product.objects.filter(
+                pk=line.product.pk, stock__gte=F("reserved") + line.quantity
+            ).update(stock=F("stock") - line.quantity)
+            if not taken:
+                raise OutOfStock(line.product)
+        order = Order.objects.create(total_amount=cart.total_price, **fields)
+        OrderItem.objects.bulk_create([
+            OrderItem(order=order, product_id=line.product.pk, price=line.unit_price, quantity=line.quantity)
+            for line in lines
+        ])
+        transaction.on_commit(lambda: _after_commit(lines))
+    return order
+
+
+def record_unfilled(cart, reason, hold_reference=None, **fields):
+    """Record a paid cart that could not be filled as a cancelled, refund-pending order"""
+    with transaction.atomic():
+        if hold_reference:
+            reservations.release(hold_reference)
+        lines = "\n".join(f"{line.quantity} x {line.product.name} (#{line.product.pk})" for line in cart)
+        return Order.objects.create(
+            total_amount=cart.total_price, status="CANCELLED", payment_status="Refund Pending",
+            notes=f"{reason}\n{lines}", **fields,
+        )
@@ -0,0 +1,131 @@
+"""
+Transactional email outbox.
+
+Views call ``enqueue`` inside the transaction that makes the email true (an
+order, say), so the message exists exactly when the order does and the
+request never waits on SMTP. ``send_due`` (the ``run_outbox`` command) sends
+due messages in batches over one reused connection. A failed send is retried
+with exponential backoff and given up on after ``MAX_ATTEMPTS``.
+"""
+import uuid
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.utils import timezone
+
+from .models import OutboxEmail
+
+MAX_ATTEMPTS = getattr(settings, "OUTBOX_MAX_ATTEMPTS", 8)
+BACKOFF_SECONDS = getattr(settings, "OUTBOX_BACKOFF_SECONDS", 30)
+MAX_BACKOFF_SECONDS = 60 * 60 * 6
+# A claimed batch is hidden from other workers for this long.
+LEASE = timedelta(minutes=5)
+
+
+def enqueue(subject, body, to, from_email=""):
+    return OutboxEmail.objects.create(subject=subject, body=body, to=list(to), from_email=from_email or "")
+
+
+def order_confirmation(order):
+    """Queue the plain-text confirmation for a paid order"""
+    if not order.customer_email:
+        return None
+    return enqueue(
+        f"Order Confirmation - Gadget Shop (Order #{order.id})",
+        (
+            f"Dear {order.customer_name},\n\n"
+            f"Thank you for your order! Your payment was successful.\n\n"
+            f"Order Number: {order.id}\n"
+            f"Total Amount: ₹{order.total_amount}\n"
+            f"Status: {order.get_status_display()}\n\n"
+            f"We'll notify you when your order is shipped.\n\n"
+            f"Thank you for shopping with us!\nGadget Shop Team"
+        ),
+        [order.customer_email],
+    )
+
+
+def refund_notice(order):
+    """Queue the notice for a paid order that could not be filled"""
+    if not order.customer_email:
+        return None
+    return enqueue(
+        f"Order Cancelled - Gadget Shop (Order #{order.id})",
+        (
+            f"Dear {order.customer_name},\n\n"
+            f"We're sorry: an item in your order sold out before it could be placed.\n\n"
+            f"Order Number: {order.id}\n"
+            f"Amount to be refunded: ₹{order.total_amount}\n\n"
+            f"Your payment will be refunded to the original payment method.\n\n"
+            f"Gadget Shop Team"
+        ),
+        [order.customer_email],
+    )
+
+
+def backoff(attempts):
+    return timedelta(seconds=min(BACKOFF_SECONDS * 2 ** (attempts - 1), MAX_BACKOFF_SECONDS))
+
+
+def _claim(batch_size, now):
+    """
+    Lease up to ``batch_size`` due emails to this worker.
+
+    Two workers may pick the same candidates, but the conditional UPDATE only
+    leases rows that are still due, so each row goes to exactly one of them
+    (this holds on SQLite too, where row locks don't exist).
+    """
+    due = OutboxEmail.objects.filter(status="PENDING", next_attempt_at__lte=now)
+    candidates = list(due.order_by("next_attempt_at").values_list("pk", flat=True)[:batch_size])
+    if not candidates:
+        return []
+    token = uuid.uuid4().hex
+    due.filter(pk__in=candidates).update(claimed_by=token, next_attempt_at=now + LEASE)
+    return list(OutboxEmail.objects.filter(claimed_by=token).order_by("pk"))
+
+
+def _failed(email, exc, now):
+    email.last_error = f"{type(exc).__name__}: {exc}"
+    if email.attempts >= MAX_ATTEMPTS:
+        email.status = "FAILED"
+    email.next_attempt_at = now + backoff(email.attempts)
+
+
+def send_due(batch_size=100, now=None):
+    """Send one batch of due emails over one connection; returns (sent, failed)"""
+    now = now or timezone.now()
+    batch = _claim(batch_size, now)
+    if not batch:
+        return 0, 0
+    sent = failed = 0
+    connection = get_connection(fail_silently=False)
+    try:
+        connection.open()
+    except Exception as exc:
+        # Server unreachable: the whole batch counts as one failed attempt.
+        for email in batch:
+            email.attempts += 1
+            _failed(email, exc, now)
+        failed = len(batch)
+    else:
+        try:
+            for email in batch:
+                email.attempts += 1
+                message = EmailMessage(
+                    email.subject, email.body, email.from_email or None, email.to, connection=connection
+                )
+                try:
+                    message.send()
+                except Exception as exc:
+                    failed += 1
+                    _failed(email, exc, now)
+                else:
+                    sent += 1
+                    email.status = "SENT"
+                    email.sent_at = timezone.now()
+                    email.last_error = ""
+        finally:
+            connection.close()
+    OutboxEmail.objects.bulk_update(batch, ["status", "attempts", "next_attempt_at", "last_error", "sent_at"])
+    return sent, failed
@@ -0,0 +1,174 @@
+import base64
+import json
+from dataclasses import dataclass, field
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+CATALOG_PAGE_SIZE = getattr(settings, "CATALOG_PAGE_SIZE", 24)
+MAX_PAGE_SIZE = 100
+
+# Sort mode -> model field. A leading "-" means descending; the id
+# tie-breaker always follows the same direction so one index scan
+# (forwards or backwards) serves the whole ordering. Every key has a
+# matching partial index, see shop.models.sort_indexes().
+SORT_MODES = {
+    "name": "name",
+    "price_asc": "effective_price",
+    "price_desc": "-effective_price",
+    "newest": "-created_at",
+    "discount": "-discount",
+    "bestselling": "-units_sold",
+}
+DEFAULT_SORT = "name"
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+# -------------------------
+# Cursor encoding
+# -------------------------
+def encode_cursor(value, pk):
+    """Encode a (sort value, id) position as an opaque URL-safe token"""
+    raw = json.dumps([str(value), pk], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(token):
+    """Decode a cursor token back into (sort value, id)"""
+    try:
+        padded = token + "=" * (-len(token) % 4)
+        value, pk = json.loads(base64.urlsafe_b64decode(padded.encode()))
+        return value, int(pk)
+    except (ValueError, TypeError, json.JSONDecodeError):
+        raise InvalidCursor(token)
+
+
+# -------------------------
+# Keyset Page
+# -------------------------
+@dataclass
+class KeysetPage:
+    object_list: list
+    sort: str
+    next_cursor: str = None
+    prev_cursor: str = None
+    per_page: int = CATALOG_PAGE_SIZE
+    query: dict = field(default_factory=dict)
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.prev_cursor is not None
+
+    def _url(self, **params):
+        query = self.query.copy()
+        query.pop("after", None)
+        query.pop("before", None)
+        query.update(params)
+        return "?" + query.urlencode()
+
+    @property
+    def next_url(self):
+        return self._url(after=self.next_cursor) if self.has_next else None
+
+    @property
+    def prev_url(self):
+        return self._url(before=self.prev_cursor) if self.has_previous else None
+
+
+def _seek_filter(field_name, descending, value, pk, forward):
+    """Build the (sort, id) row-value comparison as an OR of two lookups"""
+    op = "lt" if descending == forward else "gt"
+    return Q(**{f"{field_name}__{op}": value}) | Q(**{field_name: value, f"id__{op}": pk})
+
+
+def _row_value(row, name):
+    return row[name] if isinstance(row, dict) else getattr(row, name)
+
+
+def _row_pk(row):
+    return row["id"] if isinstance(row, dict) else row.pk
+
+
+def paginate_keyset(queryset, sort=DEFAULT_SORT, after=None, before=None, per_page=CATALOG_PAGE_SIZE):
+    """
+    Return one page of ``queryset`` ordered by (sort key, id).
+
+    Only ``per_page + 1`` rows are fetched: the extra row is the "has more"
+    probe, so no COUNT(*) is ever issued. ``.values()`` querysets work too as
+    long as they include ``id`` and the sort field.
+    """
+    if sort not in SORT_MODES:
+        sort = DEFAULT_SORT
+    order_field = SORT_MODES[sort]
+    descending = order_field.startswith("-")
+    field_name = order_field.lstrip("-")
+    per_page = max(1, min(int(per_page), MAX_PAGE_SIZE))
+
+    forward = before is None
+    cursor = after if forward else before
+    if cursor:
+        value, pk = decode_cursor(cursor)
+        queryset = queryset.filter(_seek_filter(field_name, descending, value, pk, forward))
+
+    # Walking backwards flips the ordering; rows are reversed afterwards.
+    prefix = "-" if descending == forward else ""
+    queryset = queryset.order_by(f"{prefix}{field_name}", f"{prefix}id")
+
+    rows = list(queryset[: per_page + 1])
+    has_more = len(rows) > per_page
+    rows = rows[:per_page]
+    if not forward:
+        rows.reverse()
+
+    page = KeysetPage(object_list=rows, sort=sort, per_page=per_page)
+    if rows:
+        first, last = rows[0], rows[-1]
+        # Paging backwards from a cursor always leaves rows after this page;
+        # paging forwards from a cursor always leaves rows before it.
+        has_next = has_more or not forward
+        has_previous = bool(cursor) if forward else has_more
+        if has_next:
+            page.next_cursor = encode_cursor(_row_value(last, field_name), _row_pk(last))
+        if has_previous:
+            page.prev_cursor = encode_cursor(_row_value(first, field_name), _row_pk(first))
+    return page
+
+
+def request_sort(request):
+    sort = request.GET.get("sort", DEFAULT_SORT)
+    return sort if sort in SORT_MODES else DEFAULT_SORT
+
+
+def sort_field(sort):
+    """Model field behind a sort mode, without the direction prefix"""
+    return SORT_MODES.get(sort, SORT_MODES[DEFAULT_SORT]).lstrip("-")
+
+
+def paginate_request(request, queryset):
+    """Paginate ``queryset`` using the sort/after/before/per_page query params"""
+    try:
+        page = paginate_keyset(
+            queryset,
+            sort=request_sort(request),
+            after=request.GET.get("after"),
+            before=request.GET.get("before"),
+            per_page=request.GET.get("per_page", CATALOG_PAGE_SIZE),
+        )
+    except (InvalidCursor, ValueError, ValidationError):
+        page = paginate_keyset(queryset, sort=request_sort(request))
+    page.query = request.GET.copy()
+    return page
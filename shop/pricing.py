@@ -0,0 +1,82 @@
+"""
+Cart pricing shared by the cart, checkout and payment views.
+
+``price_cart`` turns the session cart (``{product_id: {"quantity": n}}``)
+into a ``PricedCart`` with one query, selecting only the columns the views
+and templates read, and does the line/total arithmetic in one place.
+"""
+from dataclasses import dataclass, field
+from decimal import Decimal
+
+from .models import Product
+
+# Columns read by the cart/checkout templates and the order views. Anything
+# outside this list would be loaded lazily, one query per line.
+PRICING_FIELDS = ("id", "name", "slug", "price", "discount", "effective_price", "stock", "available", "image")
+
+
+@dataclass(frozen=True)
+class CartLine:
+    product: Product
+    quantity: int
+    unit_price: Decimal
+
+    @property
+    def total(self) -> Decimal:
+        return self.unit_price * self.quantity
+
+
+@dataclass(frozen=True)
+class PricedCart:
+    lines: list = field(default_factory=list)
+    # Session keys whose product no longer exists or whose entry is malformed
+    missing: list = field(default_factory=list)
+
+    def __iter__(self):
+        return iter(self.lines)
+
+    def __len__(self):
+        return len(self.lines)
+
+    @property
+    def total_price(self) -> Decimal:
+        return sum((line.total for line in self.lines), Decimal("0"))
+
+    @property
+    def total_qty(self) -> int:
+        return sum(line.quantity for line in self.lines)
+
+    @property
+    def amount_paise(self) -> int:
+        return int(self.total_price * 100)
+
+
+def _quantity(item):
+    try:
+        return int(item.get("quantity", 1))
+    except (AttributeError, TypeError, ValueError):
+        return 0
+
+
+def price_cart(cart) -> PricedCart:
+    """Price every line of a session cart with a single query"""
+    wanted = {}
+    missing = []
+    for key, item in (cart or {}).items():
+        quantity = _quantity(item)
+        if quantity < 1 or not str(key).isdigit():
+            missing.append(key)
+        else:
+            wanted[key] = quantity
+    if not wanted:
+        return PricedCart(missing=missing)
+
+    products = Product.objects.only(*PRICING_FIELDS).in_bulk([int(key) for key in wanted])
+    lines = []
+    for key, quantity in wanted.items():
+        product = products.get(int(key))
+        if product is None:
+            missing.append(key)
+            continue
+        lines.append(CartLine(product=product, quantity=quantity, unit_price=product.effective_price))
+    return PricedCart(lines=lines, missing=missing)
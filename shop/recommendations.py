@@ -0,0 +1,208 @@
+"""
+"Frequently bought together" recommendations.
+
+``build_recommendations`` streams orders past a watermark in batches, turns
+each batch into an order x product incidence matrix and counts co-purchases
+as ``Mᵀ·M`` (SciPy sparse when installed, a plain Counter otherwise). The
+counts accumulate in ``ProductPairCount``; every product touched by a batch
+then gets its top-K neighbours rewritten in ``ProductRecommendation``, scored
+by cosine similarity ``both / sqrt(orders(a) * orders(b))``. Products not
+in a batch keep their previous scores until they are touched again or the
+command is run with ``--rebuild``.
+
+Serving is one indexed query on ``(product, -score)``, cached per product
+until the next build.
+"""
+import heapq
+import math
+from collections import Counter, defaultdict
+from datetime import timedelta
+
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .caching import bump
+from .models import Order, OrderItem, ProductPairCount, ProductRecommendation, Watermark
+
+try:
+    from scipy import sparse
+except ImportError:  # pragma: no cover - optional speed-up
+    sparse = None
+
+WATERMARK = "recommendations"
+TOP_K = 8
+# Larger baskets are bulk/quick orders; their pairs say little and cost O(n²).
+MAX_BASKET = 50
+CHUNK = 500
+SETTLE_DELAY = timedelta(seconds=60)
+
+GENERATION_KEY = "recommendations:generation"
+CACHE_TIMEOUT = 60 * 15
+
+
+def _chunks(ids, size=CHUNK):
+    ids = list(ids)
+    for start in range(0, len(ids), size):
+        yield ids[start:start + size]
+
+
+# -------------------------
+# Counting
+# -------------------------
+def count_pairs(baskets):
+    """{(a, b): orders containing both} over ``baskets``, both directions and diagonal"""
+    if not baskets:
+        return {}
+    if sparse is not None:
+        return _count_pairs_sparse(baskets)
+    counts = Counter()
+    for basket in baskets:
+        for a in basket:
+            for b in basket:
+                counts[a, b] += 1
+    return counts
+
+
+def _count_pairs_sparse(baskets):
+    products = sorted({pid for basket in baskets for pid in basket})
+    column = {pid: i for i, pid in enumerate(products)}
+    rows, cols = [], []
+    for row, basket in enumerate(baskets):
+        rows.extend([row] * len(basket))
+        cols.extend(column[pid] for pid in basket)
+    incidence = sparse.csr_matrix(
+        ([1] * len(rows), (rows, cols)), shape=(len(baskets), len(products)), dtype="int32"
+    )
+    pairs = (incidence.T @ incidence).tocoo()
+    return {
+        (products[a], products[b]): n
+        for a, b, n in zip(pairs.row.tolist(), pairs.col.tolist(), pairs.data.tolist())
+    }
+
+
+def _baskets(order_ids):
+    baskets = defaultdict(set)
+    items = OrderItem.objects.filter(order_id__in=order_ids).values_list("order_id", "product_id")
+    for order_id, product_id in items:
+        baskets[order_id].add(product_id)
+    return [basket for basket in baskets.values() if len(basket) <= MAX_BASKET]
+
+
+def _apply_counts(counts):
+    by_product = defaultdict(dict)
+    for (a, b), n in counts.items():
+        by_product[a][b] = n
+    created, changed = [], []
+    for chunk in _chunks(by_product):
+        existing = ProductPairCount.objects.filter(product_id__in=chunk)
+        for row in existing:
+            n = by_product[row.product_id].pop(row.other_id, None)
+            if n:
+                row.orders += n
+                changed.append(row)
+    for a, others in by_product.items():
+        created.extend(ProductPairCount(product_id=a, other_id=b, orders=n) for b, n in others.items())
+    ProductPairCount.objects.bulk_create(created, batch_size=1000)
+    ProductPairCount.objects.bulk_update(changed, ["orders"], batch_size=1000)
+
+
+# -------------------------
+# Top-K refresh
+# -------------------------
+def refresh_products(product_ids):
+    """Rewrite the top-K neighbours of ``product_ids`` from the pair counts"""
+    for chunk in _chunks(product_ids):
+        neighbours, own = defaultdict(list), {}
+        for a, b, n in ProductPairCount.objects.filter(product_id__in=chunk).values_list(
+            "product_id", "other_id", "orders"
+        ):
+            if a == b:
+                own[a] = n
+            else:
+                neighbours[a].append((b, n))
+
+        missing = {b for pairs in neighbours.values() for b, _ in pairs} - own.keys()
+        for others in _chunks(missing):
+            own.update(
+                ProductPairCount.objects.filter(product_id__in=others, other_id=F("product_id"))
+                .values_list("product_id", "orders")
+            )
+
+        rows = []
+        for a, pairs in neighbours.items():
+            scored = (
+                (n / math.sqrt(own.get(a, n) * own.get(b, n)), n, b) for b, n in pairs
+            )
+            rows.extend(
+                ProductRecommendation(product_id=a, recommended_id=b, score=score)
+                for score, _, b in heapq.nlargest(TOP_K, scored)
+            )
+        with transaction.atomic():
+            ProductRecommendation.objects.filter(product_id__in=chunk).delete()
+            ProductRecommendation.objects.bulk_create(rows, batch_size=1000)
+
+
+# -------------------------
+# Builder
+# -------------------------
+def build(batch_size=2000, rebuild=False, now=None):
+    """Consume new orders and refresh affected products; returns (orders, products)"""
+    now = now or timezone.now()
+    if rebuild:
+        with transaction.atomic():
+            ProductPairCount.objects.all().delete()
+            ProductRecommendation.objects.all().delete()
+            Watermark.objects.filter(name=WATERMARK).update(position=0)
+    watermark, _ = Watermark.objects.get_or_create(name=WATERMARK)
+
+    consumed, touched = 0, set()
+    while True:
+        rows = list(
+            Order.objects.filter(id__gt=watermark.position)
+            .order_by("id")
+            .values_list("id", "created_at")[:batch_size]
+        )
+        # Stop at the first unsettled order: the watermark only passes a
+        # contiguous, fully counted run of ids.
+        young = (i for i, (_, created_at) in enumerate(rows) if created_at >= now - SETTLE_DELAY)
+        settled = next(young, len(rows))
+        order_ids = [order_id for order_id, _ in rows[:settled]]
+        if not order_ids:
+            break
+        counts = count_pairs(_baskets(order_ids))
+        with transaction.atomic():
+            _apply_counts(counts)
+            watermark.position = order_ids[-1]
+            watermark.save(update_fields=["position", "updated"])
+        touched.update(a for a, _ in counts)
+        consumed += len(order_ids)
+        if settled < batch_size:
+            break
+
+    refresh_products(sorted(touched))
+    if touched or rebuild:
+        bump(GENERATION_KEY)
+    return consumed, len(touched)
+
+
+def recommended_for(product_id, limit=TOP_K):
+    """Available recommended products, best first (one indexed query)"""
+    rows = (
+        ProductRecommendation.objects.filter(product_id=product_id, recommended__available=True)
+        .select_related("recommended")
+        .order_by("-score")[:limit]
+    )
+    return [row.recommended for row in rows]
+
+
+def cached_recommendations(product_id):
+    """``recommended_for`` through the cache, as shown on product pages"""
+    generation = cache.get_or_set(GENERATION_KEY, 0, None)
+    key = f"recommendations:{generation}:{product_id}"
+    products = cache.get(key)
+    if products is None:
+        products = recommended_for(product_id)
+        cache.set(key, products, CACHE_TIMEOUT)
+    return products
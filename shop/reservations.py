@@ -0,0 +1,127 @@
+"""
+Checkout stock reservations.
+
+``Product.reserved`` counts the units held by checkouts in progress. A hold
+is placed with one conditional UPDATE per line (``reserved = reserved + n
+WHERE stock >= reserved + n``), so two shoppers racing for the last unit
+cannot both get it, and a ``StockReservation`` row records the hold with an
+expiry. Holds end when the payment is recorded, when the same user checks
+out again, or when they expire and are swept by ``release_expired`` (the
+``release_expired_holds`` command, and for the products at hand before
+every new hold).
+
+Available to sell is ``stock - reserved``, with expired holds for the
+products at hand swept first, so the column is the single count of held
+units. A shopper's own holds are added back for them.
+"""
+import uuid
+from collections import Counter
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .models import Product, StockReservation
+
+HOLD_SECONDS = getattr(settings, "STOCK_HOLD_SECONDS", 15 * 60)
+
+
+class InsufficientStock(Exception):
+    def __init__(self, product):
+        self.product = product
+        super().__init__(f"Not enough stock left for {product.name}.")
+
+
+def _give_back(units):
+    # ``updated`` is left alone: holds do not change anything shown on cached pages.
+    for product_id, quantity in units.items():
+        Product.objects.filter(pk=product_id).update(
+            reserved=Greatest(F("reserved") - quantity, 0), updated=F("updated")
+        )
+
+
+def _release(holds):
+    """Delete ``holds`` and return their units; safe against a concurrent release"""
+    units = Counter()
+    with transaction.atomic():
+        for pk, product_id, quantity in holds.values_list("pk", "product_id", "quantity"):
+            # Only the request whose DELETE hits the row gives its units back.
+            if StockReservation.objects.filter(pk=pk).delete()[0]:
+                units[product_id] += quantity
+        _give_back(units)
+    return sum(units.values())
+
+
+def hold(user, lines, reference=None):
+    """Reserve every priced cart line or none; returns the hold reference"""
+    reference = reference or f"hold_{uuid.uuid4().hex}"
+    now = timezone.now()
+    with transaction.atomic():
+        # A new checkout replaces the user's previous one.
+        _release(StockReservation.objects.filter(user=user))
+        release_expired(now=now, product_ids=[line.product.pk for line in lines])
+        for line in lines:
+            held = Product.objects.filter(pk=line.product.pk, stock__gte=F("reserved") + line.quantity).update(
+                reserved=F("reserved") + line.quantity, updated=F("updated")
+            )
+            if not held:
+                raise InsufficientStock(line.product)
+        StockReservation.objects.bulk_create([
+            StockReservation(
+                product_id=line.product.pk, user=user, reference=reference, quantity=line.quantity,
+                expires_at=now + timedelta(seconds=HOLD_SECONDS),
+            )
+            for line in lines
+        ])
+    return reference
+
+
+def rename(reference, new_reference):
+    """Key the holds on the gateway order id once it is known"""
+    StockReservation.objects.filter(reference=reference).update(reference=new_reference)
+
+
+def release(reference):
+    """End the holds for ``reference`` (paid, abandoned or failed); returns units freed"""
+    return _release(StockReservation.objects.filter(reference=reference))
+
+
+def release_expired(now=None, product_ids=None, batch_size=1000):
+    """Sweep expired holds, optionally only for ``product_ids``; returns units freed"""
+    holds = StockReservation.objects.filter(expires_at__lte=now or timezone.now())
+    if product_ids is not None:
+        holds = holds.filter(product_id__in=product_ids)
+    freed = 0
+    while True:
+        batch = list(holds.order_by("expires_at").values_list("pk", flat=True)[:batch_size])
+        if not batch:
+            return freed
+        freed += _release(StockReservation.objects.filter(pk__in=batch))
+
+
+def available_to_sell(product_ids, user=None, now=None):
+    """{product id: stock minus the units other shoppers' checkouts hold}
+
+    ``reserved`` is the one count of held units; expired holds for these
+    products are swept first so it is current. ``user``'s own holds are
+    added back, since they are the stock that user is about to buy.
+    """
+    now = now or timezone.now()
+    release_expired(now=now, product_ids=product_ids)
+    rows = Product.objects.filter(pk__in=product_ids).order_by()
+    if user is not None and user.is_authenticated:
+        own = (
+            StockReservation.objects.filter(product=OuterRef("pk"), user=user)
+            .order_by()
+            .values("product")
+            .annotate(units=Sum("quantity"))
+            .values("units")
+        )
+        rows = rows.annotate(own=Coalesce(Subquery(own), 0))
+    else:
+        rows = rows.annotate(own=Value(0))
+    rows = rows.values_list("pk", "stock", "reserved", "own")
+    return {pk: max(stock - reserved + own, 0) for pk, stock, reserved, own in rows}
@@ -0,0 +1,220 @@
+"""
+Full-text product search.
+
+SQLite keeps an FTS5 virtual table (``shop_product_fts``) whose rowid is the
+product id; PostgreSQL keeps a ``shop_product_search`` table holding a
+weighted tsvector per product behind a GIN index. Both are kept in sync from
+the Product post_save/post_delete signals (see ``shop.signals``) and can be
+rebuilt with ``manage.py rebuild_search_index``.
+"""
+import re
+
+from django.db import connection
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+
+FTS_TABLE = "shop_product_fts"
+PG_TABLE = "shop_product_search"
+
+# Indexed columns with their BM25 weights (SQLite) / tsvector weights (Postgres)
+INDEXED_FIELDS = [
+    ("name", 10.0, "A"),
+    ("brand", 6.0, "A"),
+    ("model", 3.0, "B"),
+    ("model_number", 3.0, "B"),
+    ("description", 1.0, "D"),
+]
+_COLUMNS = [name for name, _, _ in INDEXED_FIELDS]
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+
+def _vendor(conn=None):
+    return (conn or connection).vendor
+
+
+def is_supported(conn=None):
+    return _vendor(conn) in ("sqlite", "postgresql")
+
+
+# -------------------------
+# Schema
+# -------------------------
+def create_index(conn):
+    """Create the search table for ``conn``'s backend if it is missing"""
+    with conn.cursor() as cursor:
+        if _vendor(conn) == "sqlite":
+            cursor.execute(
+                f"CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5("
+                f"{', '.join(_COLUMNS)}, "
+                "tokenize='unicode61 remove_diacritics 2', prefix='2 3')"
+            )
+        elif _vendor(conn) == "postgresql":
+            cursor.execute(
+                f"CREATE TABLE IF NOT EXISTS {PG_TABLE} ("
+                "product_id bigint PRIMARY KEY REFERENCES shop_product(id) ON DELETE CASCADE "
+                "DEFERRABLE INITIALLY DEFERRED, document tsvector NOT NULL)"
+            )
+            cursor.execute(
+                f"CREATE INDEX IF NOT EXISTS {PG_TABLE}_document_gin ON {PG_TABLE} USING gin(document)"
+            )
+
+
+def drop_index(conn):
+    with conn.cursor() as cursor:
+        if _vendor(conn) == "sqlite":
+            cursor.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+        elif _vendor(conn) == "postgresql":
+            cursor.execute(f"DROP TABLE IF EXISTS {PG_TABLE}")
+
+
+def _pg_document_sql():
+    parts = [
+        f"setweight(to_tsvector('simple', coalesce({name}, '')), '{weight}')"
+        for name, _, weight in INDEXED_FIELDS
+    ]
+    return " || ".join(parts)
+
+
+def rebuild_index(conn=None):
+    """Repopulate the search table from shop_product in one statement"""
+    conn = conn or connection
+    with conn.cursor() as cursor:
+        if _vendor(conn) == "sqlite":
+            cursor.execute(f"DELETE FROM {FTS_TABLE}")
+            selected = ", ".join(f"coalesce({c}, '')" for c in _COLUMNS)
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}(rowid, {', '.join(_COLUMNS)}) SELECT id, {selected} FROM shop_product"
+            )
+        elif _vendor(conn) == "postgresql":
+            cursor.execute(f"TRUNCATE {PG_TABLE}")
+            cursor.execute(
+                f"INSERT INTO {PG_TABLE}(product_id, document) SELECT id, {_pg_document_sql()} FROM shop_product"
+            )
+
+
+# -------------------------
+# Sync
+# -------------------------
+def index_product(product):
+    """Insert or refresh a single product's row in the search table"""
+    values = [getattr(product, name) or "" for name in _COLUMNS]
+    with connection.cursor() as cursor:
+        if _vendor() == "sqlite":
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [product.pk])
+            cursor.execute(
+                f"INSERT INTO {FTS_TABLE}(rowid, {', '.join(_COLUMNS)}) "
+                f"VALUES (%s, {', '.join(['%s'] * len(_COLUMNS))})",
+                [product.pk, *values],
+            )
+        elif _vendor() == "postgresql":
+            document = " || ".join(
+                f"setweight(to_tsvector('simple', %s), '{weight}')" for _, _, weight in INDEXED_FIELDS
+            )
+            cursor.execute(
+                f"INSERT INTO {PG_TABLE}(product_id, document) VALUES (%s, {document}) "
+                "ON CONFLICT (product_id) DO UPDATE SET document = EXCLUDED.document",
+                [product.pk, *values],
+            )
+
+
+def unindex_product(product_id):
+    with connection.cursor() as cursor:
+        if _vendor() == "sqlite":
+            cursor.execute(f"DELETE FROM {FTS_TABLE} WHERE rowid = %s", [product_id])
+        elif _vendor() == "postgresql":
+            cursor.execute(f"DELETE FROM {PG_TABLE} WHERE product_id = %s", [product_id])
+
+
+# -------------------------
+# Queries
+# -------------------------
+def tokenize(query):
+    return [token.lower() for token in _TOKEN_RE.findall(query or "")][:10]
+
+
+def build_match_expression(query):
+    """
+    Turn free text into a backend match expression.
+
+    Every token must match (AND) and the last one is treated as a prefix so
+    results appear while the shopper is still typing.
+    """
+    tokens = tokenize(query)
+    if not tokens:
+        return None
+    if _vendor() == "postgresql":
+        return " & ".join(f"{t}:*" if i == len(tokens) - 1 else t for i, t in enumerate(tokens))
+    return " ".join(f'"{t}"*' if i == len(tokens) - 1 else f'"{t}"' for i, t in enumerate(tokens))
+
+
+def search_ids(query, limit=48, offset=0):
+    """Return ids of available products matching ``query``, best match first"""
+    expression = build_match_expression(query)
+    if expression is None:
+        return []
+    with connection.cursor() as cursor:
+        if _vendor() == "sqlite":
+            weights = ", ".join(str(w) for _, w, _ in INDEXED_FIELDS)
+            cursor.execute(
+                f"SELECT {FTS_TABLE}.rowid FROM {FTS_TABLE} "
+                f"JOIN shop_product p ON p.id = {FTS_TABLE}.rowid "
+                f"WHERE {FTS_TABLE} MATCH %s AND p.available "
+                f"ORDER BY bm25({FTS_TABLE}, {weights}), {FTS_TABLE}.rowid LIMIT %s OFFSET %s",
+                [expression, limit, offset],
+            )
+        elif _vendor() == "postgresql":
+            cursor.execute(
+                f"SELECT s.product_id FROM {PG_TABLE} s JOIN shop_product p ON p.id = s.product_id, "
+                "to_tsquery('simple', %s) q WHERE s.document @@ q AND p.available "
+                "ORDER BY ts_rank_cd(s.document, q) DESC, s.product_id LIMIT %s OFFSET %s",
+                [expression, limit, offset],
+            )
+        else:
+            return _fallback_ids(query, limit, offset)
+        return [row[0] for row in cursor.fetchall()]
+
+
+def matching_ids_sql(query):
+    """
+    A subquery of every matching id, for ``filter(id__in=...)``.
+
+    Returns None when the query has no searchable tokens.
+    """
+    expression = build_match_expression(query)
+    if expression is None:
+        return None
+    if _vendor() == "sqlite":
+        return RawSQL(f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s", [expression])
+    if _vendor() == "postgresql":
+        return RawSQL(
+            f"SELECT product_id FROM {PG_TABLE} WHERE document @@ to_tsquery('simple', %s)", [expression]
+        )
+    return None
+
+
+def search_products(queryset, query):
+    """Filter ``queryset`` down to products matching ``query``"""
+    if not tokenize(query):
+        return queryset.none()
+    if not is_supported():
+        return queryset.filter(_fallback_condition(query))
+    return queryset.filter(id__in=matching_ids_sql(query))
+
+
+def _fallback_condition(query):
+    """Unindexed icontains scan for backends without full-text support"""
+    condition = Q()
+    for token in tokenize(query):
+        condition &= Q(name__icontains=token) | Q(brand__icontains=token) | Q(model_number__icontains=token)
+    return condition
+
+
+def _fallback_ids(query, limit, offset):
+    from .models import Product
+
+    ids = (
+        Product.objects.filter(_fallback_condition(query), available=True)
+        .order_by("name", "id")
+        .values_list("id", flat=True)
+    )
+    return list(ids[offset:offset + limit])
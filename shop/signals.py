@@ -0,0 +1,119 @@
+from django.contrib.auth.signals import user_logged_in
+from django.db import transaction
+from django.db.models.signals import pre_save, post_save, post_delete
+from django.dispatch import receiver
+
+from .models import Category, OrderItem, Product
+from . import autocomplete, caching, categories, facets, images, search
+from .cart import merge_session_cart
+
+
+# -------------------------
+# Search index sync
+# -------------------------
+@receiver(post_save, sender=Product)
+def index_product_on_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        search.index_product(instance)
+
+
+@receiver(post_delete, sender=Product)
+def unindex_product_on_delete(sender, instance, **kwargs):
+    search.unindex_product(instance.pk)
+
+
+# -------------------------
+# Facet index sync
+# -------------------------
+# The facet index lives in process memory, so it only follows committed data.
+@receiver(post_save, sender=Product)
+def update_facets_on_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(lambda: facets.product_saved(instance))
+
+
+@receiver(post_delete, sender=Product)
+def update_facets_on_delete(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: facets.product_deleted(pk))
+
+
+# -------------------------
+# Product detail cache
+# -------------------------
+@receiver(post_save, sender=Product)
+@receiver(post_delete, sender=Product)
+def invalidate_product_detail(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: caching.invalidate_product_detail(pk))
+
+
+# -------------------------
+# Category counts
+# -------------------------
+@receiver(pre_save, sender=Product)
+def remember_category_state(sender, instance, raw=False, **kwargs):
+    if not raw and instance.pk:
+        instance._previous_state = categories.loaded_state(instance)
+
+
+@receiver(post_save, sender=Product)
+def update_category_counts_on_save(sender, instance, created, raw=False, **kwargs):
+    if not raw:
+        categories.product_saved(instance, created, getattr(instance, "_previous_state", (None, None)))
+
+
+@receiver(post_delete, sender=Product)
+def update_category_counts_on_delete(sender, instance, **kwargs):
+    categories.product_deleted(instance)
+
+
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_category_nav(sender, **kwargs):
+    transaction.on_commit(categories.invalidate_nav)
+
+
+# -------------------------
+# Image derivatives
+# -------------------------
+@receiver(post_save, sender=Product)
+def build_image_derivatives(sender, instance, raw=False, **kwargs):
+    if raw or not instance.image:
+        return
+    image_name = instance.image.name
+    if instance.image_hash and getattr(instance, "_loaded_image", None) == image_name:
+        return
+    instance._loaded_image = image_name
+    images.ensure_product_derivatives(instance)
+
+
+# -------------------------
+# Autocomplete index
+# -------------------------
+@receiver(post_save, sender=Product)
+def update_autocomplete_on_save(sender, instance, raw=False, **kwargs):
+    if not raw:
+        transaction.on_commit(lambda: autocomplete.product_saved(instance))
+
+
+@receiver(post_delete, sender=Product)
+def update_autocomplete_on_delete(sender, instance, **kwargs):
+    pk = instance.pk
+    transaction.on_commit(lambda: autocomplete.product_deleted(pk))
+
+
+@receiver(post_save, sender=OrderItem)
+def update_autocomplete_popularity(sender, instance, created, raw=False, **kwargs):
+    if created and not raw:
+        product_id, quantity = instance.product_id, instance.quantity
+        transaction.on_commit(lambda: autocomplete.item_sold(product_id, quantity))
+
+
+# -------------------------
+# Cart merge at login
+# -------------------------
+@receiver(user_logged_in)
+def merge_cart_on_login(sender, request, user, **kwargs):
+    if request is not None and hasattr(request, "session"):
+        merge_session_cart(request, user)
@@ -18,4 +18,24 @@ def multiply(value, arg):
     try:
         return float(value) * float(arg)
     except (ValueError, TypeError):
-        return 0
\ No newline at end of file
+        return 0
+
+@register.simple_tag(takes_context=True)
+def product_cards(context, products):
+    """Render catalog cards through the per-product fragment cache"""
+    from shop.caching import render_product_cards
+    return render_product_cards(products, context["request"])
+
+
+@register.simple_tag
+def product_image_url(product, width, fmt=None):
+    """URL of a resized derivative of product.image (generated on first use)"""
+    from shop.images import derivative_url
+    return derivative_url(product, int(width), fmt)
+
+
+@register.simple_tag
+def product_srcset(product, width, fmt=None):
+    """1x/2x srcset of product.image derivatives for a slot ``width`` px wide"""
+    from shop.images import srcset
+    return srcset(product, int(width), fmt)
@@ -1,4 +1,8 @@
-from django.test import TestCase
+import io
+import json
+from decimal import Decimal
+from django.core.cache import cache
+from django.test import TestCase, TransactionTestCase
 from .models import Category, Product
 
 class ProductModelTest(TestCase):
@@ -17,3 +21,1385 @@ class ProductModelTest(TestCase):
 
     def test_category_str(self):
         self.assertEqual(str(self.category), "Electronics")
+
+
+class KeysetPaginationTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name="Phones", slug="phones")
+        for i in range(7):
+            Product.objects.create(
+                category=self.category, name=f"Phone {i % 3}", slug=f"phone-{i}", price=100 + i, stock=5
+            )
+
+    def test_walks_all_rows_once_in_stable_order(self):
+        from .pagination import paginate_keyset
+        qs = Product.objects.filter(available=True)
+        expected = list(qs.order_by("name", "id").values_list("id", flat=True))
+        seen, cursor = [], None
+        while True:
+            page = paginate_keyset(qs, after=cursor, per_page=3)
+            seen.extend(p.id for p in page)
+            if not page.has_next:
+                break
+            cursor = page.next_cursor
+        self.assertEqual(seen, expected)
+
+    def test_previous_cursor_returns_prior_page(self):
+        from .pagination import paginate_keyset
+        qs = Product.objects.filter(available=True)
+        first = paginate_keyset(qs, per_page=3)
+        second = paginate_keyset(qs, after=first.next_cursor, per_page=3)
+        back = paginate_keyset(qs, before=second.prev_cursor, per_page=3)
+        self.assertEqual([p.id for p in back], [p.id for p in first])
+        self.assertFalse(back.has_previous)
+
+    def test_category_page_issues_no_count_query(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/shop/category/phones/?per_page=2")
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["page"].has_next)
+        self.assertFalse(any("COUNT(" in q["sql"] for q in ctx.captured_queries))
+
+
+class ProductSearchTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name="Audio", slug="audio")
+        self.buds = Product.objects.create(
+            category=self.category, name="Galaxy Buds", slug="galaxy-buds", brand="Samsung", price=5000, stock=3
+        )
+        self.speaker = Product.objects.create(
+            category=self.category, name="Boom Speaker", slug="boom-speaker", brand="JBL",
+            description="Pairs with Samsung phones", price=3000, stock=3,
+        )
+
+    def test_prefix_match_ranks_name_hits_first(self):
+        from .search import search_ids
+        self.assertEqual(search_ids("sams"), [self.buds.id, self.speaker.id])
+        self.assertEqual(search_ids("galaxy bu"), [self.buds.id])
+
+    def test_index_follows_save_and_delete(self):
+        from .search import search_ids
+        self.buds.name = "Studio Headphones"
+        self.buds.save()
+        self.assertEqual(search_ids("galaxy"), [])
+        self.assertEqual(search_ids("studio"), [self.buds.id])
+        self.buds.delete()
+        self.assertEqual(search_ids("studio"), [])
+
+    def test_search_view(self):
+        response = self.client.get("/shop/search/?q=boom")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["products"], [self.speaker])
+
+    def test_admin_search_uses_index(self):
+        from django.contrib.auth import get_user_model
+        admin = get_user_model().objects.create_superuser("admin", "admin@example.com", "pass")
+        self.client.force_login(admin)
+        response = self.client.get("/admin/shop/product/?q=jbl")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(list(response.context["cl"].result_list), [self.speaker])
+
+
+class FacetIndexTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        from . import facets
+        self.phones = Category.objects.create(name="Phones", slug="phones")
+        self.audio = Category.objects.create(name="Audio", slug="audio")
+        self.p1 = Product.objects.create(category=self.phones, name="A", slug="a", brand="Apple", price=60000, stock=2)
+        self.p2 = Product.objects.create(category=self.phones, name="B", slug="b", brand="Samsung", price=20000, stock=0)
+        self.p3 = Product.objects.create(category=self.audio, name="C", slug="c", brand="Apple", price=2000, stock=9)
+        facets.invalidate()
+        self.index = facets.get_index()
+
+    def test_counts_exclude_own_facet(self):
+        counts = self.index.counts({"brand": ["Apple"]})
+        self.assertEqual(counts["brand"], {"Apple": 2, "Samsung": 1})
+        self.assertEqual(counts["category"], {self.phones.id: 1, self.audio.id: 1})
+        self.assertEqual(counts["price"], {"50000+": 1, "1000-5000": 1})
+
+    def test_ids_and_incremental_update(self):
+        from . import facets
+        self.assertEqual(self.index.ids({"in_stock": [True]}), [self.p1.id, self.p3.id])
+        with self.captureOnCommitCallbacks(execute=True):
+            self.p2.stock = 4
+            self.p2.save()
+        self.assertEqual(facets.get_index().ids({"in_stock": [True]}), [self.p1.id, self.p2.id, self.p3.id])
+
+    def test_changes_apply_in_place(self):
+        from . import facets
+        generation = facets.changes.current()
+        Product.objects.filter(pk=self.p1.pk).update(stock=1)
+        facets.products_changed([self.p1.pk])
+        self.assertEqual(facets.changes.current(), generation)  # still in stock: nothing to tell
+        # Another process sold out p3 and logged it; only p3 is re-read here.
+        Product.objects.filter(pk=self.p3.pk).update(stock=0)
+        facets.changes.append((self.p3.pk,))
+        with self.assertNumQueries(1):
+            self.assertEqual(facets.get_index().ids({"in_stock": [True]}), [self.p1.id])
+
+    def test_queries_wait_for_updates(self):
+        import threading
+        from . import facets
+        index = facets.get_index()
+        done = []
+        with index._lock:
+            reader = threading.Thread(target=lambda: done.append(index.counts({})))
+            reader.start()
+            reader.join(0.05)
+            self.assertEqual(done, [])  # blocked while an update holds the lock
+        reader.join()
+        self.assertEqual(done[0]["in_stock"], {True: 2, False: 1})
+
+    def test_list_view_filters_by_query_params(self):
+        response = self.client.get("/shop/products/?brand=Apple&price=50000%2B")
+        self.assertEqual(response.context["products"], [self.p1])
+
+
+class EffectivePriceTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name="Phones", slug="phones")
+        self.product = Product.objects.create(
+            category=self.category, name="Phone", slug="phone", price=1000, discount=15, stock=1
+        )
+
+    def test_save_maintains_effective_price(self):
+        self.assertEqual(self.product.effective_price, Decimal("850.00"))
+        self.product.discount = 0
+        self.product.save(update_fields=["discount"])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.effective_price, Decimal("1000.00"))
+
+    def test_bulk_writes_maintain_effective_price(self):
+        Product.objects.filter(pk=self.product.pk).update(price=2000)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.effective_price, Decimal("1700.00"))
+        self.product.discount = 50
+        Product.objects.bulk_update([self.product], ["discount"])
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.effective_price, Decimal("1000.00"))
+
+    def test_backfill_refreshes_caches(self):
+        from django.core.management import call_command
+        from . import facets
+        from .caching import get_product_detail
+        Product.objects.filter(pk=self.product.pk).update(effective_price=20000)
+        self.product.refresh_from_db()
+        facets.get_index()
+        get_product_detail(self.product.pk)
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command("backfill_effective_price", stdout=io.StringIO())
+        fresh = Product.objects.get(pk=self.product.pk)
+        self.assertEqual(fresh.effective_price, Decimal("850.00"))
+        self.assertGreater(fresh.updated, self.product.updated)
+        self.assertEqual(get_product_detail(self.product.pk)[0].effective_price, Decimal("850.00"))
+        self.assertEqual(facets.get_index().counts({})["price"], {"0-1000": 1})
+        self.assertEqual(Product.objects.refresh_effective_price(), 0)  # nothing stale left
+
+    def test_price_sort_and_range_use_column(self):
+        Product.objects.create(category=self.category, name="Cheap", slug="cheap", price=500, stock=1)
+        response = self.client.get("/shop/products/?sort=price_desc")
+        self.assertEqual([p.name for p in response.context["products"]], ["Phone", "Cheap"])
+        response = self.client.get("/shop/products/?price=0-1000&sort=price_asc")
+        self.assertEqual([p.name for p in response.context["products"]], ["Cheap", "Phone"])
+
+
+class ProductCardCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name="Phones", slug="phones")
+        self.product = Product.objects.create(category=self.category, name="Pixel", slug="pixel", price=100, stock=4)
+
+    def test_cards_cached_until_product_changes(self):
+        from .caching import card_stats
+        hits, misses = card_stats.hits, card_stats.misses
+        self.client.get("/shop/products/")
+        response = self.client.get("/shop/products/")
+        self.assertEqual((card_stats.hits - hits, card_stats.misses - misses), (1, 1))
+        self.assertContains(response, 'name="csrfmiddlewaretoken"', count=3)
+        self.assertNotContains(response, "csrf-token")
+
+        Product.objects.filter(pk=self.product.pk).update(name="Pixel 9")
+        response = self.client.get("/shop/products/")
+        self.assertContains(response, "Pixel 9")
+        self.assertEqual(card_stats.misses - misses, 2)
+
+
+class ProductDetailCacheTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name="Phones", slug="phones")
+        self.product = Product.objects.create(category=self.category, name="Pixel", slug="pixel", price=100, stock=4)
+
+    def test_second_view_served_without_queries(self):
+        self.client.get(f"/products/{self.product.pk}/")
+        with self.assertNumQueries(0):
+            response = self.client.get(f"/products/{self.product.pk}/")
+        self.assertContains(response, "Pixel")
+        self.assertContains(response, 'name="csrfmiddlewaretoken"', count=4)
+
+    def test_save_invalidates_entry(self):
+        self.client.get(f"/shop/product/{self.product.pk}/pixel/")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.product.name = "Pixel Pro"
+            self.product.save()
+        self.assertContains(self.client.get(f"/shop/product/{self.product.pk}/pixel/"), "Pixel Pro")
+
+    def test_stale_entry_served_while_another_request_revalidates(self):
+        from .caching import get_or_recompute
+        cache.set("k", (1, 0, "stale"), 60)
+        cache.add("k:lock", 1, 10)
+        self.assertEqual(get_or_recompute("k", lambda: "fresh", version=1), "stale")
+        cache.delete("k:lock")
+        self.assertEqual(get_or_recompute("k", lambda: "fresh", version=1), "fresh")
+
+
+class CategoryCountsTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.phones = Category.objects.create(name="Phones", slug="phones")
+        self.audio = Category.objects.create(name="Audio", slug="audio")
+
+    def counts(self, category):
+        category.refresh_from_db()
+        return category.products_total, category.products_available
+
+    def test_counts_follow_create_update_delete(self):
+        product = Product.objects.create(category=self.phones, name="P", slug="p", price=1, stock=1)
+        self.assertEqual(self.counts(self.phones), (1, 1))
+        product.available = False
+        product.save()
+        self.assertEqual(self.counts(self.phones), (1, 0))
+        product = Product.objects.get(pk=product.pk)
+        product.category = self.audio
+        product.available = True
+        product.save()
+        self.assertEqual(self.counts(self.phones), (0, 0))
+        self.assertEqual(self.counts(self.audio), (1, 1))
+        Product.objects.get(pk=product.pk).delete()
+        self.assertEqual(self.counts(self.audio), (0, 0))
+
+    def test_admin_changelist_has_no_per_row_count(self):
+        from django.contrib.auth import get_user_model
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        self.client.force_login(get_user_model().objects.create_superuser("admin", "a@example.com", "pass"))
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get("/admin/shop/category/")
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any('FROM "shop_product"' in q["sql"] for q in ctx.captured_queries))
+
+
+class ImageDerivativeTest(TestCase):
+    def setUp(self):
+        import tempfile
+        from django.test import override_settings
+        self.media = tempfile.TemporaryDirectory()
+        self.override = override_settings(MEDIA_ROOT=self.media.name)
+        self.override.enable()
+        self.category = Category.objects.create(name="Phones", slug="phones")
+
+    def tearDown(self):
+        self.override.disable()
+        self.media.cleanup()
+
+    def upload(self):
+        from PIL import Image
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        buffer = io.BytesIO()
+        Image.new("RGB", (1000, 500), "red").save(buffer, "JPEG")
+        return SimpleUploadedFile("phone.jpg", buffer.getvalue(), content_type="image/jpeg")
+
+    def test_derivatives_built_on_save(self):
+        import os
+        from .images import derivative_url, srcset
+        product = Product.objects.create(
+            category=self.category, name="P", slug="p", price=1, stock=1, image=self.upload()
+        )
+        image_hash, ext = product.image_hash.split(".")
+        self.assertEqual(ext, "jpg")
+        for name in (f"{image_hash}_200.jpg", f"{image_hash}_200.webp", f"{image_hash}_60.webp"):
+            self.assertTrue(os.path.exists(os.path.join(self.media.name, "derivatives", image_hash[:2], name)))
+        self.assertTrue(derivative_url(product, 200, "webp").endswith(f"{image_hash}_200.webp"))
+        self.assertEqual(srcset(product, 200).count("x"), 2)
+
+    def test_backfill_command(self):
+        from django.core.management import call_command
+        products = [
+            Product.objects.create(
+                category=self.category, name=f"P{i}", slug=f"p{i}", price=1, stock=1, image=self.upload()
+            )
+            for i in range(6)
+        ]
+        Product.objects.update(image_hash="")
+        out = io.StringIO()
+        # One worker keeps four jobs in flight, so the queue is refilled as jobs finish.
+        call_command("build_image_derivatives", workers=1, batch_size=4, stdout=out)
+        self.assertIn("for 6 products (0 failed)", out.getvalue())
+        for product in products:
+            product.refresh_from_db()
+            self.assertTrue(product.image_hash.endswith(".jpg"))
+
+
+class AutocompleteTest(TestCase):
+    def setUp(self):
+        from .models import Order, OrderItem
+        cache.clear()
+        category = Category.objects.create(name="Phones", slug="phones")
+        self.galaxy = Product.objects.create(
+            category=category, name="Galaxy S24", slug="galaxy-s24", brand="Samsung", price=70000, stock=5
+        )
+        self.gadget = Product.objects.create(
+            category=category, name="Gadget Stand", slug="gadget-stand", brand="Generic", price=500, stock=5
+        )
+        order = Order.objects.create(customer_name="A", customer_email="a@example.com")
+        OrderItem.objects.create(order=order, product=self.galaxy, price=70000, quantity=3)
+
+    def test_prefix_ranked_by_units_sold(self):
+        from .autocomplete import suggest
+        result = suggest("ga")
+        self.assertEqual([p["id"] for p in result["products"]], [self.galaxy.id, self.gadget.id])
+        self.assertEqual([b["name"] for b in suggest("sam")["brands"]], ["Samsung"])
+        self.assertEqual(suggest("s24")["products"][0]["name"], "Galaxy S24")
+
+    def test_warm_index_skips_database(self):
+        from .autocomplete import suggest
+        suggest("ga")
+        with self.assertNumQueries(0):
+            response = self.client.get("/shop/autocomplete/", {"q": "gal"})
+        self.assertEqual(response.json()["products"][0]["id"], self.galaxy.id)
+
+    def test_follows_product_changes(self):
+        from .autocomplete import suggest
+        suggest("ga")
+        with self.captureOnCommitCallbacks(execute=True):
+            Product.objects.filter(pk=self.gadget.pk).first().delete()
+        self.assertEqual([p["id"] for p in suggest("ga")["products"]], [self.galaxy.id])
+
+    def test_wide_prefix_keeps_best_sellers(self):
+        from unittest import mock
+        from . import autocomplete
+        gamepad = Product.objects.create(
+            category=self.galaxy.category, name="Gamepad", slug="gamepad", price=900, stock=5
+        )
+        with mock.patch.object(autocomplete, "MAX_SCAN", 1):
+            autocomplete.invalidate()
+            self.assertEqual([p["id"] for p in autocomplete.suggest("ga", 1)["products"]], [self.galaxy.id])
+            with self.assertNumQueries(0):
+                autocomplete.item_sold(self.gadget.id, 5)  # moves up the memoized top list in place
+            self.assertEqual(
+                [p["id"] for p in autocomplete.suggest("ga")["products"]], [self.gadget.id, self.galaxy.id, gamepad.id]
+            )
+
+    def test_other_process_changes_are_replayed(self):
+        from . import autocomplete
+        autocomplete.suggest("ga")
+        # Another process renamed a product and logged it; no signal fires here.
+        Product.objects.filter(pk=self.gadget.pk).update(name="Gallery Stand")
+        autocomplete.changes.append(("product", self.gadget.pk))
+        with self.assertNumQueries(1):  # only the changed product is reloaded
+            result = autocomplete.suggest("gall")
+        self.assertEqual([p["name"] for p in result["products"]], ["Gallery Stand"])
+
+
+class CatalogApiTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name="Phones", slug="phones")
+        for i in range(3):
+            Product.objects.create(
+                category=self.category, name=f"Phone {i}", slug=f"phone-{i}", price=100 + i, stock=1
+            )
+
+    def get_json(self, response):
+        return json.loads(b"".join(response.streaming_content))
+
+    def test_sparse_fields_and_cursor(self):
+        response = self.client.get("/shop/api/products/", {"fields": "id,name", "per_page": 2})
+        data = self.get_json(response)
+        self.assertEqual([set(r) for r in data["results"]], [{"id", "name"}] * 2)
+        self.assertIsNotNone(data["next"])
+        data = self.get_json(self.client.get("/shop/api/products/" + data["next"]))
+        self.assertEqual([r["name"] for r in data["results"]], ["Phone 2"])
+        self.assertEqual(self.client.get("/shop/api/products/", {"fields": "password"}).status_code, 400)
+
+    def test_conditional_get(self):
+        response = self.client.get("/shop/api/products/")
+        etag = response["ETag"]
+        with self.assertNumQueries(1):
+            cached = self.client.get("/shop/api/products/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(cached.status_code, 304)
+
+        Product.objects.filter(name="Phone 1").update(stock=5)
+        self.assertEqual(self.client.get("/shop/api/products/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_detail_etag(self):
+        product = Product.objects.first()
+        response = self.client.get(f"/shop/api/products/{product.id}/", {"fields": "stock"})
+        self.assertEqual(response.json(), {"stock": 1})
+        again = self.client.get(
+            f"/shop/api/products/{product.id}/", {"fields": "stock"}, HTTP_IF_NONE_MATCH=response["ETag"]
+        )
+        self.assertEqual(again.status_code, 304)
+
+
+class SortIndexTest(TestCase):
+    """Every sort mode must be answered from an index, never a full scan + sort"""
+
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name="Phones", slug="phones")
+        for i in range(5):
+            Product.objects.create(
+                category=self.category, name=f"Phone {i}", slug=f"phone-{i}", price=100 + i, stock=1
+            )
+
+    def query_plans(self, sort, category=False):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from .pagination import paginate_keyset
+        products = Product.objects.filter(available=True)
+        if category:
+            products = products.filter(category_id=self.category.id)
+        with CaptureQueriesContext(connection) as captured:
+            first = paginate_keyset(products, sort=sort, per_page=2)
+            paginate_keyset(products, sort=sort, after=first.next_cursor, per_page=2)
+        plans = []
+        with connection.cursor() as cursor:
+            for query in captured.captured_queries:
+                cursor.execute("EXPLAIN QUERY PLAN " + query["sql"])
+                plans.append(" | ".join(row[-1] for row in cursor.fetchall()))
+        return plans
+
+    def test_sort_modes_use_indexes(self):
+        from django.db import connection
+        from .pagination import SORT_MODES
+        if connection.vendor != "sqlite":
+            self.skipTest("EXPLAIN QUERY PLAN output is SQLite specific")
+        for sort in SORT_MODES:
+            for category in (False, True):
+                for plan in self.query_plans(sort, category):
+                    with self.subTest(sort=sort, category=category):
+                        self.assertIn("USING INDEX product_", plan)
+                        self.assertNotIn("TEMP B-TREE", plan)
+
+    def test_bestselling_order(self):
+        from .pagination import paginate_keyset
+        Product.objects.filter(name="Phone 3").update(units_sold=10)
+        page = paginate_keyset(Product.objects.filter(available=True), sort="bestselling")
+        self.assertEqual(page.object_list[0].name, "Phone 3")
+
+
+class BestsellerTest(TestCase):
+    def setUp(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import Order, OrderItem
+        cache.clear()
+        self.phones = Category.objects.create(name="Phones", slug="phones")
+        self.cables = Category.objects.create(name="Cables", slug="cables")
+        self.phone = Product.objects.create(category=self.phones, name="Phone", slug="phone", price=100, stock=9)
+        self.cable = Product.objects.create(category=self.cables, name="Cable", slug="cable", price=5, stock=9)
+        self.old = timezone.now() - timedelta(days=20)
+        order = Order.objects.create(customer_name="A", customer_email="a@example.com")
+        Order.objects.filter(pk=order.pk).update(created_at=self.old)
+        OrderItem.objects.create(order=order, product=self.phone, price=100, quantity=2)
+        OrderItem.objects.create(order=order, product=self.cable, price=5, quantity=5)
+
+    def add_recent_order(self, product, quantity):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import Order, OrderItem
+        order = Order.objects.create(customer_name="B", customer_email="b@example.com")
+        Order.objects.filter(pk=order.pk).update(created_at=timezone.now() - timedelta(minutes=5))
+        OrderItem.objects.create(order=order, product=product, price=product.price, quantity=quantity)
+
+    def test_windows_and_units_sold(self):
+        from . import bestsellers
+        from .models import Bestseller
+        self.assertEqual(bestsellers.update(), (2, 8))
+        self.assertEqual([p.name for p in bestsellers.top_products(window=30)], ["Cable", "Phone"])
+        self.assertEqual(bestsellers.top_products(window=7), [])
+        self.assertEqual([p.name for p in bestsellers.top_products(category=self.phones)], ["Phone"])
+        self.phone.refresh_from_db()
+        self.assertEqual(self.phone.units_sold, 2)
+        self.assertEqual(Bestseller.objects.get(window=90, category=None, product=self.cable).revenue, 25)
+
+    def test_incremental_from_watermark(self):
+        from . import bestsellers
+        from .models import ProductSalesDay
+        bestsellers.update()
+        self.add_recent_order(self.phone, 4)
+        self.assertEqual(bestsellers.consume_new_items(), 1)
+        self.assertEqual(sum(ProductSalesDay.objects.filter(product=self.phone).values_list("units", flat=True)), 6)
+        bestsellers.rebuild_rankings()
+        self.assertEqual([p.name for p in bestsellers.top_products(window=30)], ["Phone", "Cable"])
+        self.assertEqual([p.name for p in bestsellers.top_products(window=7)], ["Phone"])
+
+    def test_young_item_holds_back_the_watermark(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from . import bestsellers
+        from .models import Order, OrderItem
+        bestsellers.update()
+        young = Order.objects.create(customer_name="C", customer_email="c@example.com")
+        OrderItem.objects.create(order=young, product=self.phone, price=100, quantity=1)
+        # Back-dated, with a higher id than the order still inside the settle window
+        self.add_recent_order(self.cable, 3)
+        self.assertEqual(bestsellers.consume_new_items(), 0)
+        self.assertEqual(bestsellers.consume_new_items(now=timezone.now() + timedelta(minutes=2)), 2)
+
+    def test_home_rail_runs_no_aggregates(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from . import bestsellers
+        bestsellers.update()
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get("/shop/")
+        self.assertContains(response, "Bestsellers")
+        self.assertFalse([q for q in captured.captured_queries if "SUM(" in q["sql"].upper()])
+
+
+class RecommendationTest(TestCase):
+    def setUp(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import Order, OrderItem
+        cache.clear()
+        category = Category.objects.create(name="Phones", slug="phones")
+        self.phone, self.case, self.cable, self.tv = [
+            Product.objects.create(category=category, name=name, slug=name.lower(), price=10, stock=5)
+            for name in ("Phone", "Case", "Cable", "TV")
+        ]
+        for basket in ([self.phone, self.case], [self.phone, self.case, self.cable], [self.phone, self.tv]):
+            self.add_order(basket)
+        Order.objects.update(created_at=timezone.now() - timedelta(hours=1))
+
+    def add_order(self, basket):
+        from .models import Order, OrderItem
+        order = Order.objects.create(customer_name="A", customer_email="a@example.com")
+        for product in basket:
+            OrderItem.objects.create(order=order, product=product, price=10, quantity=1)
+
+    def test_counter_and_sparse_agree(self):
+        from . import recommendations
+        baskets = [{1, 2}, {1, 2, 3}, {1, 4}]
+        sparse_counts = recommendations.count_pairs(baskets)
+        saved, recommendations.sparse = recommendations.sparse, None
+        try:
+            self.assertEqual(dict(recommendations.count_pairs(baskets)), dict(sparse_counts))
+        finally:
+            recommendations.sparse = saved
+        self.assertEqual(sparse_counts[1, 2], 2)
+        self.assertEqual(sparse_counts[1, 1], 3)
+
+    def test_build_and_serve(self):
+        from .recommendations import build, recommended_for
+        self.assertEqual(build(batch_size=2), (3, 4))
+        with self.assertNumQueries(1):
+            names = [p.name for p in recommended_for(self.phone.pk)]
+        self.assertEqual(names[0], "Case")
+        self.assertEqual(set(names), {"Case", "Cable", "TV"})
+
+    def test_incremental_refresh(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import Order, ProductPairCount
+        from .recommendations import build, recommended_for
+        build()
+        self.add_order([self.cable, self.tv])
+        self.add_order([self.cable, self.tv])
+        Order.objects.update(created_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(build(), (2, 2))
+        self.assertEqual(ProductPairCount.objects.get(product=self.cable, other=self.tv).orders, 2)
+        self.assertEqual(recommended_for(self.tv.pk)[0].name, "Cable")
+
+    def test_young_order_holds_back_the_watermark(self):
+        from datetime import timedelta
+        from django.utils import timezone
+        from .models import Order
+        from .recommendations import build
+        build()
+        self.add_order([self.cable, self.tv])
+        self.add_order([self.case, self.tv])
+        # Only the later order is settled; the earlier one must not be skipped.
+        latest = Order.objects.latest("id")
+        Order.objects.filter(pk=latest.pk).update(created_at=timezone.now() - timedelta(hours=1))
+        self.assertEqual(build()[0], 0)
+        self.assertEqual(build(now=timezone.now() + timedelta(minutes=2))[0], 2)
+
+
+class CatalogImportTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.category = Category.objects.create(name="Phones", slug="phones")
+        Product.objects.create(category=self.category, name="Old Phone", slug="old-phone", price=10, stock=1)
+
+    def run_import(self, content, fmt, **options):
+        import tempfile
+        from django.core.management import call_command
+        with tempfile.NamedTemporaryFile("w", suffix=f".{fmt}", delete=False) as fh:
+            fh.write(content)
+        out, err = io.StringIO(), io.StringIO()
+        call_command("import_catalog", fh.name, batch_size=2, stdout=out, stderr=err, **options)
+        return out.getvalue(), err.getvalue()
+
+    def test_csv_upsert_and_rejects(self):
+        out, err = self.run_import(
+            "name,slug,category,price,discount,stock,brand\n"
+            "Old Phone,old-phone,Phones,20,10,5,Acme\n"
+            "New Cable,,Cables,5,,3,\n"
+            "Broken,,Phones,abc,,1,\n"
+            "No Category,,,5,,1,\n"
+            "Odd Category,,日本,5,,1,\n",
+            "csv",
+        )
+        self.assertIn("1 created, 1 updated, 3 rejected", out)
+        self.assertIn("Row 3: price is not a number", err)
+        self.assertIn("Row 5: category does not produce a usable slug", err)
+        self.assertFalse(Category.objects.filter(slug="").exists())
+        old = Product.objects.get(slug="old-phone")
+        self.assertEqual((old.price, old.effective_price, old.stock, old.brand), (20, 18, 5, "Acme"))
+        cable = Product.objects.get(slug="new-cable")
+        self.assertEqual(cable.category.slug, "cables")
+        self.assertEqual(cable.category.products_total, 1)
+
+    def test_jsonl_and_search_index(self):
+        from .search import search_ids
+        out, _ = self.run_import(
+            '{"name": "Galaxy Buds", "category": "Audio", "price": 4999}\n'
+            "not json\n"
+            '{"name": "Galaxy Watch", "category": "Wearables", "price": "9999.50", "available": "no"}\n',
+            "jsonl",
+        )
+        self.assertIn("2 created, 0 updated, 1 rejected", out)
+        self.assertFalse(Product.objects.get(slug="galaxy-watch").available)
+        self.assertEqual(len(search_ids("galaxy")), 1)
+
+    def test_dry_run_writes_nothing(self):
+        out, _ = self.run_import("name,category,price\nThing,New,1\n", "csv", dry_run=True)
+        self.assertIn("Checked 1 rows", out)
+        self.assertFalse(Product.objects.filter(slug="thing").exists())
+        self.assertFalse(Category.objects.filter(slug="new").exists())
+
+
+class DatasetGeneratorTest(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def generate(self, seed):
+        from .dataset import DatasetGenerator, DatasetSpec
+        spec = DatasetSpec(users=20, categories=3, products=40, orders=60, seed=seed, batch_size=25)
+        return DatasetGenerator(spec).run()
+
+    def test_volumes_and_side_tables(self):
+        from django.contrib.auth import get_user_model
+        from .models import Order, OrderItem
+        orders, items = self.generate(seed=1)
+        self.assertEqual((orders, Order.objects.count()), (60, 60))
+        self.assertEqual(OrderItem.objects.count(), items)
+        self.assertEqual(get_user_model().objects.count(), 20)
+        self.assertEqual(Product.objects.count(), 40)
+        self.assertEqual(sum(Category.objects.values_list("products_total", flat=True)), 40)
+        self.assertGreater(Order.objects.filter(created_at__lt=Order.objects.latest("created_at").created_at).count(), 0)
+
+    def test_deterministic_for_seed(self):
+        from django.contrib.auth import get_user_model
+        from .models import OrderItem
+
+        def snapshot():
+            return (
+                list(Product.objects.order_by("slug").values_list("slug", "price", "discount", "stock")),
+                list(OrderItem.objects.order_by("id").values_list("product__slug", "quantity")),
+            )
+
+        self.generate(seed=7)
+        first = snapshot()
+        OrderItem.objects.all().delete()
+        Product.objects.all().delete()
+        get_user_model().objects.all().delete()
+        Category.objects.all().delete()
+        self.generate(seed=7)
+        self.assertEqual(snapshot(), first)
+
+
+class CartPricingTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name="Phones", slug="phones")
+        self.products = [
+            Product.objects.create(
+                category=category, name=f"P{i}", slug=f"p{i}", price=100, discount=10, stock=10
+            )
+            for i in range(12)
+        ]
+
+    def session_cart(self, count):
+        return {str(p.id): {"quantity": 2} for p in self.products[:count]}
+
+    def test_one_query_for_any_size(self):
+        from .pricing import price_cart
+        for size in (1, 12):
+            with self.assertNumQueries(1):
+                cart = price_cart(self.session_cart(size))
+                self.assertEqual(cart.total_price, Decimal("180.00") * size)
+                self.assertEqual(cart.total_qty, 2 * size)
+                [line.product.image for line in cart]
+
+    def test_missing_and_malformed_lines(self):
+        from .pricing import price_cart
+        cart = price_cart({"999": {"quantity": 1}, "abc": {"quantity": 1}, str(self.products[0].id): "x"})
+        self.assertEqual(cart.lines, [])
+        self.assertEqual(sorted(cart.missing), sorted(["999", "abc", str(self.products[0].id)]))
+
+    def count_view_queries(self, url, size, user=None):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        if user is not None:
+            from .cart import UserCart
+            UserCart(user).clear()
+            UserCart(user).set_many({p.id: 2 for p in self.products[:size]})
+        else:
+            session = self.client.session
+            session["cart"] = self.session_cart(size)
+            session.save()
+        with CaptureQueriesContext(connection) as captured:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(captured)
+
+    def test_views_constant_queries(self):
+        from django.contrib.auth import get_user_model
+        self.assertEqual(self.count_view_queries("/shop/cart/", 1), self.count_view_queries("/shop/cart/", 12))
+        user = get_user_model().objects.create_user("buyer", password="pw")
+        self.client.force_login(user)
+        self.count_view_queries("/shop/checkout/", 1, user)  # creates the profile
+        self.assertEqual(
+            self.count_view_queries("/shop/checkout/", 1, user), self.count_view_queries("/shop/checkout/", 12, user)
+        )
+
+    def test_view_cart_drops_missing_products(self):
+        session = self.client.session
+        session["cart"] = {**self.session_cart(1), "999": {"quantity": 1}}
+        session.save()
+        response = self.client.get("/shop/cart/")
+        self.assertEqual(response.context["total_price"], Decimal("180.00"))
+        self.assertEqual(list(self.client.session["cart"]), [str(self.products[0].id)])
+
+    def test_payment_success_uses_priced_cart(self):
+        import hashlib
+        import hmac
+        from django.test import override_settings
+        from .models import Order
+        session = self.client.session
+        session["cart"] = self.session_cart(2)
+        session.save()
+        signature = hmac.new(b"secret", b"order_1|pay_1", hashlib.sha256).hexdigest()
+        payload = {
+            "razorpay_payment_id": "pay_1", "razorpay_order_id": "order_1", "razorpay_signature": signature,
+            "name": "A", "address": "Street 1", "phone": "999",
+        }
+        with override_settings(RAZORPAY_KEY_SECRET="secret"):
+            response = self.client.post("/shop/payment/success/", payload, content_type="application/json")
+        self.assertEqual(response.json()["status"], "success")
+        order = Order.objects.get()
+        self.assertEqual(order.total_amount, Decimal("360.00"))
+        self.assertEqual(sorted(order.items.values_list("price", "quantity")), [(Decimal("90.00"), 2)] * 2)
+        self.products[0].refresh_from_db()
+        self.assertEqual(self.products[0].stock, 8)
+
+
+class PersistentCartTest(TestCase):
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        cache.clear()
+        category = Category.objects.create(name="Phones", slug="phones")
+        self.a, self.b = [
+            Product.objects.create(category=category, name=f"P{i}", slug=f"p{i}", price=100, stock=10)
+            for i in range(2)
+        ]
+        self.user = get_user_model().objects.create_user("buyer", password="pw")
+
+    def test_logged_in_cart_lives_in_rows(self):
+        from .models import CartItem
+        self.client.force_login(self.user)
+        session_key = self.client.session.session_key
+        self.client.post(f"/shop/cart/add/{self.a.id}/", {"quantity": 2})
+        self.client.post(f"/shop/cart/update/{self.a.id}/", {"quantity": 3})
+        self.assertEqual(list(CartItem.objects.values_list("product_id", "quantity")), [(self.a.id, 3)])
+        self.assertNotIn("cart", self.client.session)
+        self.assertEqual(self.client.session.session_key, session_key)
+        self.assertEqual(self.client.get("/shop/cart/count/").json(), {"count": 3})
+        self.client.get(f"/shop/cart/remove/{self.a.id}/")
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_session_cart_merges_at_login(self):
+        from .cart import UserCart
+        UserCart(self.user).set(self.a.id, 1)
+        self.client.post(f"/shop/cart/add/{self.a.id}/", {"quantity": 2})
+        self.client.post(f"/shop/cart/add/{self.b.id}/", {"quantity": 1})
+        self.assertEqual(self.client.get("/shop/cart/count/").json(), {"count": 3})
+        self.client.login(username="buyer", password="pw")
+        self.assertEqual(UserCart(self.user).lines(), {
+            str(self.a.id): {"quantity": 3}, str(self.b.id): {"quantity": 1},
+        })
+        self.assertNotIn("cart", self.client.session)
+        response = self.client.get("/shop/cart/")
+        self.assertEqual(response.context["total_qty"], 4)
+
+
+class HeaderCountersTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name="Phones", slug="phones")
+        self.product = Product.objects.create(category=category, name="P", slug="p", price=100, stock=10)
+
+    def test_cached_counts_and_invalidation(self):
+        self.client.post(f"/shop/cart/add/{self.product.id}/", {"quantity": 2})
+        response = self.client.get("/shop/counters/")
+        self.assertEqual(response.json(), {"cart": 2, "wishlist": 0, "compare": 0})
+        with self.assertNumQueries(0):
+            cached = self.client.get("/shop/counters/", HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(cached.status_code, 304)
+        self.client.get(f"/shop/compare/add/{self.product.id}/")
+        self.assertEqual(self.client.get("/shop/counters/").json()["compare"], 1)
+
+    def test_user_cart_write_elsewhere_invalidates(self):
+        from django.contrib.auth import get_user_model
+        from .cart import UserCart
+        user = get_user_model().objects.create_user("buyer", password="pw")
+        self.client.force_login(user)
+        self.assertEqual(self.client.get("/shop/counters/").json()["cart"], 0)
+        UserCart(user).set(self.product.id, 3)
+        self.assertEqual(self.client.get("/shop/counters/").json()["cart"], 3)
+
+
+class SessionWriteTest(TestCase):
+    def setUp(self):
+        from .middleware import session_write_stats
+        cache.clear()
+        category = Category.objects.create(name="Phones", slug="phones")
+        self.product = Product.objects.create(category=category, name="P", slug="p", price=100, stock=10)
+        self.stats = session_write_stats
+
+    def saves(self, method, url, data=None):
+        before = self.stats.saves
+        getattr(self.client, method)(url, data or {})
+        return self.stats.saves - before
+
+    def test_unchanged_cart_is_not_written(self):
+        self.assertEqual(self.saves("post", f"/shop/cart/add/{self.product.id}/", {"quantity": 2}), 1)
+        self.assertEqual(self.saves("get", "/shop/cart/"), 0)
+        self.assertEqual(self.saves("post", f"/shop/cart/update/{self.product.id}/", {"quantity": 2}), 0)
+        self.assertEqual(self.saves("post", f"/shop/cart/update/{self.product.id}/", {"quantity": 3}), 1)
+        self.assertEqual(self.saves("get", "/shop/cart/"), 0)
+
+    async def test_async_requests_stay_async(self):
+        from asgiref.sync import iscoroutinefunction
+        from .middleware import SessionWriteMiddleware
+
+        async def view(request):
+            pass
+
+        self.assertTrue(iscoroutinefunction(SessionWriteMiddleware(view)))
+        before = self.stats.requests
+        response = await self.async_client.get("/shop/counters/")
+        self.assertEqual((response.status_code, self.stats.requests - before), (200, 1))
+
+    def test_flash_messages_stay_in_cookie(self):
+        self.saves("post", f"/shop/cart/add/{self.product.id}/", {"quantity": 1})
+        # Removing shows a flash message; only the cart change itself is saved.
+        self.assertEqual(self.saves("get", f"/shop/cart/remove/{self.product.id}/"), 1)
+        self.assertIn("messages", self.client.cookies)
+        self.assertEqual(self.saves("get", "/shop/cart/"), 0)
+
+
+class BulkOrderTest(TestCase):
+    def setUp(self):
+        import tempfile
+        from django.contrib.auth import get_user_model
+        from django.test import override_settings
+        cache.clear()
+        self.media = tempfile.TemporaryDirectory()
+        self.override = override_settings(MEDIA_ROOT=self.media.name)
+        self.override.enable()
+        category = Category.objects.create(name="Phones", slug="phones")
+        self.products = [
+            Product.objects.create(category=category, name=f"P{i}", slug=f"p{i}", price=100, stock=5)
+            for i in range(3)
+        ]
+        self.products[2].available = False
+        self.products[2].save()
+        self.user = get_user_model().objects.create_user("buyer", password="pw")
+        self.client.force_login(self.user)
+
+    def tearDown(self):
+        self.override.disable()
+        self.media.cleanup()
+
+    def csv_upload(self, lines):
+        from django.core.files.uploadedfile import SimpleUploadedFile
+        return SimpleUploadedFile("order.csv", ("\n".join(lines) + "\n").encode(), content_type="text/csv")
+
+    def test_chunked_lookups_and_line_report(self):
+        from .bulk_orders import add_to_cart, check_lines, csv_rows
+        from .cart import UserCart
+        a, b, gone = self.products
+        lines = ["Product ID,Quantity", f"{a.id},2", f"{b.id},9", f"{gone.id},1", "x,1", "", "999,1", f"{b.id},3"]
+        with self.assertNumQueries(2):  # one lookup per chunk of three parsed lines
+            chunks = list(check_lines(csv_rows(self.csv_upload(lines)), chunk_size=3))
+        report = add_to_cart(chunks, UserCart(self.user))
+        self.assertEqual((report.lines, report.added, report.rejected), (6, 2, 4))
+        self.assertEqual(
+            [(r.line, r.error) for r in report.problems],
+            [(3, "only 5 in stock"), (4, "no such product, or it is unavailable"),
+             (5, "product id and quantity must be whole numbers"), (7, "no such product, or it is unavailable")],
+        )
+        self.assertEqual(UserCart(self.user).lines(), {str(a.id): {"quantity": 2}, str(b.id): {"quantity": 3}})
+
+    def test_quick_order_renders_report(self):
+        a = self.products[0]
+        response = self.client.post("/shop/quick-order/", {"product_codes": f"{a.id}:1\nbad"})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["report"].added, 1)
+        self.assertContains(response, "expected a product id and a quantity")
+
+    def test_large_upload_runs_as_job(self):
+        from unittest import mock
+        from . import bulk_orders
+        from .models import BulkOrderJob
+        a = self.products[0]
+        with mock.patch.object(bulk_orders, "BACKGROUND_BYTES", 10):
+            response = self.client.post("/shop/bulk-order/", {"bulk_file": self.csv_upload([f"{a.id},1"] * 3 + ["0,1"])})
+        job = response.context["job"]
+        self.assertEqual(self.client.get(f"/shop/bulk-order/jobs/{job.id}/").json()["status"], "PENDING")
+        bulk_orders.run_job(job.id)
+        progress = self.client.get(f"/shop/bulk-order/jobs/{job.id}/").json()
+        self.assertEqual((progress["status"], progress["added"], progress["rejected"]), ("DONE", 1, 1))
+        self.assertEqual(progress["report"], [[4, "0,1", "no such product, or it is unavailable"]])
+        self.assertEqual(self.client.get("/shop/counters/").json()["cart"], 1)
+        job = BulkOrderJob.objects.get()
+        self.assertEqual((job.processed_lines, job.upload.name), (4, ""))
+        self.assertFalse(bulk_orders.run_job(job.id))  # finished jobs are not claimed again
+
+    def test_command_resumes_stranded_jobs(self):
+        import os
+        from datetime import timedelta
+        from django.core.management import call_command
+        from django.utils import timezone
+        from . import bulk_orders
+        from .models import BulkOrderJob
+        a = self.products[0]
+        pending = bulk_orders.start_job(self.user, self.csv_upload([f"{a.id},2"]))
+        stalled = bulk_orders.start_job(self.user, self.csv_upload([f"{a.id},3"]))
+        live = bulk_orders.start_job(self.user, self.csv_upload([f"{a.id},4"]))
+        BulkOrderJob.objects.filter(pk=stalled.pk).update(status="RUNNING", updated=timezone.now() - timedelta(hours=1))
+        BulkOrderJob.objects.filter(pk=live.pk).update(status="RUNNING")
+        path = pending.upload.path
+        out = io.StringIO()
+        call_command("run_bulk_orders", stdout=out)
+        self.assertIn("Ran 2 bulk order jobs; 0 failed.", out.getvalue())
+        statuses = dict(BulkOrderJob.objects.values_list("pk", "status"))
+        self.assertEqual([statuses[job.pk] for job in (pending, stalled, live)], ["DONE", "DONE", "RUNNING"])
+        self.assertFalse(os.path.exists(path))
+
+
+class StockReservationTest(TestCase):
+    def setUp(self):
+        from django.contrib.auth import get_user_model
+        cache.clear()
+        category = Category.objects.create(name="Phones", slug="phones")
+        self.product = Product.objects.create(category=category, name="P", slug="p", price=100, stock=3)
+        User = get_user_model()
+        self.alice = User.objects.create_user("alice", password="pw")
+        self.bob = User.objects.create_user("bob", password="pw")
+
+    def lines(self, quantity):
+        from .pricing import CartLine
+        return [CartLine(product=self.product, quantity=quantity, unit_price=Decimal("100"))]
+
+    def test_holds_cannot_oversell(self):
+        from . import reservations
+        reservations.hold(self.alice, self.lines(2))
+        with self.assertRaises(reservations.InsufficientStock):
+            reservations.hold(self.bob, self.lines(2))
+        self.assertEqual(reservations.available_to_sell([self.product.id]), {self.product.id: 1})
+        # Re-checking out replaces the user's own hold instead of stacking on it.
+        reservations.hold(self.alice, self.lines(3))
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved, 3)
+
+    def test_own_holds_stay_available_to_their_shopper(self):
+        from . import reservations
+        from .cart import UserCart
+        UserCart(self.alice).set(self.product.id, 2)
+        reservations.hold(self.alice, self.lines(2))
+        self.assertEqual(reservations.available_to_sell([self.product.id], user=self.bob), {self.product.id: 1})
+        self.assertEqual(reservations.available_to_sell([self.product.id], user=self.alice), {self.product.id: 3})
+        self.client.force_login(self.alice)
+        self.client.post(f"/shop/cart/add/{self.product.id}/", {"quantity": 1})
+        self.assertEqual(UserCart(self.alice).quantity(self.product.id), 3)
+
+    def test_quantity_changes_and_bulk_orders_respect_holds(self):
+        from . import reservations
+        from .bulk_orders import check_lines
+        from .cart import UserCart
+        reservations.hold(self.alice, self.lines(2))
+        UserCart(self.bob).set(self.product.id, 1)
+        self.client.force_login(self.bob)
+        self.client.post(f"/shop/cart/update/{self.product.id}/", {"quantity": 2})
+        self.assertEqual(UserCart(self.bob).quantity(self.product.id), 1)
+        [checked] = check_lines([(1, "line", [str(self.product.id), "2"])])
+        self.assertEqual(checked[0].error, "only 1 in stock")
+
+    def test_expired_holds_are_swept(self):
+        from datetime import timedelta
+        from django.core.management import call_command
+        from django.utils import timezone
+        from . import reservations
+        from .models import StockReservation
+        reservations.hold(self.alice, self.lines(3))
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(reservations.available_to_sell([self.product.id]), {self.product.id: 3})
+        call_command("release_expired_holds", stdout=io.StringIO())
+        self.assertFalse(StockReservation.objects.exists())
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.reserved, 0)
+
+    def test_full_save_keeps_reserved(self):
+        from . import reservations
+        stale = Product.objects.get(pk=self.product.pk)
+        reservations.hold(self.alice, self.lines(2))
+        stale.name = "Renamed"
+        stale.save()
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.name, self.product.reserved), ("Renamed", 2))
+
+    def test_checkout_holds_and_payment_releases(self):
+        from django.test import override_settings
+        from . import reservations
+        from .cart import UserCart
+        from .models import StockReservation
+        UserCart(self.alice).set(self.product.id, 2)
+        UserCart(self.bob).set(self.product.id, 2)
+        payload = {"name": "A", "address": "Street 1", "phone": "999"}
+        with override_settings(PAYMENT_GATEWAY="fake", DEBUG=True):
+            self.client.force_login(self.alice)
+            order_id = self.client.post("/shop/checkout/", payload, content_type="application/json").json()["razorpay_order_id"]
+            self.client.force_login(self.bob)
+            response = self.client.post("/shop/checkout/", payload, content_type="application/json")
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(list(StockReservation.objects.values_list("reference", "quantity")), [(order_id, 2)])
+        self.assertEqual(reservations.release(order_id), 2)
+        self.assertEqual(reservations.available_to_sell([self.product.id]), {self.product.id: 3})
+
+
+class PlaceOrderTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name="Phones", slug="phones")
+        self.a, self.b = [
+            Product.objects.create(category=category, name=f"P{i}", slug=f"p{i}", price=100, stock=2)
+            for i in range(2)
+        ]
+
+    def test_all_or_nothing(self):
+        from .models import Order
+        from .orders import OutOfStock, place_order
+        from .pricing import price_cart
+        cart = price_cart({str(self.a.id): {"quantity": 1}, str(self.b.id): {"quantity": 3}})
+        with self.assertRaises(OutOfStock):
+            place_order(cart, customer_name="A", customer_email="")
+        self.a.refresh_from_db()
+        self.assertEqual((self.a.stock, Order.objects.count()), (2, 0))
+
+    def test_batched_writes(self):
+        from .orders import place_order
+        from .pricing import price_cart
+        cart = price_cart({str(self.a.id): {"quantity": 1}, str(self.b.id): {"quantity": 2}})
+        # savepoint, two stock updates, order, items, release; then the facet index re-reads both rows
+        with self.assertNumQueries(7), self.captureOnCommitCallbacks(execute=True):
+            order = place_order(cart, customer_name="A", customer_email="")
+        self.assertEqual(sorted(order.items.values_list("quantity", flat=True)), [1, 2])
+        self.b.refresh_from_db()
+        self.assertEqual(self.b.stock, 0)
+
+    def test_other_checkouts_holds_are_not_taken(self):
+        from django.contrib.auth import get_user_model
+        from . import reservations
+        from .orders import OutOfStock, place_order
+        from .pricing import price_cart
+        bob = get_user_model().objects.create_user("bob", password="pw")
+        hold = reservations.hold(bob, price_cart({str(self.a.id): {"quantity": 2}}).lines)
+        # A buyer whose own hold already lapsed cannot take the units Bob holds.
+        with self.assertRaises(OutOfStock):
+            place_order(price_cart({str(self.a.id): {"quantity": 1}}), customer_name="A", customer_email="")
+        reservations.release(hold)
+        place_order(price_cart({str(self.a.id): {"quantity": 1}}), customer_name="A", customer_email="")
+
+
+class ConcurrentCheckoutTest(TransactionTestCase):
+    def test_no_oversell_under_threads(self):
+        from django.core.management import call_command
+        out = io.StringIO()
+        call_command("benchmark_checkout", threads=8, buyers=60, stock=20, stdout=out)
+        self.assertIn("sold: 20  stock left: 0  oversold: 0", out.getvalue())
+        self.assertIn("gave_up: 0", out.getvalue())
+
+
+def payment_callback(client, order_id="order_1", payment_id="pay_1"):
+    """POST a correctly signed payment_success callback"""
+    import hashlib
+    import hmac
+    from django.test import override_settings
+    signature = hmac.new(b"secret", f"{order_id}|{payment_id}".encode(), hashlib.sha256).hexdigest()
+    payload = {
+        "razorpay_payment_id": payment_id, "razorpay_order_id": order_id, "razorpay_signature": signature,
+        "name": "A", "address": "Street 1", "phone": "999",
+    }
+    with override_settings(RAZORPAY_KEY_SECRET="secret"):
+        return client.post("/shop/payment/success/", payload, content_type="application/json")
+
+
+class PaymentIdempotencyTest(TestCase):
+    def setUp(self):
+        cache.clear()
+        category = Category.objects.create(name="Phones", slug="phones")
+        self.product = Product.objects.create(category=category, name="P", slug="p", price=100, stock=5)
+
+    def test_retries_replay_the_first_response(self):
+        from .models import Order
+        session = self.client.session
+        session["cart"] = {str(self.product.id): {"quantity": 2}}
+        session.save()
+        first = payment_callback(self.client)
+        self.assertEqual(first.json()["status"], "success")
+        # The cart is gone after the first call; the retry must not need it.
+        with self.assertNumQueries(2):  # the session, then the key lookup
+            retry = payment_callback(self.client)
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(Order.objects.count(), 1)
+        self.product.refresh_from_db()
+        self.assertEqual(self.product.stock, 3)
+
+    def test_sold_out_payment_is_kept_for_refund(self):
+        from .models import Order, OutboxEmail
+        session = self.client.session
+        session["cart"] = {str(self.product.id): {"quantity": 6}}
+        session.save()
+        first = payment_callback(self.client)
+        self.assertEqual(first.status_code, 409)
+        order = Order.objects.get()
+        self.assertEqual(first.json()["order_id"], order.id)
+        self.assertEqual(
+            (order.paid, order.status, order.payment_status, order.payment_id), (True, "CANCELLED", "Refund Pending", "pay_1")
+        )
+        self.assertFalse(order.items.exists())
+        self.assertFalse(OutboxEmail.objects.exists())  # guest checkout: no address to write to
+        retry = payment_callback(self.client)
+        self.assertEqual((retry.status_code, retry.json()), (409, first.json()))
+        self.product.refresh_from_db()
+        self.assertEqual((self.product.stock, Order.objects.count()), (5, 1))
+
+    def test_unique_payment_order(self):
+        from django.db import IntegrityError, transaction
+        from .models import Order
+        Order.objects.create(customer_name="A", customer_email="", payment_order_id="order_1")
+        Order.objects.create(customer_name="B", customer_email="", payment_order_id="")
+        Order.objects.create(customer_name="C", customer_email="", payment_order_id="")
+        with self.assertRaises(IntegrityError), transaction.atomic():
+            Order.objects.create(customer_name="D", customer_email="", payment_order_id="order_1")
+
+
+class PaymentConstraintMigrationTest(TransactionTestCase):
+    def test_duplicate_orders_are_cleared_before_the_constraints(self):
+        from django.db import connection
+        from django.db.migrations.executor import MigrationExecutor
+        before, after = [("shop", "0023_stock_reservations")], [("shop", "0024_payment_idempotency")]
+        executor = MigrationExecutor(connection)
+        executor.migrate(before)
+        try:
+            Order = executor.loader.project_state(before).apps.get_model("shop", "Order")
+            paid = {"customer_name": "A", "customer_email": "", "payment_order_id": "order_1", "payment_id": "pay_1"}
+            first, retry = Order.objects.create(**paid), Order.objects.create(**paid)
+            other = Order.objects.create(customer_name="B", customer_email="", payment_order_id="order_2")
+            executor = MigrationExecutor(connection)
+            executor.migrate(after)
+            Order = executor.loader.project_state(after).apps.get_model("shop", "Order")
+            rows = dict(Order.objects.values_list("pk", "payment_order_id"))
+            self.assertEqual(rows, {first.pk: "order_1", retry.pk: None, other.pk: "order_2"})
+            self.assertIn(f"Duplicate of order #{first.pk}", Order.objects.get(pk=retry.pk).notes)
+        finally:
+            executor = MigrationExecutor(connection)
+            executor.migrate(executor.loader.graph.leaf_nodes())
+
+
+class OutboxTest(TestCase):
+    def test_payment_queues_and_worker_sends(self):
+        from django.contrib.auth import get_user_model
+        from django.core import mail
+        from django.core.management import call_command
+        from .models import OutboxEmail
+        cache.clear()
+        category = Category.objects.create(name="Phones", slug="phones")
+        product = Product.objects.create(category=category, name="P", slug="p", price=100, stock=5)
+        user = get_user_model().objects.create_user("buyer", email="buyer@example.com", password="pw")
+        from .cart import UserCart
+        self.client.force_login(user)
+        UserCart(user).set(product.id, 1)
+        response = payment_callback(self.client)
+        self.assertEqual(response.json()["status"], "success")
+        self.assertEqual(mail.outbox, [])
+        self.assertEqual(OutboxEmail.objects.get().to, ["buyer@example.com"])
+        call_command("run_outbox", stdout=io.StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn(f"Order #{response.json()['order_id']}", mail.outbox[0].subject)
+        self.assertEqual(OutboxEmail.objects.get().status, "SENT")
+
+    def test_failures_back_off_then_give_up(self):
+        from datetime import timedelta
+        from unittest import mock
+        from django.utils import timezone
+        from . import outbox
+        from .models import OutboxEmail
+        outbox.enqueue("Hi", "Body", ["a@example.com"])
+        now = timezone.now()
+        with mock.patch("django.core.mail.EmailMessage.send", side_effect=OSError("refused")):
+            self.assertEqual(outbox.send_due(now=now), (0, 1))
+            self.assertEqual(outbox.send_due(now=now), (0, 0))  # not due until the backoff passes
+            email = OutboxEmail.objects.get()
+            self.assertEqual((email.attempts, email.status, email.last_error), (1, "PENDING", "OSError: refused"))
+            self.assertEqual(email.next_attempt_at, now + timedelta(seconds=outbox.BACKOFF_SECONDS))
+            for _ in range(outbox.MAX_ATTEMPTS - 1):
+                now += timedelta(hours=7)
+                outbox.send_due(now=now)
+        self.assertEqual(OutboxEmail.objects.get().status, "FAILED")
+
+    def test_each_email_is_claimed_by_one_worker(self):
+        import uuid
+        from unittest import mock
+        from django.utils import timezone
+        from . import outbox
+        for i in range(3):
+            outbox.enqueue(f"Hi {i}", "Body", ["a@example.com"])
+        now = timezone.now()
+        won, raced, real_uuid4 = [], [], uuid.uuid4
+
+        def other_worker_wins():
+            # Another worker claims everything between this one's select and update.
+            if not raced:
+                raced.append(True)
+                won.extend(outbox._claim(3, now))
+            return real_uuid4()
+
+        with mock.patch.object(outbox.uuid, "uuid4", side_effect=other_worker_wins):
+            self.assertEqual(outbox._claim(3, now), [])
+        self.assertEqual(len(won), 3)
+        self.assertEqual(outbox._claim(3, now), [])  # leased, so not due again yet
+
+
+class PaymentGatewayTest(TestCase):
+    def test_fake_gateway_needs_debug_and_signs_with_a_private_secret(self):
+        import hashlib
+        import hmac
+        from django.test import override_settings
+        from .gateways import GatewayError, get_gateway
+        with override_settings(PAYMENT_GATEWAY="fake"), self.assertRaises(GatewayError):
+            get_gateway()
+        with override_settings(PAYMENT_GATEWAY="fake", DEBUG=True):
+            gateway = get_gateway()
+            order = gateway.create_order(100)
+            payment_id, signature = gateway.pay(order["id"])
+            self.assertTrue(gateway.verify_signature(order["id"], payment_id, signature))
+            forged = hmac.new(b"fake_secret", f"{order['id']}|{payment_id}".encode(), hashlib.sha256).hexdigest()
+            self.assertFalse(gateway.verify_signature(order["id"], payment_id, forged))
+
+    def test_circuit_breaker_fails_fast(self):
+        from .gateways import CircuitBreaker, FakeGateway, GatewayError, GatewayUnavailable
+        now = [0.0]
+        gateway = FakeGateway()
+        gateway.breaker = CircuitBreaker(threshold=2, reset_seconds=30, clock=lambda: now[0])
+        calls = []
+
+        def flaky(*args):
+            calls.append(args)
+            raise ConnectionError("down")
+
+        gateway._create_order = flaky
+        for _ in range(2):
+            with self.assertRaises(GatewayError):
+                gateway.create_order(100)
+        with self.assertRaises(GatewayUnavailable):
+            gateway.create_order(100)
+        self.assertEqual(len(calls), 2)
+        now[0] = 31.0
+        del gateway._create_order  # recovered
+        self.assertTrue(gateway.create_order(100)["id"].startswith("order_fake"))
+        self.assertEqual(gateway.breaker.state, "closed")
+        stats = gateway.stats("create_order").as_dict()
+        self.assertGreaterEqual(stats["rejected"], 1)
+
+    def test_checkout_maps_gateway_errors(self):
+        from unittest import mock
+        from django.contrib.auth import get_user_model
+        from django.test import override_settings
+        from .cart import UserCart
+        from .gateways import Gateway, GatewayError, GatewayRejected
+        with self.assertRaises(TypeError):
+            Gateway("key", "secret")  # abstract
+        category = Category.objects.create(name="Phones", slug="phones")
+        product = Product.objects.create(category=category, name="P", slug="p", price=100, stock=5)
+        user = get_user_model().objects.create_user("buyer", password="pw")
+        self.client.force_login(user)
+        UserCart(user).set(product.id, 1)
+        details = {"name": "A", "address": "Street 1", "phone": "999"}
+        for exc, status in ((GatewayRejected("BAD_REQUEST_ERROR: secret detail"), 502), (GatewayError("timed out"), 503)):
+            with override_settings(PAYMENT_GATEWAY="fake", DEBUG=True), mock.patch(
+                "shop.gateways.FakeGateway.create_order", side_effect=exc
+            ):
+                response = self.client.post("/shop/checkout/", details, content_type="application/json")
+            self.assertEqual(response.status_code, status)
+            self.assertNotIn(str(exc), response.json()["error"])
+        product.refresh_from_db()
+        self.assertEqual(product.reserved, 0)
+
+    def test_session_pool_and_timeout(self):
+        from unittest import mock
+        from .gateways import TimeoutSession
+        session = TimeoutSession(timeout=(1, 2), pool_size=7)
+        self.assertEqual(session.get_adapter("https://api.razorpay.com")._pool_maxsize, 7)
+        with mock.patch("requests.Session.request") as request:
+            session.get("https://api.razorpay.com/v1/orders")
+        self.assertEqual(request.call_args.kwargs["timeout"], (1, 2))
+
+    def test_offline_checkout_to_payment(self):
+        from django.contrib.auth import get_user_model
+        from django.test import override_settings
+        from .cart import UserCart
+        from .gateways import get_gateway
+        from .models import Order
+        cache.clear()
+        category = Category.objects.create(name="Phones", slug="phones")
+        product = Product.objects.create(category=category, name="P", slug="p", price=100, stock=5)
+        user = get_user_model().objects.create_user("buyer", password="pw")
+        self.client.force_login(user)
+        UserCart(user).set(product.id, 2)
+        details = {"name": "A", "address": "Street 1", "phone": "999"}
+        with override_settings(PAYMENT_GATEWAY="fake", DEBUG=True):
+            checkout = self.client.post("/shop/checkout/", details, content_type="application/json").json()
+            self.assertEqual(checkout["razorpay_amount"], 20000)
+            payment_id, signature = get_gateway().pay(checkout["razorpay_order_id"])
+            response = self.client.post("/shop/payment/success/", {
+                **details, "razorpay_order_id": checkout["razorpay_order_id"],
+                "razorpay_payment_id": payment_id, "razorpay_signature": signature,
+            }, content_type="application/json")
+        self.assertEqual(response.json()["status"], "success")
+        self.assertEqual(Order.objects.get().payment_order_id, checkout["razorpay_order_id"])
+        product.refresh_from_db()
+        self.assertEqual((product.stock, product.reserved), (3, 0))
@@ -1,5 +1,5 @@
 from django.urls import path
-from . import views
+from . import api, views
 from django.contrib import admin 
 
 app_name = "shop"
@@ -7,15 +7,24 @@ app_name = "shop"
 urlpatterns = [
     path("", views.home, name="home"),
     path("about/", views.about, name="about"),
+    path("cache/stats/", views.cache_stats, name="cache_stats"),
 
     # Products
     path("products/", views.product_list, name="product_list"),
     path("category/<slug:category_slug>/", views.product_list, name="product_list_by_category"),
     path("product/<int:id>/<slug:slug>/", views.product_detail, name="product_detail"),
+    path("search/", views.search, name="search"),
+    path("autocomplete/", views.autocomplete_view, name="autocomplete"),
+
+    # JSON catalog API
+    path("api/products/", api.product_list, name="api_product_list"),
+    path("api/products/<int:id>/", api.product_detail, name="api_product_detail"),
+    path("api/categories/", api.category_list, name="api_category_list"),
 
     # Cart
     path("cart/", views.view_cart, name="view_cart"),
     path("cart/count/", views.cart_count, name="cart_count"),
+    path("counters/", views.header_counters, name="header_counters"),
     path("cart/add/<int:product_id>/", views.add_to_cart, name="add_to_cart"),
     path("cart/remove/<int:product_id>/", views.remove_from_cart, name="remove_from_cart"),
     path("cart/update/<int:product_id>/", views.update_quantity, name="update_quantity"),
@@ -47,6 +56,7 @@ urlpatterns = [
     path("compare/add/<int:product_id>/", views.add_to_compare, name="add_to_compare"),
     path("quick-order/", views.quick_order, name="quick_order"),
     path("bulk-order/", views.bulk_order, name="bulk_order"),
+    path("bulk-order/jobs/<int:job_id>/", views.bulk_order_job, name="bulk_order_job"),
 
     # FIXED section
     path("payment/success/", views.payment_success, name="payment_success"),  # ✅ Keep only this
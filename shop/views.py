@@ -1,68 +1,160 @@
-import requests
 from datetime import timedelta
 from django.utils import timezone
 from django.shortcuts import render, get_object_or_404, redirect
 from django.contrib.auth.decorators import login_required
 from django.contrib import messages
-from django.http import JsonResponse
+from django.http import JsonResponse, Http404
+from django.contrib.admin.views.decorators import staff_member_required
 from django.views.decorators.csrf import csrf_exempt
-from django.conf import settings
-from django.core.mail import send_mail
-import json, hmac, hashlib
-from .models import Category, Product, Order, OrderItem
+from django.views.decorators.http import require_safe
+from django.utils.cache import patch_vary_headers
+import csv, json
+from .models import BulkOrderJob, Category, Product, Order
+from .pagination import KeysetPage, CATALOG_PAGE_SIZE, paginate_request
+from .search import search_ids
+from . import autocomplete, bestsellers, bulk_orders, counters, facets, idempotency, outbox, reservations
+from .recommendations import cached_recommendations
+from .categories import category_nav, get_category
+from .caching import CacheStats, get_product_detail, render_product_detail
+from .cart import get_cart
+from .middleware import session_write_stats
+from .gateways import GatewayError, GatewayRejected, LatencyStats, get_gateway
+from .orders import OutOfStock, place_order, record_unfilled
+from .pricing import price_cart
+from .api import make_etag, not_modified
 from users.models import UserProfile
 from shop.models import Wishlist  #
 
-import razorpay
 
 # -------------------------------
 # Home & About
 # -------------------------------
 def home(request):
-    return render(request, "shop/home.html")
+    return render(request, "shop/home.html", {"bestsellers": bestsellers.top_products(limit=10)})
 
 def about(request):
     return render(request, "shop/about.html")
 
+# -------------------------------
+# Cache Stats (staff only)
+# -------------------------------
+@staff_member_required
+def cache_stats(request):
+    """Per-process cache, session write and payment gateway counters for staff"""
+    return JsonResponse({
+        **CacheStats.snapshot(),
+        "session_writes": session_write_stats.as_dict(),
+        "payment_gateway": LatencyStats.snapshot(),
+    })
+
 # -------------------------------
 # Cart Count API
 
 # -------------------------------
 def cart_count(request):
     """Return cart item count as JSON"""
-    cart = request.session.get("cart", {})
-    total_qty = sum(int(item.get("quantity", 0)) for item in cart.values() if isinstance(item, dict))
-    return JsonResponse({"count": total_qty})
+    return JsonResponse({"count": get_cart(request).count()})
+
+@require_safe
+async def header_counters(request):
+    """Cart, wishlist and compare counts for the header in one cached response"""
+    counts = await counters.aget_counts(request)
+    etag = make_etag("counters", counts["cart"], counts["wishlist"], counts["compare"])
+    response = not_modified(request, etag) or JsonResponse(counts)
+    response["ETag"] = etag
+    response["Cache-Control"] = "private, max-age=0, must-revalidate"
+    patch_vary_headers(response, ["Cookie"])
+    return response
 
 # -------------------------------
 # Product Views
 # -------------------------------
 def product_list(request, category_slug=None):
     category = None
-    categories = Category.objects.all()
+    categories = category_nav()
     products = Product.objects.filter(available=True)
 
+    selected = facets.selected_from_request(request, categories)
     if category_slug:
-        category = get_object_or_404(Category, slug=category_slug)
-        products = products.filter(category=category)
+        category = get_category(category_slug)
+        if category is None:
+            raise Http404("No Category matches the given query.")
+        selected["category"] = [category.id]
 
+    counts = facets.get_index().counts(selected)
+    products = facets.filter_queryset(products, selected)
+
+    page = paginate_request(request, products)
     return render(request, "products/product_list.html", {
         "category": category,
         "categories": categories,
-        "products": products,
+        "products": page.object_list,
+        "page": page,
+        "facets": facets.facet_options(counts, categories, selected),
+        "top_sellers": bestsellers.top_products(category=category, limit=5) if category else [],
+        "in_stock_selected": "in_stock" in selected,
     })
 
 def product_detail(request, id, slug):
-    product = get_object_or_404(Product, id=id, slug=slug, available=True)
-    return render(request, "products/product_detail.html", {"product": product})
+    cached = get_product_detail(id)
+    if cached is None or cached[0].slug != slug or not cached[0].available:
+        raise Http404("No Product matches the given query.")
+    product, body = cached
+    return render(request, "products/product_detail.html", {
+        "product": product,
+        "detail_body": render_product_detail(body, request),
+        "recommendations": cached_recommendations(product.pk),
+    })
+
+# -------------------------------
+# Autocomplete (header search box)
+# -------------------------------
+def autocomplete_view(request):
+    """Top products and brands for a prefix, served from the in-memory index"""
+    try:
+        limit = max(1, min(int(request.GET.get("limit", 8)), 20))
+    except ValueError:
+        limit = 8
+    response = JsonResponse(autocomplete.suggest(request.GET.get("q", ""), limit))
+    response["Cache-Control"] = "public, max-age=60"
+    return response
+
+# -------------------------------
+# Search
+# -------------------------------
+def search(request):
+    """Full-text product search ranked by relevance"""
+    query = request.GET.get("q", "").strip()
+    per_page = CATALOG_PAGE_SIZE
+    try:
+        if request.GET.get("before"):
+            offset = max(0, int(request.GET["before"]) - per_page)
+        else:
+            offset = max(0, int(request.GET.get("after", 0)))
+    except ValueError:
+        offset = 0
+
+    ids = search_ids(query, limit=per_page + 1, offset=offset)
+    page = KeysetPage(object_list=[], sort="relevance", per_page=per_page, query=request.GET.copy())
+    if len(ids) > per_page:
+        ids = ids[:per_page]
+        page.next_cursor = str(offset + per_page)
+    if offset:
+        page.prev_cursor = str(offset)
+    found = Product.objects.in_bulk(ids)
+    page.object_list = [found[pk] for pk in ids if pk in found]
+
+    return render(request, "products/product_list.html", {
+        "products": page.object_list,
+        "page": page,
+        "query": query,
+    })
 # -------------------------------
 # Payment Success (Razorpay callback)
 # -------------------------------
 @csrf_exempt
 def payment_success(request):
     if request.method == "POST":
-        import json, hmac, hashlib
-        from django.contrib.auth import get_user_model
         data = json.loads(request.body)
         # Extract payment and address info
         razorpay_payment_id = data.get("razorpay_payment_id")
@@ -73,39 +165,22 @@ def payment_success(request):
         phone_number = data.get("phone", "").strip()
         user = request.user if request.user.is_authenticated else None
         # Razorpay signature verification
-        key_secret = getattr(settings, 'RAZORPAY_KEY_SECRET', None)
-        if not (razorpay_payment_id and razorpay_order_id and razorpay_signature and key_secret):
+        if not (razorpay_payment_id and razorpay_order_id and razorpay_signature):
             return JsonResponse({"status": "error", "error": "Missing payment data."}, status=400)
-        msg = f"{razorpay_order_id}|{razorpay_payment_id}"
-        generated_signature = hmac.new(
-            key_secret.encode(),
-            msg.encode(),
-            hashlib.sha256
-        ).hexdigest()
-        if generated_signature != razorpay_signature:
+        if not get_gateway().verify_signature(razorpay_order_id, razorpay_payment_id, razorpay_signature):
             return JsonResponse({"status": "error", "error": "Payment signature verification failed."}, status=400)
-        # Get cart from session
-        cart = request.session.get("cart", {})
-        if not cart or not name or not address or not phone_number:
+        # Gateways and browsers retry this callback: answer repeats with the first response.
+        idempotency_key = f"razorpay:{razorpay_order_id}"
+        replayed = idempotency.replay(idempotency_key)
+        if replayed is not None:
+            return replayed
+        # Price the cart and create the order
+        stored_cart = get_cart(request)
+        cart = price_cart(stored_cart.lines())
+        if not cart.lines or not name or not address or not phone_number:
             return JsonResponse({"status": "error", "error": "Missing data or cart empty."}, status=400)
-        # Calculate total and create order
-        cart_items, total_price = [], 0
-        from .models import Product, Order, OrderItem
-        for product_id, item in cart.items():
-            try:
-                product = Product.objects.get(id=product_id)
-            except Product.DoesNotExist:
-                continue
-            qty = int(item.get("quantity", 1))
-            # Use actual product price with discount calculation
-            if product.discount > 0:
-                discounted_price = product.price - (product.price * (product.discount / 100))
-            else:
-                discounted_price = product.price
-            line_total = discounted_price * qty
-            cart_items.append({"product": product, "quantity": qty, "total": line_total})
-            total_price += line_total
-        order = Order.objects.create(
+        placed = []
+        order_fields = dict(
             user=user,
             customer_name=name,
             customer_email=user.email if user else "",
@@ -115,34 +190,34 @@ def payment_success(request):
             city="",
             state="",
             postal_code="",
-            total_amount=total_price,
             payment_method="razorpay",
             payment_id=razorpay_payment_id,
             payment_signature=razorpay_signature,
             payment_order_id=razorpay_order_id,
         )
-        # Send order confirmation email (plain text)
-        if order.customer_email:
-            subject = f"Order Confirmation - Gadget Shop (Order #{order.id})"
-            message = (
-                f"Dear {order.customer_name},\n\n"
-                f"Thank you for your order! Your payment was successful.\n\n"
-                f"Order Number: {order.id}\n"
-                f"Total Amount: ₹{order.total_amount}\n"
-                f"Status: {order.get_status_display()}\n\n"
-                f"We'll notify you when your order is shipped.\n\n"
-                f"Thank you for shopping with us!\nGadget Shop Team"
-            )
-            send_mail(subject, message, None, [order.customer_email], fail_silently=True)
-        for ci in cart_items:
-            OrderItem.objects.create(
-                order=order,
-                product=ci["product"],
-                price=ci["product"].price - (ci["product"].price * (ci["product"].discount / 100)) if ci["product"].discount > 0 else ci["product"].price,
-                quantity=ci["quantity"],
-            )
-            ci["product"].stock -= ci["quantity"]
-            ci["product"].save()
+
+        def finalize():
+            try:
+                order = place_order(cart, hold_reference=razorpay_order_id, **order_fields)
+            except OutOfStock as exc:
+                # The payment is already captured: keep it on record for a refund.
+                order = record_unfilled(cart, str(exc), hold_reference=razorpay_order_id, **order_fields)
+                outbox.refund_notice(order)
+                return {
+                    "status": "error",
+                    "error": f"{exc} Your payment will be refunded.",
+                    "order_id": order.id,
+                }, 409
+            # Queued in the order's transaction; run_outbox sends it.
+            outbox.order_confirmation(order)
+            placed.append(order)
+            return {"status": "success", "order_id": order.id}, 200
+
+        response = idempotency.run_once(idempotency_key, finalize)
+        if not placed or response.has_header("Idempotent-Replayed"):
+            # No order, or a concurrent copy of this callback won the race.
+            return response
+        order = placed[0]
         # Optionally update user's profile address
         if user:
             try:
@@ -151,38 +226,24 @@ def payment_success(request):
                 profile.save()
             except Exception:
                 pass
-        request.session["cart"] = {}
-        return JsonResponse({"status": "success", "order_id": order.id})
+        stored_cart.clear()
+        return response
     return JsonResponse({"error": "Invalid request"}, status=400)
 
 # -------------------------------
-# Cart (session-based)
+# Cart (session for guests, CartItem rows once logged in)
 # -------------------------------
 def view_cart(request):
-    cart = request.session.get("cart", {})
-    cart_items, total_price, total_qty = [], 0, 0
-    updated_cart = cart.copy()
-
-    for product_id, item in cart.items():
-        try:
-            product = Product.objects.get(id=product_id)
-        except Product.DoesNotExist:
-            updated_cart.pop(product_id, None)
-            continue
-
-        qty = int(item.get("quantity", 1))
-        # Use actual product price with discount calculation
-        if product.discount > 0:
-            discounted_price = product.price - (product.price * (product.discount / 100))
-        else:
-            discounted_price = product.price
-        line_total = discounted_price * qty
-        cart_items.append({"product": product, "quantity": qty, "total": line_total})
-        total_price += line_total
-        total_qty += qty
-
-    request.session["cart"] = updated_cart
-    return render(request, "shop/cart.html", {"cart_items": cart_items, "total_price": total_price, "total_qty": total_qty})
+    stored_cart = get_cart(request)
+    cart = price_cart(stored_cart.lines())
+    if cart.missing:
+        # Drop lines whose product is gone; only then is the cart written.
+        stored_cart.remove(*cart.missing)
+    return render(request, "shop/cart.html", {
+        "cart_items": cart.lines,
+        "total_price": cart.total_price,
+        "total_qty": cart.total_qty,
+    })
 
 def _parse_qty(request, default=1):
     raw = request.POST.get("quantity") or request.POST.get("qty") or request.GET.get("quantity")
@@ -196,22 +257,22 @@ def add_to_cart(request, product_id):
     product = get_object_or_404(Product, id=product_id, available=True)
     qty = _parse_qty(request, default=1)
     
-    # Check stock availability
-    if product.stock < qty:
-        messages.error(request, f"Sorry, only {product.stock} items available in stock.")
+    # Check stock availability (units held by other shoppers' checkouts are not for sale)
+    available = reservations.available_to_sell([product.id], user=request.user).get(product.id, 0)
+    if available < qty:
+        messages.error(request, f"Sorry, only {available} items available in stock.")
         return redirect("products:product_detail", pk=product.id)
     
-    cart = request.session.get("cart", {})
-    current = int(cart.get(str(product_id), {}).get("quantity", 0))
+    cart = get_cart(request)
+    current = cart.quantity(product_id)
     new_quantity = current + qty
     
     # Check if total quantity exceeds stock
-    if new_quantity > product.stock:
-        messages.error(request, f"Cannot add {qty} items. Only {product.stock - current} more items available.")
+    if new_quantity > available:
+        messages.error(request, f"Cannot add {qty} items. Only {max(available - current, 0)} more items available.")
         return redirect("products:product_detail", pk=product.id)
     
-    cart[str(product_id)] = {"quantity": new_quantity}
-    request.session["cart"] = cart
+    cart.set(product_id, new_quantity)
     messages.success(request, f"Added {qty} {product.name}(s) to your cart.")
     
     # Return JSON response for AJAX requests
@@ -219,7 +280,7 @@ def add_to_cart(request, product_id):
         return JsonResponse({
             'success': True,
             'message': f"Added {qty} {product.name}(s) to your cart.",
-            'cart_count': sum(int(item.get("quantity", 0)) for item in request.session.get("cart", {}).values())
+            'cart_count': cart.count()
         })
     
     if request.GET.get("next") == "checkout":
@@ -227,10 +288,8 @@ def add_to_cart(request, product_id):
     return redirect("shop:view_cart")
 
 def remove_from_cart(request, product_id):
-    cart = request.session.get("cart", {})
-    if str(product_id) in cart:
-        del cart[str(product_id)]
-        request.session["cart"] = cart
+    cart = get_cart(request)
+    if cart.remove(product_id):
         messages.success(request, "Item removed from cart.")
         
     # Return JSON response for AJAX requests
@@ -238,7 +297,7 @@ def remove_from_cart(request, product_id):
         return JsonResponse({
             'success': True,
             'message': 'Item removed from cart.',
-            'cart_count': sum(int(item.get("quantity", 0)) for item in request.session.get("cart", {}).values())
+            'cart_count': cart.count()
         })
         
     return redirect("shop:view_cart")
@@ -251,14 +310,14 @@ def update_quantity(request, product_id):
     new_qty = _parse_qty(request, default=1)
     
     # Check stock availability
-    if new_qty > product.stock:
-        messages.error(request, f"Sorry, only {product.stock} items available in stock.")
+    available = reservations.available_to_sell([product.id], user=request.user).get(product.id, 0)
+    if new_qty > available:
+        messages.error(request, f"Sorry, only {available} items available in stock.")
         return redirect("shop:view_cart")
     
-    cart = request.session.get("cart", {})
-    if str(product_id) in cart:
-        cart[str(product_id)]["quantity"] = new_qty
-        request.session["cart"] = cart
+    cart = get_cart(request)
+    if cart.quantity(product_id):
+        cart.set(product_id, new_qty)
         messages.success(request, "Cart updated successfully.")
         
     # Return JSON response for AJAX requests  
@@ -266,7 +325,7 @@ def update_quantity(request, product_id):
         return JsonResponse({
             'success': True,
             'message': 'Cart updated successfully.',
-            'cart_count': sum(int(item.get("quantity", 0)) for item in request.session.get("cart", {}).values())
+            'cart_count': cart.count()
         })
         
     return redirect("shop:view_cart")
@@ -275,14 +334,13 @@ def buy_now(request, product_id):
     product = get_object_or_404(Product, id=product_id, available=True)
     qty = _parse_qty(request, default=1)
     
-    # Check stock availability
-    if product.stock < qty:
-        messages.error(request, f"Sorry, only {product.stock} items available in stock.")
+    # Check stock availability (units held by other shoppers' checkouts are not for sale)
+    available = reservations.available_to_sell([product.id], user=request.user).get(product.id, 0)
+    if available < qty:
+        messages.error(request, f"Sorry, only {available} items available in stock.")
         return redirect("products:product_detail", pk=product.id)
     
-    cart = request.session.get("cart", {})
-    cart[str(product_id)] = {"quantity": qty}  # Replace existing quantity for buy now
-    request.session["cart"] = cart
+    get_cart(request).set(product_id, qty)  # Replace existing quantity for buy now
     return redirect("shop:checkout")
 
 # -------------------------------
@@ -291,21 +349,10 @@ def buy_now(request, product_id):
 
 @login_required
 def checkout(request):
-    cart = request.session.get("cart", {})
-    if not cart:
+    cart = price_cart(get_cart(request).lines())
+    if not cart.lines:
         return redirect("shop:view_cart")
 
-    cart_items, total_price = [], 0
-    for product_id, item in cart.items():
-        try:
-            product = Product.objects.get(id=product_id)
-        except Product.DoesNotExist:
-            continue
-        qty = int(item.get("quantity", 1))
-        line_total = product.get_discounted_price() * qty
-        cart_items.append({"product": product, "quantity": qty, "total": line_total})
-        total_price += line_total
-
     # Load or create user's profile using the correct related_name
     profile, created = UserProfile.objects.get_or_create(user=request.user)
 
@@ -332,26 +379,42 @@ def checkout(request):
             profile.postal_code = postal_code
             profile.save()
 
-            # Razorpay integration
-            client = razorpay.Client(auth=(settings.RAZORPAY_KEY_ID, settings.RAZORPAY_KEY_SECRET))
-            razorpay_order = client.order.create({
-                "amount": int(total_price * 100),  # in paise
-                "currency": "INR",
-                "payment_capture": "1"
-            })
+            # Hold the stock before asking the gateway for an order
+            try:
+                hold = reservations.hold(request.user, cart.lines)
+            except reservations.InsufficientStock as exc:
+                return JsonResponse({"status": "error", "error": str(exc)}, status=409)
+
+            # Razorpay integration (pooled, timeout-bounded, behind a circuit breaker)
+            gateway = get_gateway()
+            try:
+                razorpay_order = gateway.create_order(cart.amount_paise, receipt=hold)
+            except GatewayRejected:
+                reservations.release(hold)
+                return JsonResponse(
+                    {"status": "error", "error": "The payment gateway could not start this payment."}, status=502
+                )
+            except GatewayError:
+                # Unavailable (circuit open) or a transport failure: worth retrying shortly.
+                reservations.release(hold)
+                return JsonResponse(
+                    {"status": "error", "error": "The payment gateway is unavailable; please try again shortly."},
+                    status=503,
+                )
+            reservations.rename(hold, razorpay_order["id"])
 
             return JsonResponse({
                 "razorpay_order_id": razorpay_order["id"],
-                "razorpay_key": settings.RAZORPAY_KEY_ID,
-                "razorpay_amount": int(total_price * 100)
+                "razorpay_key": gateway.key_id,
+                "razorpay_amount": cart.amount_paise
             })
 
         # fallback for non-JSON POST (form submit)
         # ... your existing form handling code ...
 
     return render(request, "shop/checkout.html", {
-        "cart_items": cart_items,
-        "total_price": total_price,
+        "cart_items": cart.lines,
+        "total_price": cart.total_price,
         "address": profile.address,
         "city": profile.city,
         "postal_code": profile.postal_code,
@@ -360,43 +423,6 @@ def checkout(request):
     })
 
 
-@csrf_exempt
-@login_required
-def payment_success(request):
-    if request.method == "POST":
-        data = json.loads(request.body)
-
-        razorpay_order_id = data.get("razorpay_order_id")
-        razorpay_payment_id = data.get("razorpay_payment_id")
-        razorpay_signature = data.get("razorpay_signature")
-
-        # ✅ Verify signature
-        generated_signature = hmac.new(
-            settings.RAZORPAY_SECRET.encode(),
-            f"{razorpay_order_id}|{razorpay_payment_id}".encode(),
-            hashlib.sha256
-        ).hexdigest()
-
-        if generated_signature != razorpay_signature:
-            return JsonResponse({"status": "failed", "message": "Signature mismatch"})
-
-        # ✅ Find order
-        try:
-            order = Order.objects.get(razorpay_order_id=razorpay_order_id, user=request.user)
-        except Order.DoesNotExist:
-            return JsonResponse({"status": "failed", "message": "Order not found"})
-
-        # ✅ Update order as paid
-        order.payment_status = "Paid"
-        order.payment_id = razorpay_payment_id
-        order.save()
-
-        return JsonResponse({
-            "status": "success",
-            "redirect_url": f"/orders/success/{order.id}/"
-        })
-
-    return JsonResponse({"status": "failed", "message": "Invalid request"}, status=400)
 # -------------------------------
 # Order Success
 # -------------------------------
@@ -480,6 +506,7 @@ def add_to_wishlist(request, product_id):
     if product_id not in wishlist:
         wishlist.append(product_id)
         request.session['wishlist'] = wishlist
+        counters.invalidate_session(request.session)
         messages.success(request, f"{product.name} added to your wishlist!")
     else:
         messages.info(request, f"{product.name} is already in your wishlist.")
@@ -502,6 +529,7 @@ def add_to_compare(request, product_id):
     if product_id not in compare_list:
         compare_list.append(product_id)
         request.session['compare'] = compare_list
+        counters.invalidate_session(request.session)
         messages.success(request, f"{product.name} added to comparison!")
     else:
         messages.info(request, f"{product.name} is already in comparison.")
@@ -514,64 +542,58 @@ def quick_order(request):
         if not product_codes:
             messages.error(request, "Please enter product codes.")
             return render(request, 'shop/quick_order.html')
-        cart = request.session.get("cart", {})
-        added_count = 0
-        for line in product_codes.split('\n'):
-            line = line.strip()
-            if ':' in line:
-                try:
-                    code, qty = line.split(':')
-                    product_id = int(code.strip())
-                    quantity = int(qty.strip())
-                    product = Product.objects.get(id=product_id, available=True)
-                    if product.stock >= quantity:
-                        cart[str(product_id)] = {"quantity": quantity}
-                        added_count += 1
-                    else:
-                        messages.warning(request, f"Product {product.name} has insufficient stock.")
-                except (ValueError, Product.DoesNotExist):
-                    messages.warning(request, f"Invalid product code: {line}")
-        if added_count > 0:
-            request.session["cart"] = cart
-            messages.success(request, f"{added_count} products added to cart.")
+        report = bulk_orders.add_to_cart(
+            bulk_orders.check_lines(bulk_orders.quick_order_rows(product_codes)), get_cart(request)
+        )
+        if report.added and not report.rejected:
+            messages.success(request, f"{report.added} products added to cart.")
             return redirect('shop:view_cart')
+        if report.added:
+            messages.success(request, f"{report.added} products added to cart.")
         else:
             messages.error(request, "No valid products were added.")
+        return render(request, 'shop/quick_order.html', {"report": report, "product_codes": product_codes})
     return render(request, 'shop/quick_order.html')
 
 @login_required
 def bulk_order(request):
     if request.method == 'POST':
         csv_file = request.FILES.get('bulk_file')
-        if csv_file:
-            try:
-                import csv
-                import io
-                file_data = csv_file.read().decode('utf-8')
-                csv_data = csv.reader(io.StringIO(file_data))
-                cart = request.session.get("cart", {})
-                added_count = 0
-                for row in csv_data:
-                    if len(row) >= 2:
-                        try:
-                            product_id = int(row[0])
-                            quantity = int(row[1])
-                            product = Product.objects.get(id=product_id, available=True)
-                            if product.stock >= quantity:
-                                cart[str(product_id)] = {"quantity": quantity}
-                                added_count += 1
-                        except (ValueError, Product.DoesNotExist):
-                            continue
-                if added_count > 0:
-                    request.session["cart"] = cart
-                    messages.success(request, f"{added_count} products added from bulk order.")
-                    return redirect('shop:view_cart')
-                else:
-                    messages.error(request, "No valid products found in the file.")
-            except Exception:
-                messages.error(request, "Error processing file. Please check the format.")
+        if not csv_file:
+            messages.error(request, "Please choose a CSV file to upload.")
+            return render(request, 'shop/bulk_order.html')
+        if csv_file.size > bulk_orders.BACKGROUND_BYTES:
+            job = bulk_orders.start_job(request.user, csv_file)
+            return render(request, 'shop/bulk_order.html', {"job": job})
+        try:
+            report = bulk_orders.add_to_cart(bulk_orders.check_lines(bulk_orders.csv_rows(csv_file)), get_cart(request))
+        except (UnicodeDecodeError, csv.Error):
+            messages.error(request, "Error processing file. Please check the format.")
+            return render(request, 'shop/bulk_order.html')
+        if report.added and not report.rejected:
+            messages.success(request, f"{report.added} products added from bulk order.")
+            return redirect('shop:view_cart')
+        if report.added:
+            messages.success(request, f"{report.added} products added from bulk order.")
+        else:
+            messages.error(request, "No valid products found in the file.")
+        return render(request, 'shop/bulk_order.html', {"report": report})
     return render(request, 'shop/bulk_order.html')
 
+@login_required
+def bulk_order_job(request, job_id):
+    """Progress of a background bulk order, polled by the bulk order page"""
+    job = get_object_or_404(BulkOrderJob, pk=job_id, user=request.user)
+    return JsonResponse({
+        "status": job.status,
+        "total_lines": job.total_lines,
+        "processed_lines": job.processed_lines,
+        "added": job.added,
+        "rejected": job.rejected,
+        "report": job.report,
+        "error": job.error,
+    })
+
 @login_required(login_url="users:login")
 def orders_list(request):
     orders = Order.objects.filter(user=request.user).order_by("-created_at")
@@ -595,6 +617,7 @@ def remove_from_wishlist(request, product_id):
     if product_id in wishlist:
         wishlist.remove(product_id)
         request.session['wishlist'] = wishlist
+        counters.invalidate_session(request.session)
     return JsonResponse({"success": True, "wishlist_count": len(wishlist)})
 
 # Admin helper views for CSV downloads
@@ -680,6 +703,7 @@ def add_to_wishlist(request, product_id):
     if product_id not in wishlist:
         wishlist.append(product_id)
         request.session['wishlist'] = wishlist
+        counters.invalidate_session(request.session)
         messages.success(request, f"{product.name} added to your wishlist!")
     else:
         messages.info(request, f"{product.name} is already in your wishlist.")
@@ -698,6 +722,7 @@ def remove_from_wishlist(request, product_id):
     if product_id in wishlist:
         wishlist.remove(product_id)
         request.session['wishlist'] = wishlist
+        counters.invalidate_session(request.session)
 
     if request.headers.get('X-Requested-With') == 'XMLHttpRequest':
         return JsonResponse({"success": True, "wishlist_count": len(wishlist)})